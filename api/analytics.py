@@ -0,0 +1,189 @@
+"""
+Dashboard aggregates over cases, served from the CaseDailyRollup table.
+
+`refresh_rollups()` rebuilds only the (day, owner) buckets touched since the
+last refresh: cases whose `updated_at` is past the newest rollup, plus
+buckets flagged `stale` when a case was deleted or moved to another owner
+(api/signals.py). It runs from `python manage.py refresh_case_rollups`
+(cron, or `--loop`), never inside a request. Updates made with
+`QuerySet.update()` do not bump `updated_at`; run
+`python manage.py refresh_case_rollups --full` after such bulk edits.
+"""
+from datetime import datetime, time, timedelta
+
+from django.db import connection, transaction
+from django.db.models import Count, F, FloatField, Max, Q, Sum
+from django.db.models.functions import Coalesce, TruncDate, TruncMonth, TruncWeek
+from django.utils import timezone
+from django.utils.dateparse import parse_date
+from rest_framework import serializers
+
+from .models import Case, CaseDailyRollup
+
+# Cases committed slightly out of `updated_at` order are still picked up
+REFRESH_OVERLAP = timedelta(minutes=5)
+BUCKETS = {'day': None, 'week': TruncWeek, 'month': TruncMonth}
+_ADVISORY_LOCK_ID = 0x7061746F  # any constant shared by all workers
+
+
+def _bucket_rows(cases):
+    return (
+        cases.annotate(day=TruncDate('created_at'))
+        .values('day', 'created_by_id', 'status')
+        .annotate(
+            case_count=Count('id'),
+            malignant_count=Count('id', filter=Q(is_malignant=True)),
+            confidence_sum=Coalesce(Sum('confidence_score'), 0.0, output_field=FloatField()),
+            confidence_count=Count('confidence_score'),
+            max_updated_at=Max('updated_at'),
+        )
+        .order_by()
+    )
+
+
+def _insert(rows):
+    batch = []
+    created = 0
+    for row in rows:
+        row['user_id'] = row.pop('created_by_id')
+        batch.append(CaseDailyRollup(**row))
+        if len(batch) == 1000:
+            created += len(CaseDailyRollup.objects.bulk_create(batch))
+            batch = []
+    created += len(CaseDailyRollup.objects.bulk_create(batch))
+    return created
+
+
+def _day_range(day):
+    start = timezone.make_aware(datetime.combine(day, time.min))
+    return start, timezone.make_aware(datetime.combine(day + timedelta(days=1), time.min))
+
+
+def _rebuild(buckets):
+    by_day = {}
+    for day, user_id in buckets:
+        by_day.setdefault(day, set()).add(user_id)
+
+    cases = Q()
+    rollups = Q()
+    for day, user_ids in by_day.items():
+        start, end = _day_range(day)
+        owners = Q(created_by_id__in=[u for u in user_ids if u is not None])
+        if None in user_ids:
+            owners |= Q(created_by__isnull=True)
+        cases |= Q(created_at__gte=start, created_at__lt=end) & owners
+        rollup_owners = Q(user_id__in=[u for u in user_ids if u is not None])
+        if None in user_ids:
+            rollup_owners |= Q(user__isnull=True)
+        rollups |= Q(day=day) & rollup_owners
+
+    CaseDailyRollup.objects.filter(rollups).delete()
+    return _insert(_bucket_rows(Case.objects.filter(cases)).iterator())
+
+
+def refresh_rollups(full=False, chunk_size=200):
+    """
+    Bring CaseDailyRollup up to date; returns the number of rollup rows
+    written. A full rebuild happens on request or when the table is empty.
+    """
+    with transaction.atomic():
+        if connection.vendor == 'postgresql':
+            with connection.cursor() as cursor:
+                cursor.execute('SELECT pg_advisory_xact_lock(%s)', [_ADVISORY_LOCK_ID])
+
+        watermark = CaseDailyRollup.objects.aggregate(latest=Max('max_updated_at'))['latest']
+        if full or watermark is None:
+            CaseDailyRollup.objects.all().delete()
+            return _insert(_bucket_rows(Case.objects.all()).iterator())
+
+        changed = (
+            Case.objects.filter(updated_at__gte=watermark - REFRESH_OVERLAP)
+            .annotate(day=TruncDate('created_at'))
+            .values_list('day', 'created_by_id')
+            .distinct()
+            .order_by()
+        )
+        buckets = set(changed)
+        buckets.update(CaseDailyRollup.objects.filter(stale=True).values_list('day', 'user_id').distinct())
+        buckets = sorted(buckets, key=lambda b: (b[0], b[1] or 0))
+        return sum(_rebuild(buckets[i:i + chunk_size]) for i in range(0, len(buckets), chunk_size))
+
+
+def mark_stale(case):
+    mark_bucket_stale(case.created_at, case.created_by_id)
+
+
+def mark_bucket_stale(created_at, user_id):
+    """Flag the (creation day, owner) bucket for the next refresh."""
+    if created_at is None:
+        return
+    day = timezone.localtime(created_at).date()
+    CaseDailyRollup.objects.filter(day=day, user_id=user_id).update(stale=True)
+
+
+def _parse_day(value, name):
+    day = parse_date(value)
+    if day is None:
+        raise serializers.ValidationError({name: 'Expected an ISO 8601 date (YYYY-MM-DD)'})
+    return day
+
+
+def filter_rollups(params):
+    """
+    Rollups narrowed by query params: `from` / `to` (inclusive creation
+    dates), `user` (owner id) and `status` (comma separated).
+    """
+    rollups = CaseDailyRollup.objects.all()
+    if params.get('from'):
+        rollups = rollups.filter(day__gte=_parse_day(params['from'], 'from'))
+    if params.get('to'):
+        rollups = rollups.filter(day__lte=_parse_day(params['to'], 'to'))
+    if params.get('user'):
+        try:
+            rollups = rollups.filter(user_id=int(params['user']))
+        except ValueError:
+            raise serializers.ValidationError({'user': 'Expected a user id'})
+    if params.get('status'):
+        rollups = rollups.filter(status__in=[s.strip().upper() for s in params['status'].split(',')])
+    return rollups
+
+
+_TOTALS = {
+    'cases': Coalesce(Sum('case_count'), 0),
+    'malignant': Coalesce(Sum('malignant_count'), 0),
+    'confidence_sum': Coalesce(Sum('confidence_sum'), 0.0, output_field=FloatField()),
+    'confidence_count': Coalesce(Sum('confidence_count'), 0),
+}
+
+
+def _finish(row):
+    confidence_sum = row.pop('confidence_sum')
+    confidence_count = row.pop('confidence_count')
+    row['malignant_rate'] = row['malignant'] / row['cases'] if row['cases'] else None
+    row['average_confidence'] = confidence_sum / confidence_count if confidence_count else None
+    return row
+
+
+def summary(rollups):
+    totals = _finish(rollups.aggregate(**_TOTALS))
+    by_status = dict(
+        rollups.values('status').annotate(cases=Sum('case_count')).order_by().values_list('status', 'cases'))
+    totals['by_status'] = {status: by_status.get(status, 0) for status, _ in Case.STATUS_CHOICES}
+    return totals
+
+
+def timeseries(rollups, bucket='day'):
+    if bucket not in BUCKETS:
+        raise serializers.ValidationError({'bucket': f"Expected one of {', '.join(BUCKETS)}"})
+    trunc = BUCKETS[bucket]
+    rollups = rollups.annotate(period=trunc('day') if trunc else F('day'))
+    rows = rollups.values('period').annotate(**_TOTALS).order_by('period')
+    return [_finish({'period': row.pop('period').isoformat(), **row}) for row in rows]
+
+
+def by_user(rollups):
+    rows = rollups.values('user_id', 'user__username').annotate(**_TOTALS).order_by('user_id')
+    return [
+        _finish({'user_id': row.pop('user_id'), 'username': row.pop('user__username'), **row})
+        for row in rows
+    ]
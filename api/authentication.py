@@ -0,0 +1,165 @@
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+from django.conf import settings
+from django.contrib.auth import authenticate, get_user_model
+from django.db import close_old_connections
+from rest_framework.exceptions import Throttled
+from rest_framework_simplejwt.authentication import JWTAuthentication
+from rest_framework_simplejwt.exceptions import AuthenticationFailed, InvalidToken
+from rest_framework_simplejwt.settings import api_settings as jwt_settings
+from rest_framework_simplejwt.tokens import RefreshToken
+
+from .profiling import phase
+
+
+def token_for_user(user):
+    """Refresh token for `user`; `role` is informational for clients, the API reads it from the row."""
+    refresh = RefreshToken.for_user(user)
+    refresh['role'] = user.role
+    return refresh
+
+
+class UserCache:
+    """
+    Small per-process TTL cache of full User rows for ClaimsUser.load().
+
+    Entries are dropped on User post_save (api/signals.py); other worker
+    processes see changes once `ttl` seconds have passed.
+    """
+
+    def __init__(self, ttl, max_entries=10000):
+        self.ttl = ttl
+        self.max_entries = max_entries
+        self._entries = {}
+        self._lock = threading.Lock()
+
+    def get(self, user_id):
+        entry = self._entries.get(user_id)
+        if entry is None or entry[0] < time.monotonic():
+            return None
+        return entry[1]
+
+    def set(self, user_id, user):
+        with self._lock:
+            if len(self._entries) >= self.max_entries:
+                self._evict()
+            self._entries[user_id] = (time.monotonic() + self.ttl, user)
+
+    def delete(self, user_id):
+        with self._lock:
+            self._entries.pop(user_id, None)
+
+    def clear(self):
+        with self._lock:
+            self._entries.clear()
+
+    def _evict(self):
+        now = time.monotonic()
+        for key in [key for key, (expires, _) in self._entries.items() if expires < now]:
+            del self._entries[key]
+        if len(self._entries) >= self.max_entries:
+            self._entries.clear()
+
+
+user_cache = UserCache(ttl=settings.JWT_USER_CACHE_TTL)
+
+
+class ClaimsUser:
+    """
+    Authenticated user for the id in a token.
+
+    `id`/`pk` come from the signed token; every other attribute (`role`,
+    `is_active`, ...) is read from the full model, loaded through `user_cache`.
+    Use `load()` where a real model instance is required, e.g. as a
+    serializer instance.
+    """
+    is_authenticated = True
+    is_anonymous = False
+
+    def __init__(self, token):
+        self.id = self.pk = int(token[jwt_settings.USER_ID_CLAIM])
+        self._user = None
+
+    def load(self):
+        if self._user is None:
+            user = user_cache.get(self.id)
+            if user is None:
+                try:
+                    user = get_user_model().objects.get(pk=self.id)
+                except get_user_model().DoesNotExist:
+                    raise AuthenticationFailed('User not found', code='user_not_found')
+                user_cache.set(self.id, user)
+            self._user = user
+        return self._user
+
+    def __getattr__(self, name):
+        if name.startswith('__') or name == '_user':
+            raise AttributeError(name)
+        return getattr(self.load(), name)
+
+    def __eq__(self, other):
+        return getattr(other, 'pk', None) == self.pk and getattr(other, 'is_authenticated', False)
+
+    def __hash__(self):
+        return hash(self.pk)
+
+    def __str__(self):
+        return f'ClaimsUser {self.pk}'
+
+
+class StatelessJWTAuthentication(JWTAuthentication):
+    """
+    JWTAuthentication without the per-request `SELECT` on the users table.
+
+    The user row comes from `user_cache`, so each process loads it at most
+    once per `JWT_USER_CACHE_TTL` seconds. Deleted or deactivated users, and
+    role changes, therefore take effect within that TTL however long the
+    token itself stays valid.
+    """
+
+    def authenticate(self, request):
+        with phase('auth'):
+            return super().authenticate(request)
+
+    def get_user(self, validated_token):
+        if jwt_settings.USER_ID_CLAIM not in validated_token:
+            raise InvalidToken('Token contained no recognizable user identification')
+        user = ClaimsUser(validated_token)
+        if not user.load().is_active:
+            raise AuthenticationFailed('User is inactive', code='user_inactive')
+        return user
+
+
+# Logins (authenticate(), i.e. password hashing) run on this pool. Hashers
+# release the GIL, so other requests keep being served while it works; the
+# semaphore caps hashing plus queued logins so a burst is turned away instead
+# of piling up.
+_hash_pool = ThreadPoolExecutor(max_workers=settings.LOGIN_HASH_WORKERS, thread_name_prefix='login-hash')
+_hash_slots = threading.BoundedSemaphore(settings.LOGIN_HASH_WORKERS * 2)
+
+
+def _authenticate(request, credentials):
+    # Pool threads keep their own database connections; recycle them around
+    # each login the way request_started/request_finished do for requests
+    close_old_connections()
+    try:
+        return authenticate(request, **credentials)
+    finally:
+        close_old_connections()
+
+
+def authenticate_bounded(request, **credentials):
+    """
+    django.contrib.auth.authenticate() on the bounded hashing pool, so every
+    AUTHENTICATION_BACKENDS entry, the user_login_failed signal, inactive-user
+    checks and hash upgrades apply as usual. Raises Throttled when no slot
+    frees up within LOGIN_HASH_QUEUE_TIMEOUT.
+    """
+    if not _hash_slots.acquire(timeout=settings.LOGIN_HASH_QUEUE_TIMEOUT):
+        raise Throttled(detail='Too many concurrent logins, please retry shortly.')
+    try:
+        return _hash_pool.submit(_authenticate, request, credentials).result()
+    finally:
+        _hash_slots.release()
@@ -0,0 +1,156 @@
+"""
+Helpers shared by the benchmark management commands.
+"""
+import json
+import statistics
+import threading
+import time
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+from django.core.handlers.wsgi import WSGIHandler
+from django.test.client import FakePayload, RequestFactory
+
+
+class WSGIClient:
+    """
+    Sends requests through a real WSGIHandler, so request_started and
+    request_finished fire as under a WSGI server (the test Client suppresses
+    the connection cleanup that CONN_MAX_AGE relies on).
+    """
+    handler = None
+
+    def __init__(self, **headers):
+        if WSGIClient.handler is None:
+            WSGIClient.handler = WSGIHandler()
+        self.headers = headers
+
+    def request(self, method, path, body=b'', content_type='application/json', **headers):
+        path, _, query = path.partition('?')
+        if not isinstance(body, bytes):
+            body = json.dumps(body).encode('utf-8')
+        environ = RequestFactory()._base_environ(
+            REQUEST_METHOD=method, PATH_INFO=path, QUERY_STRING=query,
+            CONTENT_TYPE=content_type, CONTENT_LENGTH=str(len(body)),
+            **{'wsgi.input': FakePayload(body)}, **self.headers, **headers)
+        started = []
+        chunks = self.handler(environ, lambda status, response_headers, exc_info=None: started.append(
+            (int(status.split()[0]), dict(response_headers))))
+        try:
+            content = b''.join(chunks)
+        finally:
+            chunks.close()  # sends request_finished
+        status, response_headers = started[0]
+        return status, response_headers, content
+
+    def get(self, path, **headers):
+        return self.request('GET', path, **headers)
+
+    def post(self, path, body=b'', **headers):
+        return self.request('POST', path, body, **headers)
+
+
+def run_load(call, threads=1, duration=None, requests=None, warmup=5):
+    """
+    Call `call(worker_index, iteration)` from `threads` threads until
+    `duration` seconds pass or `requests` calls were made in total. `call`
+    returns (ok, db_queries or None). Returns latency/throughput statistics.
+    """
+    lock = threading.Lock()
+    latencies, failures, queries = [], [0], []
+    remaining = [requests]
+    stop = time.monotonic() + duration if duration else None
+
+    def claim():
+        if stop is not None:
+            return time.monotonic() < stop
+        with lock:
+            if remaining[0] <= 0:
+                return False
+            remaining[0] -= 1
+            return True
+
+    def worker(n):
+        for i in range(warmup):
+            call(n, -1 - i)
+        local, local_queries, failed, i = [], [], 0, 0
+        barrier.wait()
+        while claim():
+            start = time.perf_counter()
+            ok, count = call(n, i)
+            local.append(time.perf_counter() - start)
+            failed += not ok
+            if count is not None:
+                local_queries.append(count)
+            i += 1
+        with lock:
+            latencies.extend(local)
+            queries.extend(local_queries)
+            failures[0] += failed
+
+    barrier = threading.Barrier(threads + 1)
+    pool = [threading.Thread(target=worker, args=(n,)) for n in range(threads)]
+    for thread in pool:
+        thread.start()
+    barrier.wait()
+    started = time.perf_counter()
+    for thread in pool:
+        thread.join()
+    elapsed = time.perf_counter() - started
+    return summarize(latencies, elapsed, failures[0], queries)
+
+
+def summarize(latencies, elapsed, failures=0, queries=()):
+    latencies = sorted(latencies)
+    if not latencies:
+        return {'requests': 0, 'errors': failures}
+
+    def pct(p):
+        return round(latencies[min(int(len(latencies) * p), len(latencies) - 1)] * 1000, 3)
+    return {
+        'requests': len(latencies),
+        'errors': failures,
+        'rps': round(len(latencies) / elapsed, 1),
+        'mean_ms': round(statistics.fmean(latencies) * 1000, 3),
+        'p50_ms': pct(0.50),
+        'p95_ms': pct(0.95),
+        'p99_ms': pct(0.99),
+        'max_ms': round(latencies[-1] * 1000, 3),
+        'db_queries': round(statistics.fmean(queries), 2) if queries else None,
+    }
+
+
+class MLServiceStub:
+    """
+    Local stand-in for the Flask ML service's POST /predict, answering with
+    the same fields after `latency` seconds. Use as a context manager; `url`
+    is what ML_SERVICE_URL should point at.
+    """
+
+    def __init__(self, latency=0.02):
+        latency_ = latency
+
+        class Handler(BaseHTTPRequestHandler):
+            def do_POST(self):
+                self.rfile.read(int(self.headers.get('Content-Length') or 0))
+                time.sleep(latency_)
+                body = json.dumps({'prediction': 1, 'confidence': 0.91, 'class_name': 'Malignant',
+                                   'benign_prob': 0.09, 'malignant_prob': 0.91}).encode()
+                self.send_response(200)
+                self.send_header('Content-Type', 'application/json')
+                self.send_header('Content-Length', str(len(body)))
+                self.end_headers()
+                self.wfile.write(body)
+
+            def log_message(self, *args):
+                pass
+
+        self.server = ThreadingHTTPServer(('127.0.0.1', 0), Handler)
+        self.url = f'http://127.0.0.1:{self.server.server_port}'
+
+    def __enter__(self):
+        threading.Thread(target=self.server.serve_forever, daemon=True).start()
+        return self
+
+    def __exit__(self, *exc):
+        self.server.shutdown()
+        self.server.server_close()
@@ -0,0 +1,58 @@
+import hashlib
+import json
+
+from django.conf import settings
+from django.core.cache import cache
+from django.utils.http import parse_etags, quote_etag
+from rest_framework import status
+from rest_framework.response import Response
+from rest_framework.utils.encoders import JSONEncoder
+
+
+def response_cache_key(kind, pk):
+    return f'api:response:{kind}:{pk}'
+
+
+def compute_etag(data):
+    payload = json.dumps(data, cls=JSONEncoder, sort_keys=True, separators=(',', ':'))
+    return quote_etag(hashlib.md5(payload.encode('utf-8')).hexdigest())
+
+
+def etag_matches(request, etag):
+    header = request.META.get('HTTP_IF_NONE_MATCH')
+    if not header:
+        return False
+    candidates = parse_etags(header)
+    if '*' in candidates:
+        return True
+    # Weak comparison (RFC 9110 8.8.3.2) is what If-None-Match uses
+    return any(tag.removeprefix('W/') == etag for tag in candidates)
+
+
+def cached_response(request, kind, pk, build):
+    """
+    Read-through cache for single-object GET responses.
+
+    `build` is only called on a miss; its serialized output is stored together
+    with an ETag so repeat requests carrying If-None-Match get a bodyless 304.
+    Entries are dropped by the post_save/post_delete handlers in api/signals.py.
+    """
+    key = response_cache_key(kind, pk)
+    entry = cache.get(key)
+    if entry is None:
+        data = build()
+        entry = (compute_etag(data), data)
+        cache.set(key, entry, settings.RESPONSE_CACHE_TIMEOUT)
+    etag, data = entry
+
+    if etag_matches(request, etag):
+        response = Response(status=status.HTTP_304_NOT_MODIFIED)
+    else:
+        response = Response(data)
+    response['ETag'] = etag
+    response['Cache-Control'] = 'private, no-cache'
+    return response
+
+
+def invalidate(kind, pk):
+    cache.delete(response_cache_key(kind, pk))
@@ -0,0 +1,109 @@
+from urllib.parse import parse_qs
+
+from asgiref.sync import async_to_sync
+from channels.db import database_sync_to_async
+from channels.generic.websocket import AsyncJsonWebsocketConsumer
+from channels.layers import get_channel_layer
+from channels.middleware import BaseMiddleware
+from django.contrib.auth.models import AnonymousUser
+from rest_framework_simplejwt.authentication import JWTAuthentication
+from rest_framework_simplejwt.exceptions import AuthenticationFailed, InvalidToken
+
+from .permissions import visible_cases
+
+
+def user_group(user_id):
+    return f'user_{user_id}'
+
+
+def case_group(case_id):
+    return f'case_{case_id}'
+
+
+def broadcast(group, payload):
+    """Send `payload` to every socket in `group`; a no-op without a channel layer."""
+    channel_layer = get_channel_layer()
+    if channel_layer is None:
+        return
+    async_to_sync(channel_layer.group_send)(group, {'type': 'push', 'payload': payload})
+
+
+class JWTAuthMiddleware(BaseMiddleware):
+    """
+    Authenticates WebSocket handshakes with the same SimpleJWT access tokens
+    the REST API uses, read from `Authorization: Bearer <token>` or `?token=`.
+    """
+
+    async def __call__(self, scope, receive, send):
+        scope['user'] = await self.get_user(scope)
+        return await super().__call__(scope, receive, send)
+
+    @database_sync_to_async
+    def get_user(self, scope):
+        auth = JWTAuthentication()
+        raw_token = parse_qs(scope.get('query_string', b'').decode()).get('token', [None])[0]
+        if raw_token is None:
+            header = dict(scope.get('headers', [])).get(b'authorization')
+            if header is not None:
+                raw_token = auth.get_raw_token(header)
+        if not raw_token:
+            return AnonymousUser()
+        try:
+            return auth.get_user(auth.get_validated_token(raw_token))
+        except (InvalidToken, AuthenticationFailed):
+            return AnonymousUser()
+
+
+class UpdatesConsumer(AsyncJsonWebsocketConsumer):
+    """
+    Pushes new messages and case status changes to the connected user.
+
+    Every socket joins its user's group; clients may also send
+    `{"action": "subscribe", "case": <id>}` / `"unsubscribe"` to follow
+    status changes of other cases they are allowed to read.
+    """
+
+    async def connect(self):
+        user = self.scope.get('user')
+        if user is None or not user.is_authenticated:
+            await self.close(code=4401)
+            return
+        self.groups = [user_group(user.id)]
+        await self.channel_layer.group_add(self.groups[0], self.channel_name)
+        await self.accept()
+
+    async def disconnect(self, code):
+        for group in getattr(self, 'groups', []):
+            await self.channel_layer.group_discard(group, self.channel_name)
+
+    async def receive_json(self, content, **kwargs):
+        if not isinstance(content, dict):
+            await self.send_json({'type': 'error', 'error': 'expected a JSON object'})
+            return
+        action = content.get('action')
+        try:
+            case_id = int(content.get('case'))
+        except (TypeError, ValueError):
+            await self.send_json({'type': 'error', 'error': 'case must be an id'})
+            return
+        group = case_group(case_id)
+        if action == 'subscribe' and group not in self.groups:
+            if not await self.can_view_case(case_id):
+                await self.send_json({'type': 'error', 'error': 'case not found', 'case': case_id})
+                return
+            self.groups.append(group)
+            await self.channel_layer.group_add(group, self.channel_name)
+        elif action == 'unsubscribe' and group in self.groups:
+            self.groups.remove(group)
+            await self.channel_layer.group_discard(group, self.channel_name)
+        else:
+            return
+        await self.send_json({'type': f'{action}d', 'case': content.get('case')})
+
+    @database_sync_to_async
+    def can_view_case(self, case_id):
+        # Same rule as GET /api/cases/<id>/
+        return visible_cases(self.scope['user']).filter(pk=case_id).exists()
+
+    async def push(self, event):
+        await self.send_json(event['payload'])
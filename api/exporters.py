@@ -0,0 +1,171 @@
+"""
+Streaming export of cases as CSV, NDJSON or Parquet.
+
+Rows come from a server-side cursor (`QuerySet.iterator`) and are encoded in
+chunks straight into a StreamingHttpResponse, so memory use does not depend
+on how many cases are exported.
+"""
+import csv
+import json
+from datetime import datetime, time
+
+from django.utils import timezone
+from django.utils.dateparse import parse_date, parse_datetime
+from rest_framework import serializers
+
+from .fast_serializers import CaseValuesSerializer
+
+FORMATS = ('csv', 'ndjson', 'parquet')
+CONTENT_TYPES = {
+    'csv': 'text/csv; charset=utf-8',
+    'ndjson': 'application/x-ndjson',
+    'parquet': 'application/vnd.apache.parquet',
+}
+CHUNK_SIZE = 2000
+
+case_rows = CaseValuesSerializer()
+
+
+def _parse_bound(value, name, end_of_day=False):
+    parsed = parse_datetime(value)
+    if parsed is None:
+        day = parse_date(value)
+        if day is None:
+            raise serializers.ValidationError({name: 'Expected an ISO 8601 date or datetime'})
+        parsed = datetime.combine(day, time.max if end_of_day else time.min)
+    if timezone.is_naive(parsed):
+        parsed = timezone.make_aware(parsed)
+    return parsed
+
+
+def filter_cases(queryset, params):
+    """
+    Apply export filters from query params:
+    `status` (comma separated), `created_after` / `created_before` (ISO date
+    or datetime, inclusive) and `is_malignant` (true/false).
+    """
+    if params.get('status'):
+        queryset = queryset.filter(status__in=[s.strip().upper() for s in params['status'].split(',')])
+    if params.get('created_after'):
+        queryset = queryset.filter(created_at__gte=_parse_bound(params['created_after'], 'created_after'))
+    if params.get('created_before'):
+        queryset = queryset.filter(
+            created_at__lte=_parse_bound(params['created_before'], 'created_before', end_of_day=True))
+    if params.get('is_malignant'):
+        value = params['is_malignant'].lower()
+        if value not in ('true', 'false', '1', '0'):
+            raise serializers.ValidationError({'is_malignant': 'Expected true or false'})
+        queryset = queryset.filter(is_malignant=value in ('true', '1'))
+    return queryset
+
+
+def _chunks(queryset):
+    rows = case_rows.values(queryset).iterator(chunk_size=CHUNK_SIZE)
+    chunk = []
+    for row in rows:
+        chunk.append(row)
+        if len(chunk) == CHUNK_SIZE:
+            yield chunk
+            chunk = []
+    if chunk:
+        yield chunk
+
+
+class _Sink:
+    """
+    Write-only file object that is drained after every chunk. `tell()` keeps
+    counting across drains, which the Parquet writer relies on for offsets.
+    """
+
+    def __init__(self):
+        self.parts = []
+        self.position = 0
+        self.closed = False
+
+    def write(self, data):
+        self.parts.append(data)
+        self.position += len(data)
+        return len(data)
+
+    def tell(self):
+        return self.position
+
+    def flush(self):
+        pass
+
+    def close(self):
+        self.closed = True
+
+    def drain(self, empty=''):
+        value = empty.join(self.parts)
+        self.parts.clear()
+        return value
+
+
+def stream_csv(queryset):
+    names = [name for name, *_ in case_rows.plan]
+    sink = _Sink()
+    writer = csv.writer(sink)
+    writer.writerow(names)
+    yield sink.drain()
+    for chunk in _chunks(queryset):
+        plan = case_rows.bind()
+        for row in chunk:
+            data = case_rows.to_representation(row, plan)
+            writer.writerow(data.values())
+        yield sink.drain()
+
+
+def stream_ndjson(queryset):
+    for chunk in _chunks(queryset):
+        plan = case_rows.bind()
+        yield ''.join(
+            json.dumps(case_rows.to_representation(row, plan), separators=(',', ':')) + '\n'
+            for row in chunk
+        )
+
+
+def parquet_available():
+    try:
+        import pyarrow  # noqa: F401
+    except ImportError:
+        return False
+    return True
+
+
+def stream_parquet(queryset):
+    """One Parquet row group per chunk; timestamps stay typed (UTC, microseconds)."""
+    import pyarrow as pa
+    import pyarrow.parquet as pq
+
+    from .models import Case
+
+    types = {
+        'AutoField': pa.int64(), 'BigAutoField': pa.int64(), 'IntegerField': pa.int64(),
+        'FloatField': pa.float64(), 'BooleanField': pa.bool_(),
+        'DateTimeField': pa.timestamp('us', tz='UTC'),
+    }
+    columns = [(name, source) for name, source, *_ in case_rows.plan]
+
+    def arrow_type(source):
+        field = Case._meta.get_field(source)
+        if field.is_relation:
+            field = field.target_field
+        return types.get(field.get_internal_type(), pa.string())
+
+    schema = pa.schema([(name, arrow_type(source)) for name, source in columns])
+
+    sink = _Sink()
+    with pq.ParquetWriter(pa.PythonFile(sink, mode='w'), schema, compression='zstd') as writer:
+        for chunk in _chunks(queryset):
+            arrays = {name: [row[source] for row in chunk] for name, source in columns}
+            writer.write_table(pa.Table.from_pydict(arrays, schema=schema))
+            yield sink.drain(b'')
+    yield sink.drain(b'')
+
+
+STREAMERS = {
+    'csv': stream_csv,
+    'ndjson': stream_ndjson,
+    'parquet': stream_parquet,
+}
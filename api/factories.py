@@ -0,0 +1,147 @@
+"""
+Synthetic data for benchmarks (`manage.py seed_benchdata`, `manage.py bench_api`).
+
+Everything is created with bulk_create under a `bench-` prefix, so seeding
+tops up an existing dataset instead of duplicating it and never touches real
+accounts. Rows are drawn from RNGs seeded per block of BLOCK rows, so row i
+depends only on the RNG seed, i and the number of bench users: topping up to
+N rows yields the same rows as seeding N from scratch with the same --users.
+Message volume is skewed so that a few users have very large inboxes, like in
+production.
+"""
+import random
+
+from django.contrib.auth.hashers import make_password
+from django.db import transaction
+from django.utils import timezone
+
+from . import cache
+from .models import Case, Conversation, Message, User
+
+PREFIX = 'bench'
+PASSWORD = 'bench-password'
+BLOCK = 1000
+# The fields bench_api's analyze scenario writes
+RESET_FIELDS = ['status', 'is_malignant', 'confidence_score']
+ROLES = ['PATHOLOGIST', 'STUDENT', 'PATHOLOGIST', 'ADMIN']
+TITLES = ['Breast biopsy', 'Skin lesion', 'Colon polyp', 'Lymph node', 'Thyroid nodule', 'Prostate core']
+DIAGNOSES = ['Invasive ductal carcinoma', 'Fibroadenoma', 'Benign nevus', 'Adenocarcinoma',
+             'Tubular adenoma', 'Reactive hyperplasia', None]
+WORDS = ('please review slide stain margin tumor benign malignant follow up biopsy report '
+         'urgent thanks image zoom region cells nuclei mitotic count grade').split()
+
+
+def bench_users():
+    return User.objects.filter(username__startswith=f'{PREFIX}-')
+
+
+def _batches(items, size):
+    batch = []
+    for item in items:
+        batch.append(item)
+        if len(batch) == size:
+            yield batch
+            batch = []
+    if batch:
+        yield batch
+
+
+def _rows(make_row, kind, start, stop, rng_seed):
+    """make_row(rng, i) for i in [start, stop), each block of BLOCK rows from its own seeded RNG."""
+    for block in range(start // BLOCK, (stop + BLOCK - 1) // BLOCK):
+        rng = random.Random(f'{rng_seed}-{kind}-{block}')
+        for i in range(block * BLOCK, min((block + 1) * BLOCK, stop)):
+            row = make_row(rng, i)  # rows before `start` are drawn too, to replay the RNG
+            if i >= start:
+                yield row
+
+
+def _case_maker(user_ids):
+    def make_case(rng, i):
+        status = rng.choice(['PENDING', 'ANALYZED', 'VALIDATED'])
+        return Case(
+            case_id=f'{PREFIX.upper()}-{i:07d}', title=f'{rng.choice(TITLES)} #{i}',
+            description=' '.join(rng.choices(WORDS, k=12)),
+            image_url=f'https://example.com/bench/{i}.png',
+            patient_age=rng.randint(18, 90), patient_gender=rng.choice(['F', 'M']),
+            diagnosis=rng.choice(DIAGNOSES), is_malignant=rng.random() < 0.3,
+            confidence_score=rng.random() if status != 'PENDING' else None, status=status,
+            # Pareto-ish ownership: a few users own most cases
+            created_by_id=user_ids[min(int(rng.paretovariate(1.2)) - 1, len(user_ids) - 1)],
+        )
+    return make_case
+
+
+def seed(users=1000, cases=100_000, messages=1_000_000, batch_size=5000, rng_seed=0, log=None):
+    """Top the bench dataset up to the requested sizes; returns the final counts."""
+    log = log or (lambda message: None)
+
+    existing = bench_users().count()
+    if existing < users:
+        password = make_password(PASSWORD)  # hashed once, shared by every bench user
+        User.objects.bulk_create([
+            User(username=f'{PREFIX}-{i}', email=f'{PREFIX}-{i}@example.com', password=password,
+                 role=ROLES[i % len(ROLES)], first_name='Bench', last_name=str(i))
+            for i in range(existing, users)
+        ], batch_size=batch_size)
+        log(f'users: {users - existing} created')
+    user_ids = list(bench_users().order_by('id').values_list('id', flat=True))[:users]
+
+    existing = Case.objects.filter(case_id__startswith=f'{PREFIX.upper()}-').count()
+    if existing < cases:
+        make_case = _case_maker(user_ids)
+        for batch in _batches(_rows(make_case, 'cases', existing, cases, rng_seed), batch_size):
+            with transaction.atomic():
+                Case.objects.bulk_create(batch)
+        log(f'cases: {cases - existing} created')
+
+    bench_ids = set(user_ids)
+    existing = Message.objects.filter(sender_id__in=user_ids).count()
+    if existing < messages:
+        def make_message(rng, i):
+            recipient = user_ids[min(int(rng.paretovariate(1.1)) - 1, len(user_ids) - 1)]
+            sender = rng.choice(user_ids)
+            return Message(sender_id=sender, recipient_id=recipient,
+                           content=' '.join(rng.choices(WORDS, k=rng.randint(3, 20))),
+                           is_read=rng.random() < 0.7)
+        for batch in _batches(_rows(make_message, 'messages', existing, messages, rng_seed), batch_size):
+            with transaction.atomic():
+                Message.objects.bulk_create(batch)
+        log(f'messages: {messages - existing} created')
+        # bulk_create bypasses Message.save(), which maintains conversations
+        log(f'conversations: {Conversation.objects.rebuild(bench_ids)} rebuilt')
+
+    return {
+        'users': len(user_ids),
+        'cases': Case.objects.filter(case_id__startswith=f'{PREFIX.upper()}-').count(),
+        'messages': Message.objects.filter(sender_id__in=user_ids).count(),
+    }
+
+
+def reset_cases(pks, rng_seed=0):
+    """Put the analysis fields of the given bench cases back to their seeded values.
+
+    The analyze scenario of `bench_api` overwrites them, so a second run would
+    otherwise read and analyze different rows than the first. Returns the
+    number of cases reset.
+    """
+    cases = {int(case.case_id.rsplit('-', 1)[1]): case
+             for case in Case.objects.filter(pk__in=pks, case_id__startswith=f'{PREFIX.upper()}-')}
+    if not cases:
+        return 0
+    # Only the RNG draws matter here, so the owners need not match the original --users
+    make_case = _case_maker(list(bench_users().values_list('id', flat=True)) or [None])
+    now = timezone.now()
+    for block in sorted({i // BLOCK for i in cases}):
+        start = block * BLOCK
+        for i, seeded in enumerate(_rows(make_case, 'cases', start, start + BLOCK, rng_seed), start):
+            case = cases.get(i)
+            if case is not None:
+                case.status, case.is_malignant = seeded.status, seeded.is_malignant
+                case.confidence_score, case.updated_at = seeded.confidence_score, now
+    # bulk_update skips post_save, so drop the cached responses here; the new
+    # updated_at lets the analytics rollups pick the change up
+    Case.objects.bulk_update(cases.values(), RESET_FIELDS + ['updated_at'], batch_size=1000)
+    for case in cases.values():
+        cache.invalidate('case', case.pk)
+    return len(cases)
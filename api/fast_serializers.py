@@ -0,0 +1,147 @@
+"""
+Read-only serializers for list endpoints that work on `.values()` rows.
+
+Each class mirrors one of the DRF serializers in `serializers.py`. The field
+plan (output name, `.values()` lookup, converter) is compiled once from the
+DRF serializer's own fields, so output keys, ordering and formatting stay
+identical to the model serializer while skipping per-row model instantiation,
+`get_attribute` traversal and per-field dispatch.
+"""
+from functools import partial
+
+from django.conf import settings
+from django.core.exceptions import ImproperlyConfigured
+from django.utils import timezone
+from rest_framework import ISO_8601, fields, relations
+from rest_framework.settings import api_settings
+
+from .profiling import phase
+from .serializers import CaseSerializer, MessageSerializer, UserDataSerializer
+
+# Fields whose to_representation() returns DB values unchanged; these are
+# copied straight from the row instead of being called per value.
+IDENTITY_FIELDS = (
+    fields.CharField,
+    fields.ChoiceField,
+    fields.BooleanField,
+    fields.IntegerField,
+    fields.FloatField,
+    relations.PrimaryKeyRelatedField,
+)
+
+
+def _is_iso_datetime(field):
+    return (
+        isinstance(field, fields.DateTimeField)
+        and not hasattr(field, 'timezone')
+        and getattr(field, 'format', api_settings.DATETIME_FORMAT).lower() == ISO_8601
+    )
+
+
+def _iso_datetime_converter(field):
+    """
+    DateTimeField.to_representation with the current timezone looked up once
+    per batch rather than once per value.
+    """
+    tz = timezone.get_current_timezone() if settings.USE_TZ else None
+
+    def convert(value):
+        if tz is None or timezone.is_naive(value):
+            return field.to_representation(value)
+        value = value.astimezone(tz).isoformat()
+        if value.endswith('+00:00'):
+            value = value[:-6] + 'Z'
+        return value
+    return convert
+
+
+class ValuesSerializer:
+    serializer_class = None
+    # field name -> (lookups the callable needs, callable(row))
+    method_fields = {}
+    # Plan entries are (name, lookup, converter, converter factory); factories
+    # are resolved once per batch by bind().
+
+    def __init__(self):
+        plan, lookups = [], []
+        for name, field in self.serializer_class().fields.items():
+            if field.write_only:
+                continue
+            if name in self.method_fields:
+                sources, func = self.method_fields[name]
+                lookups.extend(sources)
+                plan.append((name, None, func, None))
+                continue
+            if isinstance(field, fields.SerializerMethodField):
+                raise ImproperlyConfigured(
+                    f'{type(self).__name__} needs a method_fields entry for {name!r}'
+                )
+            source = field.source.replace('.', '__')
+            lookups.append(source)
+            if isinstance(field, IDENTITY_FIELDS):
+                plan.append((name, source, None, None))
+            elif _is_iso_datetime(field):
+                plan.append((name, source, None, partial(_iso_datetime_converter, field)))
+            else:
+                plan.append((name, source, field.to_representation, None))
+
+        self.lookups = tuple(dict.fromkeys(lookups))
+        self.plan = tuple(plan)
+
+    def values(self, queryset, *extra):
+        """`extra` lookups (e.g. annotations) are passed through by serialize()."""
+        return queryset.values(*self.lookups, *extra)
+
+    def bind(self):
+        """Resolve per-batch converters (e.g. the active timezone)."""
+        return tuple(
+            (name, source, make_converter() if make_converter else convert)
+            for name, source, convert, make_converter in self.plan
+        )
+
+    def to_representation(self, row, plan=None):
+        data = {}
+        for name, source, convert in plan or self.bind():
+            if source is None:
+                data[name] = convert(row)
+                continue
+            value = row[source]
+            data[name] = value if convert is None or value is None else convert(value)
+        return data
+
+    def serialize(self, rows, extra=()):
+        with phase('serialize'):
+            plan = self.bind()
+            to_representation = self.to_representation
+            if extra:
+                return [{**to_representation(row, plan), **{name: row[name] for name in extra}} for row in rows]
+            return [to_representation(row, plan) for row in rows]
+
+
+def _user_name(row):
+    if row['first_name'] and row['last_name']:
+        return f"{row['first_name']} {row['last_name']}"
+    elif row['first_name']:
+        return row['first_name']
+    return row['username']
+
+
+class CaseValuesSerializer(ValuesSerializer):
+    serializer_class = CaseSerializer
+
+
+class MessageValuesSerializer(ValuesSerializer):
+    serializer_class = MessageSerializer
+
+
+class UserDataValuesSerializer(ValuesSerializer):
+    serializer_class = UserDataSerializer
+    method_fields = {
+        'id': (('id',), lambda row: str(row['id'])),
+        'name': (('first_name', 'last_name', 'username'), _user_name),
+        'phone_number': (('phone',), lambda row: row['phone'] or None),
+        'hospital_affiliation': (('institution',), lambda row: row['institution'] or None),
+        'license_id': ((), lambda row: None),
+        'date_of_birth': (('date_of_birth',), lambda row: str(row['date_of_birth']) if row['date_of_birth'] else None),
+        'profile_picture': (('profile_image',), lambda row: row['profile_image'] or None),
+    }
@@ -0,0 +1,234 @@
+"""
+Content-addressed image storage, derivatives and ranged file responses.
+
+Each chunk of an upload is first streamed to a file of its own and then
+appended to `MEDIA_ROOT/uploads-tmp/<upload id>.part`; once complete, that is moved to `MEDIA_ROOT/images/ab/cd/<sha256>/original`; identical
+content is stored once. A background pool then writes, next to the original:
+
+- `model.png`: 224x224 RGB, resized exactly like the ML service's
+  `T.Resize((224, 224))`, so it can be sent for inference as is
+- `thumb.jpg`: at most 256px on the longer side, for list views
+
+Files never change once written, so they are served with an immutable
+Cache-Control and honour HTTP Range requests.
+"""
+import glob
+import hashlib
+import logging
+import os
+import re
+import shutil
+import uuid
+from concurrent.futures import ThreadPoolExecutor
+
+from django.conf import settings
+from django.db import close_old_connections, transaction
+from django.http import FileResponse, HttpResponse, HttpResponseNotModified, StreamingHttpResponse
+
+from .cache import etag_matches
+from .models import ImageBlob
+
+logger = logging.getLogger(__name__)
+
+MODEL_SIZE = (224, 224)
+THUMB_SIZE = (256, 256)
+VARIANTS = {
+    'original': ('original', None),
+    'model': ('model.png', 'image/png'),
+    'thumb': ('thumb.jpg', 'image/jpeg'),
+}
+CACHE_CONTROL = 'private, max-age=31536000, immutable'
+BLOCK_SIZE = 64 * 1024
+
+_worker_pool = ThreadPoolExecutor(max_workers=settings.IMAGE_WORKERS, thread_name_prefix='image-derivatives')
+
+
+def blob_dir(sha256):
+    return os.path.join(settings.MEDIA_ROOT, 'images', sha256[:2], sha256[2:4], sha256)
+
+
+def variant_path(sha256, variant):
+    return os.path.join(blob_dir(sha256), VARIANTS[variant][0])
+
+
+def part_path(upload):
+    return os.path.join(settings.MEDIA_ROOT, 'uploads-tmp', f'{upload.pk}.part')
+
+
+def receive_chunk(upload, stream, length):
+    """
+    Write exactly `length` bytes from `stream` to a new chunk file and return
+    its path. Runs before the upload row is locked, so a slow client holds no
+    lock or transaction while it sends; append_chunk() then adds the file.
+    """
+    path = f'{part_path(upload)}.{uuid.uuid4().hex}'
+    os.makedirs(os.path.dirname(path), exist_ok=True)
+    remaining = length
+    try:
+        with open(path, 'wb') as chunk:
+            while remaining:
+                block = stream.read(min(BLOCK_SIZE, remaining))
+                if not block:
+                    raise ValueError(f'Body ended after {length - remaining} of {length} bytes')
+                chunk.write(block)
+                remaining -= len(block)
+    except BaseException:
+        os.remove(path)
+        raise
+    return path
+
+
+def append_chunk(upload, chunk_path):
+    """Append a received chunk file to the upload's part file; call with the upload row locked."""
+    with open(part_path(upload), 'ab') as part, open(chunk_path, 'rb') as chunk:
+        part.truncate(upload.received)  # drop bytes of an append that failed half way
+        shutil.copyfileobj(chunk, part, BLOCK_SIZE)
+    os.remove(chunk_path)
+
+
+def discard_upload_files(upload):
+    """Remove the part file and any chunk files of an unfinished upload."""
+    for path in glob.glob(f'{glob.escape(part_path(upload))}*'):
+        os.remove(path)
+
+
+def file_sha256(path):
+    digest = hashlib.sha256()
+    with open(path, 'rb') as f:
+        for block in iter(lambda: f.read(1024 * 1024), b''):
+            digest.update(block)
+    return digest.hexdigest()
+
+
+def store_upload(upload):
+    """
+    Move a complete part file into content-addressed storage and return its
+    ImageBlob, reusing the existing one when the content is already stored.
+    Raises ValueError when the content does not match the declared sha256.
+    """
+    path = part_path(upload)
+    sha256 = file_sha256(path)
+    if upload.sha256 and upload.sha256 != sha256:
+        os.remove(path)
+        raise ValueError(f'Content hash {sha256} does not match the declared sha256')
+
+    blob, created = ImageBlob.objects.get_or_create(
+        sha256=sha256, defaults={'size': upload.size, 'content_type': upload.content_type})
+    original = variant_path(sha256, 'original')
+    if os.path.exists(original):
+        os.remove(path)
+    else:
+        os.makedirs(os.path.dirname(original), exist_ok=True)
+        os.replace(path, original)
+    if created or blob.derivatives_status != 'READY':
+        schedule_derivatives(sha256)
+    return blob
+
+
+def schedule_derivatives(sha256):
+    transaction.on_commit(lambda: _worker_pool.submit(_derivatives_job, sha256))
+
+
+def _derivatives_job(sha256):
+    try:
+        generate_derivatives(sha256)
+    except Exception as e:
+        logger.exception('Generating derivatives for image %s failed', sha256)
+        # Otherwise the blob would stay PENDING until process_images retries it
+        ImageBlob.objects.filter(sha256=sha256).update(derivatives_status='FAILED', derivatives_error=str(e))
+    finally:
+        close_old_connections()
+
+
+def _write_atomic(image, path, **save_kwargs):
+    tmp = f'{path}.tmp'
+    image.save(tmp, **save_kwargs)
+    os.replace(tmp, path)
+
+
+def generate_derivatives(sha256):
+    """Write the model-ready and thumbnail images for one blob (idempotent)."""
+    from PIL import Image, UnidentifiedImageError
+
+    try:
+        with Image.open(variant_path(sha256, 'original')) as image:
+            image = image.convert('RGB')
+    except (OSError, UnidentifiedImageError, Image.DecompressionBombError) as e:
+        ImageBlob.objects.filter(sha256=sha256).update(derivatives_status='FAILED', derivatives_error=str(e))
+        return False
+
+    _write_atomic(image.resize(MODEL_SIZE, Image.BILINEAR), variant_path(sha256, 'model'), format='PNG')
+    thumb = image.copy()
+    thumb.thumbnail(THUMB_SIZE, Image.BILINEAR)
+    _write_atomic(thumb, variant_path(sha256, 'thumb'), format='JPEG', quality=85)
+    ImageBlob.objects.filter(sha256=sha256).update(
+        derivatives_status='READY', derivatives_error='', width=image.width, height=image.height)
+    return True
+
+
+def _parse_range(header, size):
+    """
+    (start, end) inclusive for a single `bytes=` range, None to serve the whole
+    file (no or multi-range header), or ValueError when unsatisfiable.
+    """
+    match = re.fullmatch(r'bytes=(\d*)-(\d*)', header.strip())
+    if not match:
+        return None
+    first, last = match.groups()
+    if first:
+        start = int(first)
+        end = min(int(last), size - 1) if last else size - 1
+    elif last:
+        start, end = max(size - int(last), 0), size - 1
+    else:
+        return None
+    if start > end or start >= size:
+        raise ValueError(header)
+    return start, end
+
+
+def _read_range(path, start, length):
+    with open(path, 'rb') as f:
+        f.seek(start)
+        while length:
+            block = f.read(min(BLOCK_SIZE, length))
+            if not block:
+                return
+            length -= len(block)
+            yield block
+
+
+def immutable_headers(response, etag):
+    response['ETag'] = etag
+    response['Cache-Control'] = CACHE_CONTROL
+    return response
+
+
+def not_modified(etag):
+    return immutable_headers(HttpResponseNotModified(), etag)
+
+
+def file_response(request, path, content_type, etag):
+    """Serve an immutable file with ETag, Cache-Control and Range support."""
+    if etag_matches(request, etag):
+        return not_modified(etag)
+    size = os.path.getsize(path)
+    byte_range = None
+    if_range = request.headers.get('If-Range')
+    if request.headers.get('Range') and (if_range is None or if_range == etag):
+        try:
+            byte_range = _parse_range(request.headers['Range'], size)
+        except ValueError:
+            response = HttpResponse(status=416)
+            response['Content-Range'] = f'bytes */{size}'
+            return response
+    if byte_range is None:
+        response = FileResponse(open(path, 'rb'), content_type=content_type)
+    else:
+        start, end = byte_range
+        response = StreamingHttpResponse(
+            _read_range(path, start, end - start + 1), status=206, content_type=content_type)
+        response['Content-Range'] = f'bytes {start}-{end}/{size}'
+        response['Content-Length'] = str(end - start + 1)
+    response['Accept-Ranges'] = 'bytes'
+    return immutable_headers(response, etag)
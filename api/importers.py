@@ -0,0 +1,192 @@
+"""
+Streaming bulk import of cases from CSV or NDJSON.
+
+Rows are read one at a time, validated in batches with the same field rules
+as CaseSerializer and written with bulk_create, one transaction per batch, so
+memory stays flat regardless of file size. Field values are checked row by
+row in memory; the lookups (case_id uniqueness, `image` blobs) are one query
+per batch.
+"""
+import csv
+import json
+from itertools import islice
+
+from django.core.exceptions import ValidationError as DjangoValidationError
+from django.db import IntegrityError, transaction
+from django.urls import reverse
+from rest_framework import serializers
+
+from .models import Case, ImageUpload
+from .serializers import CaseSerializer
+
+FORMATS = ('csv', 'ndjson')
+MAX_REPORTED_ERRORS = 1000
+
+
+class CaseImportSerializer(CaseSerializer):
+    """
+    CaseSerializer minus the per-row queries: `case_id` uniqueness and the
+    `image` blob are checked once per batch, and `created_by` is always the
+    importing user. As in CaseSerializer.validate_image, a row may only attach
+    an image that user uploaded.
+    """
+    image = serializers.RegexField(r'^[0-9a-fA-F]{64}$', required=False, allow_null=True)
+
+    class Meta(CaseSerializer.Meta):
+        fields = None
+        exclude = ['created_by']
+        extra_kwargs = {**CaseSerializer.Meta.extra_kwargs, 'case_id': {'validators': []}}
+
+    def validate_image(self, value):
+        return value.lower() if value else None
+
+    def validate(self, data):
+        # image_url is filled in once the batch has resolved the image
+        if not data.get('image_url') and not data.get('image'):
+            raise serializers.ValidationError({"image_url": "Provide image_url or an uploaded image"})
+        return data
+
+
+def detect_format(filename, content_type=''):
+    name = (filename or '').lower()
+    if name.endswith(('.ndjson', '.jsonl')) or 'ndjson' in content_type:
+        return 'ndjson'
+    if name.endswith('.csv') or 'csv' in content_type:
+        return 'csv'
+    return None
+
+
+def _decode_lines(stream, bad_lines):
+    """Decode a binary stream line by line; numbers of lines that are not UTF-8 go to `bad_lines`."""
+    for line_num, line in enumerate(stream, start=1):
+        try:
+            yield line.decode('utf-8-sig' if line_num == 1 else 'utf-8')
+        except UnicodeDecodeError:
+            bad_lines.add(line_num)
+            yield line.decode('utf-8', errors='replace')  # Keeps the CSV reader in step; the row is rejected
+
+
+def iter_rows(stream, fmt):
+    """
+    Yield (line number, row dict or None, parse error or None) from a binary
+    stream. Empty CSV cells are dropped so nullable fields fall back to their
+    defaults, as they would if omitted from a JSON request.
+    """
+    bad_lines = set()
+    text = _decode_lines(stream, bad_lines)
+    if fmt == 'csv':
+        reader = csv.DictReader(text)
+        last_line = 0
+        for row in reader:
+            # A quoted cell may span lines; the row is bad if any of them is
+            span, last_line = range(last_line + 1, reader.line_num + 1), reader.line_num
+            if any(line_num in bad_lines for line_num in span):
+                yield reader.line_num, None, 'Invalid UTF-8'
+                continue
+            if None in row:
+                yield reader.line_num, None, 'Row has more columns than the header'
+                continue
+            yield reader.line_num, {k: v for k, v in row.items() if v not in ('', None)}, None
+    elif fmt == 'ndjson':
+        for line_num, line in enumerate(text, start=1):
+            if line_num in bad_lines:
+                yield line_num, None, 'Invalid UTF-8'
+                continue
+            if not line.strip():
+                continue
+            try:
+                row = json.loads(line)
+            except ValueError as e:
+                yield line_num, None, f'Invalid JSON: {e}'
+                continue
+            if not isinstance(row, dict):
+                yield line_num, None, 'Expected a JSON object'
+                continue
+            yield line_num, row, None
+    else:
+        raise ValueError(f'Unsupported format {fmt!r}; expected one of {FORMATS}')
+
+
+class ImportResult:
+    def __init__(self):
+        self.created = 0
+        self.failed = 0
+        self.errors = []
+
+    def error(self, row, errors):
+        self.failed += 1
+        if len(self.errors) < MAX_REPORTED_ERRORS:
+            self.errors.append({'row': row, 'errors': errors})
+
+    def as_dict(self):
+        return {
+            'created': self.created,
+            'failed': self.failed,
+            'errors': sorted(self.errors, key=lambda e: e['row']),
+            'errors_truncated': self.failed > len(self.errors),
+        }
+
+
+def import_cases(rows, created_by_id=None, batch_size=500):
+    """
+    Validate and insert rows from `iter_rows` as user `created_by_id`; returns
+    an ImportResult. Rows with an `image` need that user to have uploaded it.
+    """
+    result = ImportResult()
+    rows = iter(rows)
+    while True:
+        batch = list(islice(rows, batch_size))
+        if not batch:
+            return result
+        _import_batch(batch, created_by_id, result)
+
+
+def _import_batch(batch, created_by_id, result):
+    # One serializer instance for the whole batch: building the field set is
+    # most of the cost of a fresh CaseSerializer, so it is done once here.
+    validator = CaseImportSerializer()
+    valid = []
+    for line_num, row, parse_error in batch:
+        if parse_error:
+            result.error(line_num, {'non_field_errors': [parse_error]})
+            continue
+        try:
+            valid.append((line_num, validator.run_validation(row)))
+        except (serializers.ValidationError, DjangoValidationError) as exc:
+            result.error(line_num, serializers.as_serializer_error(exc))
+
+    # case_id uniqueness: one query per batch plus duplicates within the batch
+    case_ids = [data['case_id'] for _, data in valid]
+    taken = set(Case.objects.filter(case_id__in=case_ids).values_list('case_id', flat=True))
+    # image: one query per batch; knowing a sha256 is not proof of having the image
+    images = {data['image'] for _, data in valid if data.get('image')}
+    owned = set(ImageUpload.objects.filter(user_id=created_by_id, blob_id__in=images)
+                .values_list('blob_id', flat=True)) if images and created_by_id else set()
+    instances = []
+    for line_num, data in valid:
+        if data['case_id'] in taken:
+            result.error(line_num, {'case_id': ['case with this case id already exists.']})
+            continue
+        image = data.pop('image', None)
+        if image is not None:
+            if image not in owned:
+                result.error(line_num, {'image': ['Upload this image first (POST /api/uploads/)']})
+                continue
+            data.setdefault('image_url', reverse('image-detail', args=[image]))
+        taken.add(data['case_id'])
+        instances.append((line_num, Case(created_by_id=created_by_id, image_id=image, **data)))
+
+    try:
+        with transaction.atomic():
+            Case.objects.bulk_create([case for _, case in instances])
+        result.created += len(instances)
+    except IntegrityError:
+        # Lost a race with a concurrent insert; retry row by row for accurate errors
+        for line_num, case in instances:
+            try:
+                with transaction.atomic():
+                    case.save(force_insert=True)
+                result.created += 1
+            except IntegrityError as e:
+                result.error(line_num, {'non_field_errors': [str(e)]})
+
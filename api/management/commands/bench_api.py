@@ -0,0 +1,134 @@
+import json
+import platform
+import random
+import subprocess
+
+import django
+from django.conf import settings
+from django.core.management.base import BaseCommand, CommandError
+from django.db import connection
+from django.test import override_settings
+from django.utils import timezone
+
+from api import factories
+from api.authentication import token_for_user
+from api.benchmarking import MLServiceStub, WSGIClient, run_load
+from api.models import Case, Message
+
+SCENARIOS = ('login', 'case_list', 'case_detail', 'my_cases', 'inbox', 'analyze')
+
+
+class Command(BaseCommand):
+    help = ('Latency and throughput of the main API endpoints against the synthetic bench '
+            'dataset (see seed_benchdata), with a local stub for the ML service. Writes a JSON '
+            'report that --compare can diff against a report from another commit.')
+
+    def add_arguments(self, parser):
+        parser.add_argument('--scenarios', default=','.join(SCENARIOS),
+                            help=f"comma separated subset of {', '.join(SCENARIOS)}")
+        parser.add_argument('--threads', type=int, default=4)
+        parser.add_argument('--requests', type=int, default=500, help='requests per scenario')
+        parser.add_argument('--ml-latency', type=float, default=0.02, help='seconds the ML stub takes')
+        parser.add_argument('--seed', action='store_true', help='seed the default dataset first if missing')
+        parser.add_argument('--output', help='write the JSON report here (default: stdout only)')
+        parser.add_argument('--compare', help='baseline JSON report to compare against')
+
+    def handle(self, *args, **options):
+        scenarios = [name.strip() for name in options['scenarios'].split(',') if name.strip()]
+        unknown = set(scenarios) - set(SCENARIOS)
+        if unknown:
+            raise CommandError(f"Unknown scenario(s): {', '.join(sorted(unknown))}")
+        if options['seed']:
+            factories.seed(log=self.stdout.write)
+        users = list(factories.bench_users().order_by('id')[:200])
+        if not users:
+            raise CommandError('No bench data; run `manage.py seed_benchdata` or pass --seed')
+
+        # bench-0 owns the most cases and receives the most messages
+        heavy = users[0]
+        client = WSGIClient(HTTP_AUTHORIZATION=f'Bearer {token_for_user(heavy).access_token}')
+        case_ids = list(Case.objects.filter(case_id__startswith='BENCH-').order_by('id')
+                        .values_list('id', flat=True)[:20000])
+        rng = random.Random(0)
+        sample = rng.sample(case_ids, min(len(case_ids), 2000))
+        # A previous run's analyze scenario rewrote these; start every run from the seeded rows
+        factories.reset_cases(sample)
+
+        def respond(result, expected=200):
+            status, headers, _ = result
+            queries = headers.get('X-DB-Queries')
+            return status == expected, int(queries) if queries is not None else None
+
+        calls = {
+            'login': lambda w, i: respond(client.post('/api/auth/login', {
+                'username': users[(w * 7919 + i) % len(users)].username, 'password': factories.PASSWORD})),
+            'case_list': lambda w, i: respond(client.get('/api/cases')),
+            'case_detail': lambda w, i: respond(client.get(f'/api/cases/{sample[(w * 7919 + i) % len(sample)]}')),
+            'my_cases': lambda w, i: respond(client.get('/api/cases/my_cases')),
+            'inbox': lambda w, i: respond(client.get('/api/messages/inbox')),
+            'analyze': lambda w, i: respond(client.post(f'/api/cases/{sample[(w * 7919 + i) % len(sample)]}/analyze')),
+        }
+
+        results = {}
+        unlimited = {'ip': (10**9, 10**9), 'account': (10**9, 10**9)}
+        with MLServiceStub(latency=options['ml_latency']) as stub, \
+                override_settings(ML_SERVICE_URL=stub.url, LOGIN_THROTTLE=unlimited):
+            for name in scenarios:
+                results[name] = run_load(calls[name], threads=options['threads'], requests=options['requests'])
+                r = results[name]
+                self.stdout.write(f"{name:<12} {r['rps']:>8.1f} req/s  p50 {r['p50_ms']:>8.2f} ms  "
+                                  f"p95 {r['p95_ms']:>8.2f} ms  queries {r['db_queries']}  errors {r['errors']}")
+
+        report = {'meta': self.metadata(options, heavy), 'scenarios': results}
+        if options['output']:
+            with open(options['output'], 'w') as f:
+                json.dump(report, f, indent=2)
+            self.stdout.write(f"report written to {options['output']}")
+        else:
+            self.stdout.write(json.dumps(report, indent=2))
+        if options['compare']:
+            with open(options['compare']) as f:
+                self.compare(json.load(f), report)
+
+    def metadata(self, options, heavy):
+        def git(*args):
+            try:
+                return subprocess.run(['git', *args], cwd=settings.BASE_DIR, capture_output=True,
+                                      text=True, timeout=10).stdout.strip()
+            except (OSError, subprocess.SubprocessError):
+                return None
+        return {
+            'commit': git('rev-parse', '--short', 'HEAD'),
+            'dirty': bool(git('status', '--porcelain', '--untracked-files=no')),
+            'timestamp': timezone.now().isoformat(),
+            'python': platform.python_version(),
+            'django': django.get_version(),
+            'database': connection.vendor,
+            'profile': settings.PROFILE,
+            'debug': settings.DEBUG,
+            'threads': options['threads'],
+            'requests_per_scenario': options['requests'],
+            'ml_latency_s': options['ml_latency'],
+            'dataset': {
+                'users': factories.bench_users().count(),
+                'cases': Case.objects.count(),
+                'messages': Message.objects.count(),
+                'heavy_user_cases': Case.objects.filter(created_by=heavy).count(),
+                'heavy_user_inbox': Message.objects.filter(recipient=heavy).count(),
+            },
+        }
+
+    def compare(self, baseline, report):
+        self.stdout.write(f"\ncompared with {baseline['meta'].get('commit')} "
+                          f"(now {report['meta'].get('commit')}):")
+        self.stdout.write(f"{'scenario':<12} {'p50 ms':>20} {'p95 ms':>20} {'req/s':>20}")
+        for name, new in report['scenarios'].items():
+            old = baseline['scenarios'].get(name)
+            if not old or not old.get('requests'):
+                self.stdout.write(f'{name:<12} (not in baseline)')
+                continue
+
+            def cell(key):
+                change = (new[key] - old[key]) / old[key] * 100 if old[key] else 0
+                return f'{old[key]:.1f} -> {new[key]:.1f} ({change:+.0f}%)'
+            self.stdout.write(f"{name:<12} {cell('p50_ms'):>20} {cell('p95_ms'):>20} {cell('rps'):>20}")
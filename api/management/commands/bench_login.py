@@ -0,0 +1,86 @@
+import statistics
+import threading
+import time
+import uuid
+from collections import Counter
+
+from django.core.cache import cache
+from django.core.management.base import BaseCommand
+from django.test import Client, override_settings
+
+from api.authentication import token_for_user
+from api.models import User
+
+
+class Command(BaseCommand):
+    help = ('Measure login throughput under a credential-stuffing burst, with and '
+            'without the login throttles, while probing latency of another endpoint.')
+
+    def add_arguments(self, parser):
+        parser.add_argument('--threads', type=int, default=16)
+        parser.add_argument('--duration', type=float, default=5.0)
+        parser.add_argument('--accounts', type=int, default=20)
+
+    def handle(self, *args, **options):
+        tag = uuid.uuid4().hex[:8]
+        users = [User.objects.create_user(username=f'login-bench-{tag}-{i}',
+                                          email=f'login-bench-{tag}-{i}@example.com', password='correct-horse')
+                 for i in range(options['accounts'])]
+        self.probe_token = str(token_for_user(users[0]).access_token)
+        try:
+            self.stdout.write('legitimate logins (distinct accounts and IPs, no throttling):')
+            with override_settings(LOGIN_THROTTLE={'ip': (10**9, 10**9), 'account': (10**9, 10**9)}):
+                self.run(users, options, password='correct-horse', rotate_ip=True)
+            self.stdout.write('attack, throttles disabled (wrong passwords, rotating IPs):')
+            with override_settings(LOGIN_THROTTLE={'ip': (10**9, 10**9), 'account': (10**9, 10**9)}):
+                self.run(users, options, password='wrong', rotate_ip=True)
+            self.stdout.write('attack, throttles enabled (wrong passwords, single IP):')
+            self.run(users, options, password='wrong', rotate_ip=False)
+        finally:
+            User.objects.filter(pk__in=[u.pk for u in users]).delete()
+
+    def run(self, users, options, password, rotate_ip):
+        cache.clear()
+        stop = time.monotonic() + options['duration']
+        statuses = Counter()
+        probe_latencies = []
+        lock = threading.Lock()
+
+        def attacker(n):
+            client = Client()
+            i = 0
+            local = Counter()
+            while time.monotonic() < stop:
+                user = users[(n + i) % len(users)]
+                ip = f'10.{n}.{(i // 250) % 250}.{i % 250 + 1}' if rotate_ip else '10.0.0.1'
+                response = client.post('/api/auth/login', {'email': user.email, 'password': password},
+                                       content_type='application/json', REMOTE_ADDR=ip)
+                local[response.status_code] += 1
+                i += 1
+            with lock:
+                statuses.update(local)
+
+        def prober():
+            client = Client(HTTP_AUTHORIZATION=f'Bearer {self.probe_token}')
+            while time.monotonic() < stop:
+                start = time.perf_counter()
+                client.get('/api/cases/my_cases')
+                probe_latencies.append((time.perf_counter() - start) * 1000)
+                time.sleep(0.01)
+
+        threads = [threading.Thread(target=attacker, args=(n,)) for n in range(options['threads'])]
+        threads.append(threading.Thread(target=prober))
+        start = time.monotonic()
+        for t in threads:
+            t.start()
+        for t in threads:
+            t.join()
+        elapsed = time.monotonic() - start
+
+        total = sum(statuses.values())
+        probe = sorted(probe_latencies) or [0.0]
+        self.stdout.write(
+            f'  {total / elapsed:8.1f} req/s  statuses={dict(sorted(statuses.items()))}  '
+            f'probe my_cases p50={statistics.median(probe):.1f} ms '
+            f'p95={probe[int(len(probe) * 0.95) - 1 if len(probe) > 1 else 0]:.1f} ms'
+        )
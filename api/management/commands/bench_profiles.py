@@ -0,0 +1,84 @@
+import json
+import os
+import subprocess
+import sys
+
+from django.conf import settings
+from django.core.management.base import BaseCommand, CommandError
+from django.db import connections
+from django.db.backends.signals import connection_created
+
+from api.authentication import token_for_user
+from api.benchmarking import WSGIClient, run_load
+from api.models import User
+
+PROFILES = ('development', 'production')
+
+
+class Command(BaseCommand):
+    help = ('Compare requests/sec on the case list endpoint under the development and '
+            'production settings profiles (DJANGO_PROFILE), one subprocess per profile.')
+
+    def add_arguments(self, parser):
+        parser.add_argument('--duration', type=float, default=5.0)
+        parser.add_argument('--threads', type=int, default=4)
+        parser.add_argument('--path', default='/api/cases?page_size=20')
+        parser.add_argument('--user', help='username to authenticate as (default: first active user)')
+        parser.add_argument('--worker', action='store_true', help='internal: benchmark this process only')
+
+    def handle(self, *args, **options):
+        if options['worker']:
+            self.stdout.write(json.dumps(self.measure(options)))
+            return
+
+        results = []
+        for profile in PROFILES:
+            env = dict(os.environ, DJANGO_PROFILE=profile)
+            # The production profile refuses to start without a secret key
+            env.setdefault('DJANGO_SECRET_KEY', settings.SECRET_KEY)
+            command = [sys.executable, sys.argv[0], 'bench_profiles', '--worker',
+                       '--duration', str(options['duration']), '--threads', str(options['threads']),
+                       '--path', options['path']]
+            if options['user']:
+                command += ['--user', options['user']]
+            proc = subprocess.run(command, env=env, capture_output=True, text=True)
+            if proc.returncode:
+                raise CommandError(f'{profile} run failed:\n{proc.stderr}')
+            results.append(json.loads(proc.stdout.strip().splitlines()[-1]))
+
+        self.stdout.write(f"GET {options['path']}, {options['threads']} threads, {options['duration']}s each")
+        self.stdout.write(f"{'profile':<12} {'DEBUG':<6} {'conn age':>8} {'req/s':>8} {'p50 ms':>8} "
+                          f"{'p95 ms':>8} {'db conns':>9}")
+        for r in results:
+            self.stdout.write(f"{r['profile']:<12} {str(r['debug']):<6} {r['conn_max_age']:>8} {r['rps']:>8.1f} "
+                              f"{r['p50_ms']:>8.2f} {r['p95_ms']:>8.2f} {r['connections_opened']:>9}")
+        base, prod = results
+        if base['rps']:
+            self.stdout.write(f"production / development: {prod['rps'] / base['rps']:.2f}x")
+
+    def measure(self, options):
+        users = User.objects.filter(is_active=True).order_by('id')
+        user = users.filter(username=options['user']).first() if options['user'] else users.first()
+        if user is None:
+            raise CommandError('No user to authenticate as; create one or pass --user')
+        client = WSGIClient(HTTP_AUTHORIZATION=f'Bearer {token_for_user(user).access_token}')
+        connections.close_all()
+
+        opened = [0]
+
+        def count_connection(sender, **kwargs):
+            opened[0] += 1
+        connection_created.connect(count_connection)
+
+        def call(worker, i):
+            status, _, _ = client.get(options['path'])
+            return status == 200, None
+
+        stats = run_load(call, threads=options['threads'], duration=options['duration'])
+        return dict(
+            stats,
+            profile=settings.PROFILE,
+            debug=settings.DEBUG,
+            conn_max_age=settings.DATABASES['default'].get('CONN_MAX_AGE', 0),
+            connections_opened=opened[0],
+        )
@@ -0,0 +1,96 @@
+import time
+import uuid
+
+from django.core.management.base import BaseCommand, CommandError
+from django.db import transaction
+from rest_framework.renderers import JSONRenderer
+
+from api.fast_serializers import CaseValuesSerializer, MessageValuesSerializer, UserDataValuesSerializer
+from api.models import Case, Message, User
+from api.serializers import CaseSerializer, MessageSerializer, UserDataSerializer
+
+
+class _Rollback(Exception):
+    pass
+
+
+class Command(BaseCommand):
+    help = ('Compare DRF model serializers against the .values() fast path on '
+            'synthetic rows (ms per 1,000 rows). All rows are rolled back.')
+
+    def add_arguments(self, parser):
+        parser.add_argument('--rows', type=int, default=5000)
+        parser.add_argument('--repeat', type=int, default=5)
+
+    def handle(self, *args, **options):
+        self.rows = options['rows']
+        self.repeat = options['repeat']
+        try:
+            with transaction.atomic():
+                self.run()
+                raise _Rollback
+        except _Rollback:
+            pass
+
+    def run(self):
+        tag = uuid.uuid4().hex[:8]
+        owner = User.objects.create_user(username=f'bench-{tag}', email=f'bench-{tag}@example.com',
+                                         password=None, first_name='Bench', last_name='User')
+        peer = User.objects.create_user(username=f'bench-peer-{tag}', password=None)
+        User.objects.bulk_create([
+            User(username=f'bench-{tag}-{i}', email=f'u{i}@example.com', first_name=f'F{i}',
+                 institution='Lab' if i % 2 else None)
+            for i in range(self.rows)
+        ])
+        Case.objects.bulk_create([
+            Case(case_id=f'BENCH-{tag}-{i}', title=f'Case {i}', description='synthetic',
+                 image_url=f'https://example.com/{i}.png', patient_age=i % 90,
+                 is_malignant=bool(i % 3), confidence_score=(i % 100) / 100 if i % 4 else None,
+                 status='ANALYZED', created_by=owner)
+            for i in range(self.rows)
+        ])
+        Message.objects.bulk_create([
+            Message(sender=peer, recipient=owner, content=f'message {i}', is_read=bool(i % 2))
+            for i in range(self.rows)
+        ])
+
+        self.compare('cases', Case.objects.filter(created_by=owner).order_by('-created_at', '-id'),
+                     CaseSerializer, CaseValuesSerializer(), ())
+        self.compare('messages', Message.objects.filter(recipient=owner).order_by('-created_at', '-id'),
+                     MessageSerializer, MessageValuesSerializer(), ('sender', 'recipient'))
+        self.compare('users', User.objects.filter(username__startswith=f'bench-{tag}-').order_by('id'),
+                     UserDataSerializer, UserDataValuesSerializer(), ())
+
+    def compare(self, label, queryset, serializer_class, values_serializer, related):
+        renderer = JSONRenderer()
+
+        def model_path():
+            return renderer.render(serializer_class(queryset.select_related(*related), many=True).data)
+
+        def values_path():
+            return renderer.render(values_serializer.serialize(values_serializer.values(queryset)))
+
+        if model_path() != values_path():
+            raise CommandError(f'{label}: fast path output differs from {serializer_class.__name__}')
+
+        # Serialization only: rows are fetched up front for both paths
+        instances = list(queryset.select_related(*related))
+        rows = list(values_serializer.values(queryset))
+        n = len(rows)
+        before = self.best(lambda: serializer_class(instances, many=True).data) / n * 1000
+        after = self.best(lambda: values_serializer.serialize(rows)) / n * 1000
+        before_e2e = self.best(model_path) / n * 1000
+        after_e2e = self.best(values_path) / n * 1000
+
+        self.stdout.write(
+            f'{label:<9} rows={n:<7} serialize: {before:8.2f} -> {after:7.2f} ms/1k ({before / after:4.1f}x)   '
+            f'query+serialize+render: {before_e2e:8.2f} -> {after_e2e:7.2f} ms/1k ({before_e2e / after_e2e:4.1f}x)'
+        )
+
+    def best(self, func):
+        timings = []
+        for _ in range(self.repeat):
+            start = time.perf_counter()
+            func()
+            timings.append(time.perf_counter() - start)
+        return min(timings) * 1000
@@ -0,0 +1,36 @@
+import json
+
+from django.core.management.base import BaseCommand, CommandError
+
+from api.importers import FORMATS, detect_format, import_cases, iter_rows
+from api.models import User
+
+
+class Command(BaseCommand):
+    help = 'Stream-import cases from a CSV or NDJSON file (same rules as POST /api/cases/bulk_import).'
+
+    def add_arguments(self, parser):
+        parser.add_argument('path')
+        parser.add_argument('--type', choices=FORMATS, help='defaults to the file extension')
+        parser.add_argument('--user', help='username recorded as created_by; rows with an `image` '
+                                           'must reference an upload of this user')
+        parser.add_argument('--batch-size', type=int, default=1000)
+
+    def handle(self, *args, **options):
+        fmt = options['type'] or detect_format(options['path'])
+        if fmt is None:
+            raise CommandError('Cannot tell the file type from its name; pass --type')
+        created_by_id = None
+        if options['user']:
+            try:
+                created_by_id = User.objects.values_list('id', flat=True).get(username=options['user'])
+            except User.DoesNotExist:
+                raise CommandError(f"No user named {options['user']!r}")
+
+        with open(options['path'], 'rb') as stream:
+            result = import_cases(iter_rows(stream, fmt), created_by_id=created_by_id,
+                                  batch_size=options['batch_size'])
+
+        self.stdout.write(json.dumps(result.as_dict(), indent=2))
+        if result.failed:
+            self.stderr.write(f'{result.failed} row(s) failed')
@@ -0,0 +1,36 @@
+from datetime import timedelta
+
+from django.core.management.base import BaseCommand
+from django.utils import timezone
+
+from api.images import discard_upload_files, generate_derivatives
+from api.models import ImageBlob, ImageUpload
+
+
+class Command(BaseCommand):
+    help = ('Generate missing image derivatives (e.g. jobs lost to a restart) and '
+            'delete abandoned uploads with their part files.')
+
+    def add_arguments(self, parser):
+        parser.add_argument('--retry-failed', action='store_true', help='also retry FAILED images')
+        parser.add_argument('--abandoned-days', type=int, default=7,
+                            help='delete unfinished uploads not touched for this many days')
+
+    def handle(self, *args, **options):
+        statuses = ['PENDING', 'FAILED'] if options['retry_failed'] else ['PENDING']
+        done = failed = 0
+        for sha256 in ImageBlob.objects.filter(derivatives_status__in=statuses).values_list('sha256', flat=True):
+            if generate_derivatives(sha256):
+                done += 1
+            else:
+                failed += 1
+        self.stdout.write(f'{done} image(s) processed, {failed} failed')
+
+        cutoff = timezone.now() - timedelta(days=options['abandoned_days'])
+        abandoned = ImageUpload.objects.filter(blob__isnull=True, updated_at__lt=cutoff)
+        removed = 0
+        for upload in abandoned:
+            discard_upload_files(upload)
+            upload.delete()
+            removed += 1
+        self.stdout.write(f'{removed} abandoned upload(s) removed')
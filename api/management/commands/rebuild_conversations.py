@@ -0,0 +1,22 @@
+import time
+
+from django.core.management.base import BaseCommand
+
+from api.models import Conversation, User
+
+
+class Command(BaseCommand):
+    help = ('Recompute conversation summaries (last message, unread count) from the messages table, '
+            'e.g. after messages were bulk-created or updated without Message.save().')
+
+    def add_arguments(self, parser):
+        parser.add_argument('--user', action='append', default=[], metavar='USERNAME',
+                            help='only rebuild this user\'s conversations (repeatable; default: everyone)')
+
+    def handle(self, *args, **options):
+        users = User.objects.all()
+        if options['user']:
+            users = users.filter(username__in=options['user'])
+        start = time.perf_counter()
+        count = Conversation.objects.rebuild(users.values_list('id', flat=True))
+        self.stdout.write(f'{count} conversation(s) rebuilt in {time.perf_counter() - start:.2f}s')
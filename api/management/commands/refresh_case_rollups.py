@@ -0,0 +1,32 @@
+import time
+
+from django.conf import settings
+from django.core.management.base import BaseCommand
+from django.db import close_old_connections
+
+from api.analytics import refresh_rollups
+
+
+class Command(BaseCommand):
+    help = ('Refresh the case rollups behind /api/analytics (incremental unless --full); run it from cron, '
+            'or with --loop as a long-running service.')
+
+    def add_arguments(self, parser):
+        parser.add_argument('--full', action='store_true', help='rebuild every bucket from scratch')
+        parser.add_argument('--loop', action='store_true',
+                            help='keep refreshing incrementally every --interval seconds')
+        parser.add_argument('--interval', type=float, default=settings.ANALYTICS_REFRESH_INTERVAL,
+                            help='seconds between refreshes with --loop (default: ANALYTICS_REFRESH_INTERVAL)')
+
+    def handle(self, *args, **options):
+        full = options['full']
+        while True:
+            start = time.perf_counter()
+            written = refresh_rollups(full=full)
+            self.stdout.write(f'{written} rollup row(s) written in {time.perf_counter() - start:.2f}s')
+            if not options['loop']:
+                return
+            full = False
+            # Reconnect if the database dropped the connection while we slept
+            close_old_connections()
+            time.sleep(options['interval'])
@@ -0,0 +1,22 @@
+import time
+
+from django.core.management.base import BaseCommand
+
+from api.factories import seed
+
+
+class Command(BaseCommand):
+    help = 'Create (or top up) the synthetic bench-* users, cases and messages used by bench_api.'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--users', type=int, default=1000)
+        parser.add_argument('--cases', type=int, default=100_000)
+        parser.add_argument('--messages', type=int, default=1_000_000)
+        parser.add_argument('--batch-size', type=int, default=5000)
+
+    def handle(self, *args, **options):
+        start = time.perf_counter()
+        counts = seed(users=options['users'], cases=options['cases'], messages=options['messages'],
+                      batch_size=options['batch_size'], log=self.stdout.write)
+        self.stdout.write(f"{counts['users']} users, {counts['cases']} cases, {counts['messages']} messages "
+                          f"({time.perf_counter() - start:.1f}s)")
@@ -0,0 +1,75 @@
+import asyncio
+import resource
+import time
+import uuid
+
+from channels.layers import get_channel_layer
+from channels.testing import WebsocketCommunicator
+from django.core.management.base import BaseCommand
+from rest_framework_simplejwt.tokens import RefreshToken
+
+from api.consumers import user_group
+from api.models import User
+
+
+def rss_mb():
+    with open('/proc/self/statm') as f:
+        return int(f.read().split()[1]) * resource.getpagesize() / 2**20
+
+
+class Command(BaseCommand):
+    help = ('Open WebSocket connections against the ASGI application in this '
+            'process, in steps, and report memory per connection, handshake '
+            'time and fan-out latency of one push to every socket.')
+
+    def add_arguments(self, parser):
+        parser.add_argument('--connections', type=int, default=2000)
+        parser.add_argument('--step', type=int, default=500)
+        parser.add_argument('--batch', type=int, default=100, help='concurrent handshakes')
+
+    def handle(self, *args, **options):
+        tag = uuid.uuid4().hex[:8]
+        user = User.objects.create_user(username=f'ws-load-{tag}', password=None)
+        try:
+            token = str(RefreshToken.for_user(user).access_token)
+            asyncio.run(self.run(user, token, options))
+        finally:
+            user.delete()
+
+    async def run(self, user, token, options):
+        from pathovision_django.asgi import application
+
+        headers = [(b'host', b'localhost'), (b'authorization', f'Bearer {token}'.encode())]
+        sockets = []
+        baseline = rss_mb()
+        self.stdout.write(f'baseline RSS {baseline:.1f} MB')
+
+        while len(sockets) < options['connections']:
+            opened = len(sockets)
+            target = min(opened + options['step'], options['connections'])
+            start = time.perf_counter()
+            while len(sockets) < target:
+                batch = [WebsocketCommunicator(application, '/ws/updates', headers=headers)
+                         for _ in range(min(options['batch'], target - len(sockets)))]
+                results = await asyncio.gather(*(c.connect() for c in batch))
+                failed = sum(1 for connected, _ in results if not connected)
+                if failed:
+                    self.stderr.write(f'{failed} handshakes rejected at {len(sockets)} open sockets')
+                    return
+                sockets.extend(batch)
+            handshake_ms = (time.perf_counter() - start) * 1000 / (target - opened)
+
+            start = time.perf_counter()
+            await get_channel_layer().group_send(
+                user_group(user.id), {'type': 'push', 'payload': {'type': 'loadtest'}})
+            await asyncio.gather(*(c.receive_json_from(timeout=30) for c in sockets))
+            fanout_ms = (time.perf_counter() - start) * 1000
+
+            rss = rss_mb()
+            self.stdout.write(
+                f'open={len(sockets):<6} rss={rss:7.1f} MB  '
+                f'per-conn={(rss - baseline) * 1024 / len(sockets):6.1f} KB  '
+                f'handshake={handshake_ms:6.2f} ms  fan-out to all={fanout_ms:8.1f} ms'
+            )
+
+        await asyncio.gather(*(c.disconnect() for c in sockets))
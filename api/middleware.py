@@ -0,0 +1,79 @@
+from contextlib import ExitStack
+
+from django.conf import settings
+from django.db import connections
+
+from . import profiling
+
+
+class QueryCountMiddleware:
+    """
+    Counts SQL statements executed while handling each request and reports the
+    total in an `X-DB-Queries` response header. Works with DEBUG off, since it
+    hooks the connection's execute wrapper instead of `connection.queries`.
+    """
+
+    def __init__(self, get_response):
+        self.get_response = get_response
+
+    def __call__(self, request):
+        counter = [0]
+
+        def count(execute, sql, params, many, context):
+            counter[0] += 1
+            return execute(sql, params, many, context)
+
+        with ExitStack() as stack:
+            for conn in connections.all():
+                stack.enter_context(conn.execute_wrapper(count))
+            response = self.get_response(request)
+        response['X-DB-Queries'] = str(counter[0])
+        return response
+
+
+class ProfilingMiddleware:
+    """
+    Opt-in (settings.PROFILING['ENABLED']) per-request profiling: phase
+    timings, query counts and duplicate queries for a sample of requests,
+    kept in a ring buffer browsable at /api/profiling. See api/profiling.py.
+    Place it first in MIDDLEWARE so the other middleware is timed too.
+    """
+
+    def __init__(self, get_response):
+        self.get_response = get_response
+
+    def __call__(self, request):
+        if not profiling.should_sample(request.path):
+            return self.get_response(request)
+
+        trace, token = profiling.start(request)
+
+        def record(execute, sql, params, many, context):
+            trace.record_query(sql, params)
+            with profiling.phase('db'):
+                return execute(sql, params, many, context)
+
+        profiler = profiling.Profiler(settings.PROFILING['PROFILER']) if profiling.store.slowest else None
+        try:
+            with ExitStack() as stack:
+                for conn in connections.all():
+                    stack.enter_context(conn.execute_wrapper(record))
+                if profiler is not None:
+                    stack.enter_context(profiler)
+                response = self.get_response(request)
+        finally:
+            profiling.stop(trace, token)
+
+        data = trace.as_dict(response.status_code)
+        keep_profile = profiler is not None and profiling.store.wants_profile(data['duration_ms'])
+        profiling.store.add(data, profiler.text() if keep_profile else None)
+        response['X-Profile-Trace'] = str(trace.id)
+        return response
+
+    def process_template_response(self, request, response):
+        # DRF renders after the view returns; time it as its own phase
+        trace = profiling.current_trace()
+        if trace is not None:
+            trace.enter('render')
+            response.add_post_render_callback(lambda r: trace.exit())
+        return response
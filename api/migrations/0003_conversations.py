@@ -0,0 +1,79 @@
+# Generated by Django 4.2.30 on 2026-10-19 06:36
+
+from django.conf import settings
+from django.db import migrations, models
+import django.db.models.deletion
+from django.db.models import Count, Max, Q
+
+
+def backfill_conversations(apps, schema_editor):
+    Message = apps.get_model('api', 'Message')
+    Conversation = apps.get_model('api', 'Conversation')
+
+    # (user, peer) -> [last message id, unread count], one aggregate per side
+    summaries = {}
+    received = Message.objects.values('recipient', 'sender').annotate(
+        last=Max('id'), unread=Count('id', filter=Q(is_read=False)))
+    for row in received.iterator():
+        summaries[(row['recipient'], row['sender'])] = [row['last'], row['unread']]
+    sent = Message.objects.values('sender', 'recipient').annotate(last=Max('id'))
+    for row in sent.iterator():
+        entry = summaries.setdefault((row['sender'], row['recipient']), [row['last'], 0])
+        entry[0] = max(entry[0], row['last'])
+
+    created = dict(Message.objects.filter(
+        id__in=[last for last, _ in summaries.values()]).values_list('id', 'created_at'))
+    Conversation.objects.bulk_create([
+        Conversation(user_id=user_id, peer_id=peer_id, last_message_id=last,
+                     last_message_at=created[last], unread_count=unread)
+        for (user_id, peer_id), (last, unread) in summaries.items()
+    ], batch_size=1000)
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('api', '0002_keyset_pagination_indexes'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='Conversation',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('last_message_at', models.DateTimeField()),
+                ('unread_count', models.PositiveIntegerField(default=0)),
+            ],
+            options={
+                'db_table': 'conversations',
+            },
+        ),
+        migrations.AddIndex(
+            model_name='message',
+            index=models.Index(fields=['recipient', 'sender', 'is_read'], name='msg_thread_unread_idx'),
+        ),
+        migrations.AddField(
+            model_name='conversation',
+            name='last_message',
+            field=models.ForeignKey(blank=True, null=True, on_delete=django.db.models.deletion.SET_NULL, related_name='+', to='api.message'),
+        ),
+        migrations.AddField(
+            model_name='conversation',
+            name='peer',
+            field=models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='+', to=settings.AUTH_USER_MODEL),
+        ),
+        migrations.AddField(
+            model_name='conversation',
+            name='user',
+            field=models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='conversations', to=settings.AUTH_USER_MODEL),
+        ),
+        migrations.AddIndex(
+            model_name='conversation',
+            index=models.Index(fields=['user', '-last_message_at', '-id'], name='conv_user_last_msg_idx'),
+        ),
+        migrations.AddConstraint(
+            model_name='conversation',
+            constraint=models.UniqueConstraint(fields=('user', 'peer'), name='conversation_user_peer_uniq'),
+        ),
+        migrations.RunPython(backfill_conversations, migrations.RunPython.noop),
+    ]
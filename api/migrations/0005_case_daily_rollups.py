@@ -0,0 +1,53 @@
+# Generated by Django 4.2.30 on 2026-10-19 06:49
+
+from django.conf import settings
+from django.db import migrations, models
+import django.db.models.deletion
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('api', '0004_user_email_lower_index'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='CaseDailyRollup',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('day', models.DateField()),
+                ('status', models.CharField(choices=[('PENDING', 'Pending'), ('ANALYZED', 'Analyzed'), ('VALIDATED', 'Validated')], max_length=20)),
+                ('case_count', models.PositiveIntegerField(default=0)),
+                ('malignant_count', models.PositiveIntegerField(default=0)),
+                ('confidence_sum', models.FloatField(default=0)),
+                ('confidence_count', models.PositiveIntegerField(default=0)),
+                ('max_updated_at', models.DateTimeField()),
+                ('stale', models.BooleanField(default=False)),
+            ],
+            options={
+                'db_table': 'case_daily_rollups',
+            },
+        ),
+        migrations.AddIndex(
+            model_name='case',
+            index=models.Index(fields=['updated_at'], name='cases_updated_idx'),
+        ),
+        migrations.AddField(
+            model_name='casedailyrollup',
+            name='user',
+            field=models.ForeignKey(blank=True, null=True, on_delete=django.db.models.deletion.SET_NULL, related_name='+', to=settings.AUTH_USER_MODEL),
+        ),
+        migrations.AddIndex(
+            model_name='casedailyrollup',
+            index=models.Index(fields=['day', 'user'], name='rollup_day_user_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='casedailyrollup',
+            index=models.Index(fields=['user', 'day'], name='rollup_user_day_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='casedailyrollup',
+            index=models.Index(fields=['-max_updated_at'], name='rollup_max_updated_idx'),
+        ),
+    ]
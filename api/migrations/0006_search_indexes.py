@@ -0,0 +1,24 @@
+from django.db import migrations
+
+from api import search
+
+
+def install(apps, schema_editor):
+    for name in ('Case', 'Message'):
+        search.install(schema_editor, apps.get_model('api', name))
+
+
+def uninstall(apps, schema_editor):
+    for name in ('Case', 'Message'):
+        search.uninstall(schema_editor, apps.get_model('api', name))
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('api', '0005_case_daily_rollups'),
+    ]
+
+    operations = [
+        migrations.RunPython(install, uninstall),
+    ]
@@ -1,4 +1,8 @@
-from django.db import models
+import uuid
+
+from django.db import IntegrityError, models, transaction
+from django.db.models import F
+from django.db.models.functions import Greatest, Lower
 from django.contrib.auth.models import AbstractUser
 
 class User(AbstractUser):
@@ -16,6 +20,52 @@ class User(AbstractUser):
     date_of_birth = models.DateField(blank=True, null=True)
     created_at = models.DateTimeField(auto_now_add=True)
     updated_at = models.DateTimeField(auto_now=True)
+    
+    class Meta(AbstractUser.Meta):
+        indexes = [
+            # Case-insensitive email login (LoginSerializer)
+            models.Index(Lower('email'), name='user_email_lower_idx'),
+        ]
+
+
+class ImageBlob(models.Model):
+    """
+    An uploaded image stored once per content hash; see api/images.py for the
+    layout under MEDIA_ROOT and the derivatives generated from it.
+    """
+    DERIVATIVE_STATUS_CHOICES = [
+        ('PENDING', 'Pending'),
+        ('READY', 'Ready'),
+        ('FAILED', 'Failed'),
+    ]
+    
+    sha256 = models.CharField(max_length=64, primary_key=True)
+    size = models.PositiveBigIntegerField()
+    content_type = models.CharField(max_length=100)
+    width = models.PositiveIntegerField(null=True, blank=True)
+    height = models.PositiveIntegerField(null=True, blank=True)
+    derivatives_status = models.CharField(max_length=10, choices=DERIVATIVE_STATUS_CHOICES, default='PENDING')
+    derivatives_error = models.TextField(blank=True)
+    created_at = models.DateTimeField(auto_now_add=True)
+    
+    class Meta:
+        db_table = 'image_blobs'
+
+
+class ImageUpload(models.Model):
+    """A resumable upload in progress; bytes land in a part file until complete."""
+    id = models.UUIDField(primary_key=True, default=uuid.uuid4, editable=False)
+    user = models.ForeignKey(User, on_delete=models.CASCADE, related_name='image_uploads')
+    size = models.PositiveBigIntegerField()
+    received = models.PositiveBigIntegerField(default=0)
+    content_type = models.CharField(max_length=100)
+    sha256 = models.CharField(max_length=64, blank=True)
+    blob = models.ForeignKey(ImageBlob, on_delete=models.SET_NULL, null=True, blank=True, related_name='+')
+    created_at = models.DateTimeField(auto_now_add=True)
+    updated_at = models.DateTimeField(auto_now=True)
+    
+    class Meta:
+        db_table = 'image_uploads'
 
 
 class Case(models.Model):
@@ -29,6 +79,7 @@ class Case(models.Model):
     title = models.CharField(max_length=255)
     description = models.TextField(blank=True)
     image_url = models.URLField()
+    image = models.ForeignKey(ImageBlob, on_delete=models.SET_NULL, null=True, blank=True, related_name='cases')
     medical_record_number = models.CharField(max_length=100, blank=True, null=True)
     patient_age = models.IntegerField(blank=True, null=True)
     patient_gender = models.CharField(max_length=10, blank=True, null=True)
@@ -40,8 +91,23 @@ class Case(models.Model):
     created_at = models.DateTimeField(auto_now_add=True)
     updated_at = models.DateTimeField(auto_now=True)
     
+    @classmethod
+    def from_db(cls, db, field_names, values):
+        instance = super().from_db(db, field_names, values)
+        # Lets post_save handlers tell status transitions and owner changes from other edits
+        instance._loaded_status = instance.__dict__.get('status')
+        instance._loaded_created_by_id = instance.__dict__.get('created_by_id')
+        return instance
+    
     class Meta:
         db_table = 'cases'
+        indexes = [
+            # Keyset pagination on (created_at, id); see api/pagination.py
+            models.Index(fields=['-created_at', '-id'], name='cases_created_id_idx'),
+            models.Index(fields=['created_by', '-created_at', '-id'], name='cases_owner_created_id_idx'),
+            # Incremental rollup refresh; see api/analytics.py
+            models.Index(fields=['updated_at'], name='cases_updated_idx'),
+        ]
 
 
 class Message(models.Model):
@@ -53,4 +119,174 @@ class Message(models.Model):
     
     class Meta:
         db_table = 'messages'
+        indexes = [
+            models.Index(fields=['recipient', '-created_at', '-id'], name='msg_recipient_created_id_idx'),
+            models.Index(fields=['sender', '-created_at', '-id'], name='msg_sender_created_id_idx'),
+            models.Index(fields=['recipient', 'sender', 'is_read'], name='msg_thread_unread_idx'),
+        ]
+    
+    @classmethod
+    def from_db(cls, db, field_names, values):
+        instance = super().from_db(db, field_names, values)
+        # Remember the stored read flag and participants so save() can keep summaries in sync
+        instance._loaded_is_read = instance.__dict__.get('is_read')
+        instance._loaded_participants = (instance.__dict__.get('sender_id'), instance.__dict__.get('recipient_id'))
+        return instance
+    
+    def save(self, *args, **kwargs):
+        adding = self._state.adding
+        was_read = getattr(self, '_loaded_is_read', None)
+        participants = getattr(self, '_loaded_participants', None)
+        with transaction.atomic(using=kwargs.get('using')):
+            super().save(*args, **kwargs)
+            if adding:
+                Conversation.objects.record_message(self)
+            elif participants is not None and participants != (self.sender_id, self.recipient_id):
+                # Moved to another thread: both the old and the new pair change
+                Conversation.objects.rebuild_pair(*participants)
+                Conversation.objects.rebuild_pair(self.sender_id, self.recipient_id)
+            elif was_read is not None and was_read != self.is_read:
+                Conversation.objects.adjust_unread(self.recipient_id, self.sender_id, -1 if self.is_read else 1)
+        self._loaded_is_read = self.is_read
+        self._loaded_participants = (self.sender_id, self.recipient_id)
+    
+    def delete(self, *args, **kwargs):
+        with transaction.atomic(using=kwargs.get('using')):
+            deleted = super().delete(*args, **kwargs)
+            # The summaries may point at (and count) this message; fall back to the previous one
+            Conversation.objects.rebuild_pair(self.sender_id, self.recipient_id)
+        return deleted
+
+
+class ConversationManager(models.Manager):
+    def record_message(self, message):
+        """Bump both participants' summaries for a newly created message."""
+        sides = [(message.recipient_id, message.sender_id, 0 if message.is_read else 1)]
+        if message.sender_id != message.recipient_id:
+            sides.append((message.sender_id, message.recipient_id, 0))
+        for user_id, peer_id, unread in sides:
+            changes = {
+                'last_message': message,
+                'last_message_at': message.created_at,
+                'unread_count': F('unread_count') + unread,
+            }
+            if self.filter(user_id=user_id, peer_id=peer_id).update(**changes):
+                continue
+            try:
+                with transaction.atomic():
+                    self.create(user_id=user_id, peer_id=peer_id, last_message=message,
+                                last_message_at=message.created_at, unread_count=unread)
+            except IntegrityError:
+                # Another request created the row first; apply our delta to it
+                self.filter(user_id=user_id, peer_id=peer_id).update(**changes)
+    
+    def adjust_unread(self, user_id, peer_id, delta):
+        self.filter(user_id=user_id, peer_id=peer_id).update(
+            unread_count=Greatest(F('unread_count') + delta, 0)
+        )
+    
+    def rebuild(self, user_ids):
+        """
+        Recompute the summaries owned by `user_ids` from the messages table,
+        for messages written without Message.save() (e.g. bulk_create).
+        """
+        user_ids = list(user_ids)
+        summaries = {}  # (user, peer) -> [last message id, unread count]
+        received = Message.objects.filter(recipient_id__in=user_ids).values('recipient', 'sender').annotate(
+            last=models.Max('id'), unread=models.Count('id', filter=models.Q(is_read=False))).order_by()
+        for row in received.iterator():
+            summaries[(row['recipient'], row['sender'])] = [row['last'], row['unread']]
+        sent = Message.objects.filter(sender_id__in=user_ids).values('sender', 'recipient').annotate(
+            last=models.Max('id')).order_by()
+        for row in sent.iterator():
+            entry = summaries.setdefault((row['sender'], row['recipient']), [row['last'], 0])
+            entry[0] = max(entry[0], row['last'])
+        
+        last_ids = [last for last, _ in summaries.values()]
+        created = {}
+        for i in range(0, len(last_ids), 5000):
+            created.update(Message.objects.filter(id__in=last_ids[i:i + 5000]).values_list('id', 'created_at'))
+        with transaction.atomic():
+            self.filter(user_id__in=user_ids).delete()
+            self.bulk_create([
+                Conversation(user_id=user_id, peer_id=peer_id, last_message_id=last,
+                             last_message_at=created[last], unread_count=unread)
+                for (user_id, peer_id), (last, unread) in summaries.items()
+            ], batch_size=1000)
+        return len(summaries)
+    
+    def rebuild_pair(self, user_id, peer_id):
+        """Recompute both sides of the thread between two users; rows without messages are dropped."""
+        for user, peer in {(user_id, peer_id), (peer_id, user_id)}:
+            thread = Message.objects.filter(
+                models.Q(recipient_id=user, sender_id=peer) | models.Q(sender_id=user, recipient_id=peer))
+            last = thread.order_by('-id').values('id', 'created_at').first()
+            if last is None:
+                self.filter(user_id=user, peer_id=peer).delete()
+                continue
+            unread = Message.objects.filter(recipient_id=user, sender_id=peer, is_read=False).count()
+            self.update_or_create(user_id=user, peer_id=peer, defaults={
+                'last_message_id': last['id'], 'last_message_at': last['created_at'], 'unread_count': unread,
+            })
+    
+    def mark_read(self, user_id, peer_id):
+        """Mark every unread message from `peer_id` to `user_id` read; returns the count."""
+        with transaction.atomic():
+            count = Message.objects.filter(recipient_id=user_id, sender_id=peer_id, is_read=False).update(is_read=True)
+            self.filter(user_id=user_id, peer_id=peer_id).update(unread_count=0)
+        return count
+
 
+class Conversation(models.Model):
+    """
+    Denormalized per-user view of a message thread with one peer.
+
+    Maintained by Message.save()/delete() and ConversationManager.mark_read()
+    in the same transaction as the message write, so listing conversations
+    never has to scan the messages table. Writes that bypass them (bulk_create,
+    update(), QuerySet.delete()) are repaired with ConversationManager.rebuild()
+    / `manage.py rebuild_conversations`.
+    """
+    user = models.ForeignKey(User, on_delete=models.CASCADE, related_name='conversations')
+    peer = models.ForeignKey(User, on_delete=models.CASCADE, related_name='+')
+    last_message = models.ForeignKey(Message, on_delete=models.SET_NULL, null=True, blank=True, related_name='+')
+    last_message_at = models.DateTimeField()
+    unread_count = models.PositiveIntegerField(default=0)
+    
+    objects = ConversationManager()
+    
+    class Meta:
+        db_table = 'conversations'
+        constraints = [
+            models.UniqueConstraint(fields=['user', 'peer'], name='conversation_user_peer_uniq'),
+        ]
+        indexes = [
+            models.Index(fields=['user', '-last_message_at', '-id'], name='conv_user_last_msg_idx'),
+        ]
+
+
+class CaseDailyRollup(models.Model):
+    """
+    Case counts per creation day, owner and status, kept for the analytics
+    endpoints. Rebuilt incrementally by api.analytics.refresh_rollups() from
+    `Case.updated_at`; `stale` marks buckets whose cases were deleted since.
+    """
+    day = models.DateField()
+    # SET_NULL like Case.created_by: rows for the same bucket may then repeat,
+    # which the analytics queries tolerate since they always sum
+    user = models.ForeignKey(User, on_delete=models.SET_NULL, null=True, blank=True, related_name='+')
+    status = models.CharField(max_length=20, choices=Case.STATUS_CHOICES)
+    case_count = models.PositiveIntegerField(default=0)
+    malignant_count = models.PositiveIntegerField(default=0)
+    confidence_sum = models.FloatField(default=0)
+    confidence_count = models.PositiveIntegerField(default=0)
+    max_updated_at = models.DateTimeField()
+    stale = models.BooleanField(default=False)
+    
+    class Meta:
+        db_table = 'case_daily_rollups'
+        indexes = [
+            models.Index(fields=['day', 'user'], name='rollup_day_user_idx'),
+            models.Index(fields=['user', 'day'], name='rollup_user_day_idx'),
+            models.Index(fields=['-max_updated_at'], name='rollup_max_updated_idx'),
+        ]
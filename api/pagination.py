@@ -0,0 +1,167 @@
+from base64 import b64decode, b64encode
+from collections import OrderedDict
+from urllib import parse
+
+from django.db.models import Q
+from django.utils.dateparse import parse_datetime
+from rest_framework.exceptions import NotFound
+from rest_framework.pagination import BasePagination
+from rest_framework.response import Response
+from rest_framework.settings import api_settings
+from rest_framework.utils.urls import replace_query_param
+
+
+class KeysetCursorPagination(BasePagination):
+    """
+    Keyset pagination on (`timestamp_field`, id), newest first.
+
+    Each page is a single indexed range scan (`WHERE (timestamp, id) < cursor
+    ORDER BY timestamp DESC, id DESC LIMIT n+1`), so fetching page 500 costs
+    the same as page 1 and no COUNT(*) is issued. The response keeps the
+    `next` / `previous` / `results` envelope of DRF's built-in paginators.
+    """
+    cursor_query_param = 'cursor'
+    page_size_query_param = 'page_size'
+    page_size = api_settings.PAGE_SIZE
+    max_page_size = 100
+    invalid_cursor_message = 'Invalid cursor'
+    timestamp_field = 'created_at'
+
+    def paginate_queryset(self, queryset, request, view=None):
+        self.request = request
+        self.base_url = request.build_absolute_uri()
+        self.page_size = self.get_page_size(request)
+        self.cursor = self.decode_cursor(request)
+
+        if self.cursor is None:
+            timestamp, pk, reverse = None, None, False
+        else:
+            timestamp, pk, reverse = self.cursor
+
+        field = self.timestamp_field
+        if reverse:
+            queryset = queryset.order_by(field, 'id')
+            if timestamp is not None:
+                queryset = queryset.filter(
+                    Q(**{f'{field}__gt': timestamp}) | Q(**{field: timestamp, 'id__gt': pk})
+                )
+        else:
+            queryset = queryset.order_by(f'-{field}', '-id')
+            if timestamp is not None:
+                queryset = queryset.filter(
+                    Q(**{f'{field}__lt': timestamp}) | Q(**{field: timestamp, 'id__lt': pk})
+                )
+
+        results = list(queryset[:self.page_size + 1])
+        has_following = len(results) > self.page_size
+        self.page = results[:self.page_size]
+        if reverse:
+            self.page.reverse()
+
+        # Moving forwards there is a previous page whenever we started from a
+        # cursor; moving backwards there is always a next page (the one we
+        # came from). The other direction depends on the extra row fetched.
+        if reverse:
+            self.has_next = timestamp is not None
+            self.has_previous = has_following
+        else:
+            self.has_next = has_following
+            self.has_previous = timestamp is not None
+
+        return self.page
+
+    def get_page_size(self, request):
+        if self.page_size_query_param:
+            try:
+                size = int(request.query_params[self.page_size_query_param])
+                if size > 0:
+                    return min(size, self.max_page_size)
+            except (KeyError, ValueError):
+                pass
+        return self.page_size
+
+    def get_position(self, item):
+        if isinstance(item, dict):
+            return item[self.timestamp_field], item['id']
+        return getattr(item, self.timestamp_field), item.id
+
+    def get_next_link(self):
+        if not self.has_next or not self.page:
+            return None
+        timestamp, pk = self.get_position(self.page[-1])
+        return self.encode_cursor(timestamp, pk, reverse=False)
+
+    def get_previous_link(self):
+        if not self.has_previous or not self.page:
+            return None
+        timestamp, pk = self.get_position(self.page[0])
+        return self.encode_cursor(timestamp, pk, reverse=True)
+
+    def decode_cursor(self, request):
+        encoded = request.query_params.get(self.cursor_query_param)
+        if encoded is None:
+            return None
+        try:
+            querystring = b64decode(encoded.encode('ascii')).decode('ascii')
+            tokens = parse.parse_qs(querystring, keep_blank_values=True)
+            timestamp = self.parse_position_value(tokens['t'][0])
+            pk = int(tokens['i'][0])
+            reverse = bool(int(tokens.get('r', ['0'])[0]))
+        except (TypeError, ValueError, KeyError, IndexError):
+            raise NotFound(self.invalid_cursor_message)
+        if timestamp is None:
+            raise NotFound(self.invalid_cursor_message)
+        return timestamp, pk, reverse
+
+    def parse_position_value(self, value):
+        return parse_datetime(value)
+
+    def format_position_value(self, value):
+        return value.isoformat()
+
+    def encode_cursor(self, timestamp, pk, reverse):
+        tokens = {'t': self.format_position_value(timestamp), 'i': pk}
+        if reverse:
+            tokens['r'] = '1'
+        querystring = parse.urlencode(tokens, doseq=True)
+        encoded = b64encode(querystring.encode('ascii')).decode('ascii')
+        return replace_query_param(self.base_url, self.cursor_query_param, encoded)
+
+    def get_paginated_response(self, data):
+        return Response(OrderedDict([
+            ('next', self.get_next_link()),
+            ('previous', self.get_previous_link()),
+            ('results', data),
+        ]))
+
+    def get_paginated_response_schema(self, schema):
+        return {
+            'type': 'object',
+            'required': ['results'],
+            'properties': {
+                'next': {'type': 'string', 'nullable': True, 'format': 'uri'},
+                'previous': {'type': 'string', 'nullable': True, 'format': 'uri'},
+                'results': schema,
+            },
+        }
+
+
+class ConversationCursorPagination(KeysetCursorPagination):
+    timestamp_field = 'last_message_at'
+
+
+class SearchRankCursorPagination(KeysetCursorPagination):
+    """
+    Keyset pages of search results, best `rank` first (see api/search.py).
+
+    The cursor stores `repr()` of the rank, which round-trips a double
+    exactly; search() returns rank as double precision on every backend so
+    the `rank = X` tie-break matches the boundary row.
+    """
+    timestamp_field = 'rank'
+
+    def parse_position_value(self, value):
+        return float(value)
+
+    def format_position_value(self, value):
+        return repr(value)
@@ -0,0 +1,18 @@
+from rest_framework.permissions import BasePermission
+
+from .models import Case
+
+
+class IsAdminRole(BasePermission):
+    """Users with the ADMIN role or Django staff (both read from the cached user row)."""
+
+    def has_permission(self, request, view):
+        user = request.user
+        return bool(user and user.is_authenticated and (getattr(user, 'role', None) == 'ADMIN' or user.is_staff))
+
+
+def visible_cases(user):
+    """Cases `user` may read: the CaseViewSet queryset and WebSocket case subscriptions."""
+    if not (user and user.is_authenticated):
+        return Case.objects.none()
+    return Case.objects.all()
@@ -0,0 +1,239 @@
+"""
+Opt-in request profiling (settings.PROFILING, see ProfilingMiddleware).
+
+Each sampled request gets a Trace in a context variable. Time is attributed
+to the innermost open phase, so the phases of a trace add up to its total:
+
+- `db`: SQL execution, via the connection's execute wrapper
+- `auth`: JWT decoding (StatelessJWTAuthentication)
+- `serialize`: DRF `serializer.data` and the `.values()` fast path
+- `render`: turning the DRF Response into JSON bytes
+- `ml`: the outbound call to the ML service in CaseViewSet.analyze
+- `view`: everything else
+
+Finished traces go into a per-process ring buffer; when a profiler is
+configured, the slowest requests also keep cProfile (or pyinstrument) output.
+"""
+import cProfile
+import heapq
+import io
+import itertools
+import pstats
+import random
+import threading
+import time
+from collections import Counter, deque
+from contextlib import contextmanager
+from contextvars import ContextVar
+
+from django.conf import settings
+from django.utils import timezone
+
+_current = ContextVar('profiling_trace', default=None)
+_ids = itertools.count(1)
+
+
+class Trace:
+    def __init__(self, method, path):
+        self.id = next(_ids)
+        self.method = method
+        self.path = path
+        self.started_at = timezone.now()
+        self.phases = Counter()
+        self.queries = Counter()  # (sql, params) -> executions
+        self._stack = []
+        self._start = time.perf_counter()
+        self.duration = None
+
+    def enter(self, name):
+        now = time.perf_counter()
+        if self._stack:
+            parent = self._stack[-1]
+            self.phases[parent[0]] += now - parent[1]
+        self._stack.append([name, now])
+
+    def exit(self):
+        now = time.perf_counter()
+        name, start = self._stack.pop()
+        self.phases[name] += now - start
+        if self._stack:
+            self._stack[-1][1] = now
+
+    def finish(self):
+        while self._stack:
+            self.exit()
+        self.duration = time.perf_counter() - self._start
+
+    def record_query(self, sql, params):
+        try:
+            key = (sql, repr(params))
+        except Exception:
+            key = (sql, '?')
+        self.queries[key] += 1
+
+    def as_dict(self, status_code=None):
+        by_sql = Counter()
+        for (sql, _), count in self.queries.items():
+            by_sql[sql] += count
+        limit = settings.PROFILING['MAX_REPORTED_QUERIES']
+        return {
+            'id': self.id,
+            'method': self.method,
+            'path': self.path,
+            'status': status_code,
+            'started_at': self.started_at.isoformat(),
+            'duration_ms': round(self.duration * 1000, 3),
+            'phases_ms': {name: round(seconds * 1000, 3) for name, seconds in self.phases.most_common()},
+            'queries': sum(self.queries.values()),
+            # Same statement and parameters more than once: cacheable or a bug
+            'duplicate_queries': [
+                {'sql': sql, 'params': params, 'count': count}
+                for (sql, params), count in self.queries.most_common(limit) if count > 1
+            ],
+            # Same statement with different parameters: the usual N+1 shape
+            'repeated_queries': [
+                {'sql': sql, 'count': count} for sql, count in by_sql.most_common(limit) if count > 1
+            ],
+        }
+
+
+def current_trace():
+    return _current.get()
+
+
+@contextmanager
+def phase(name):
+    """Attribute the time spent in the block to `name` on the current trace."""
+    trace = _current.get()
+    if trace is None:
+        yield
+        return
+    trace.enter(name)
+    try:
+        yield
+    finally:
+        trace.exit()
+
+
+class TraceStore:
+    """Ring buffer of finished traces plus profiler output for the slowest N."""
+
+    def __init__(self, size, slowest):
+        self.traces = deque(maxlen=size)
+        self.slowest = slowest
+        self._profiles = []  # min-heap of (duration, id, text)
+        self._lock = threading.Lock()
+
+    def wants_profile(self, duration):
+        with self._lock:
+            return len(self._profiles) < self.slowest or duration > self._profiles[0][0]
+
+    def add(self, data, profile_text=None):
+        with self._lock:
+            self.traces.append(data)
+            if profile_text is not None and self.slowest:
+                entry = (data['duration_ms'], data['id'], profile_text)
+                if len(self._profiles) < self.slowest:
+                    heapq.heappush(self._profiles, entry)
+                elif entry > self._profiles[0]:
+                    heapq.heapreplace(self._profiles, entry)
+
+    def list(self):
+        with self._lock:
+            profiled = {trace_id for _, trace_id, _ in self._profiles}
+            return [dict(data, has_profile=data['id'] in profiled) for data in reversed(self.traces)]
+
+    def profile(self, trace_id):
+        with self._lock:
+            for _, entry_id, text in self._profiles:
+                if entry_id == trace_id:
+                    return text
+        return None
+
+    def clear(self):
+        with self._lock:
+            self.traces.clear()
+            self._profiles.clear()
+
+
+store = TraceStore(settings.PROFILING['BUFFER_SIZE'], settings.PROFILING['PROFILE_SLOWEST'])
+
+
+def should_sample(path):
+    config = settings.PROFILING
+    if not config['ENABLED'] or any(path.startswith(prefix) for prefix in config['EXCLUDE_PATHS']):
+        return False
+    return random.random() < config['SAMPLE_RATE']
+
+
+def start(request):
+    trace = Trace(request.method, request.get_full_path())
+    trace.enter('view')
+    return trace, _current.set(trace)
+
+
+def stop(trace, token):
+    trace.finish()
+    _current.reset(token)
+
+
+class Profiler:
+    """cProfile, or pyinstrument when PROFILING['PROFILER'] asks for it."""
+
+    def __init__(self, kind):
+        self.kind = kind
+        self._profiler = None
+
+    def __enter__(self):
+        try:
+            if self.kind == 'pyinstrument':
+                from pyinstrument import Profiler as Pyinstrument
+                self._profiler = Pyinstrument()
+                self._profiler.start()
+            else:
+                self._profiler = cProfile.Profile()
+                self._profiler.enable()
+        except (ImportError, ValueError, RuntimeError):
+            # Not installed, or another profiler already owns this interpreter
+            self._profiler = None
+        return self
+
+    def __exit__(self, *exc):
+        if self._profiler is None:
+            return
+        if self.kind == 'pyinstrument':
+            self._profiler.stop()
+        else:
+            self._profiler.disable()
+
+    def text(self):
+        if self._profiler is None:
+            return None
+        if self.kind == 'pyinstrument':
+            return self._profiler.output_text(unicode=True)
+        out = io.StringIO()
+        pstats.Stats(self._profiler, stream=out).sort_stats('cumulative').print_stats(40)
+        return out.getvalue()
+
+
+_installed = False
+
+
+def install():
+    """
+    Time DRF's `serializer.data` as the `serialize` phase. Called from
+    ApiConfig.ready() only when profiling is enabled, so the default
+    configuration runs DRF unmodified.
+    """
+    global _installed
+    if _installed:
+        return
+    from rest_framework.serializers import BaseSerializer
+
+    data = BaseSerializer.data
+
+    def timed_data(self):
+        with phase('serialize'):
+            return data.fget(self)
+    BaseSerializer.data = property(timed_data)
+    _installed = True
@@ -0,0 +1,123 @@
+"""
+Full-text search over cases and messages.
+
+PostgreSQL: GIN expression indexes over the same `to_tsvector()` expressions
+used when querying, so the index is maintained by the database on every
+INSERT/UPDATE (including bulk_create) with no extra column to keep in sync.
+
+SQLite (local runs and tests): FTS5 external-content tables fed by triggers.
+SQLite migrations that rebuild `cases` or `messages` drop those triggers;
+call `install()` again afterwards (it is idempotent).
+
+Results carry a `rank` annotation (double precision), higher is better on both backends.
+"""
+import re
+
+from django.contrib.postgres.indexes import GinIndex
+from django.contrib.postgres.search import SearchQuery, SearchRank, SearchVector
+from django.db import connections
+from django.db.models import FloatField, Q, Value
+from django.db.models.expressions import RawSQL
+from django.db.models.functions import Cast
+
+SEARCH_CONFIG = 'english'
+
+CASE_VECTOR = (
+    SearchVector('title', weight='A', config=SEARCH_CONFIG)
+    + SearchVector('diagnosis', 'medical_record_number', weight='B', config=SEARCH_CONFIG)
+    + SearchVector('description', weight='C', config=SEARCH_CONFIG)
+)
+MESSAGE_VECTOR = SearchVector('content', config=SEARCH_CONFIG)
+
+# db_table -> (index name, tsvector expression, FTS5 columns, FTS5 bm25 column weights)
+INDEXES = {
+    'cases': ('cases_search_idx', CASE_VECTOR,
+              ('title', 'description', 'diagnosis', 'medical_record_number'), (10.0, 1.0, 4.0, 4.0)),
+    'messages': ('messages_search_idx', MESSAGE_VECTOR, ('content',), (1.0,)),
+}
+
+
+def _fts_statements(table):
+    _, _, columns, _ = INDEXES[table]
+    fts = f'{table}_fts'
+    cols = ', '.join(columns)
+    new = ', '.join(f'new.{c}' for c in columns)
+    old = ', '.join(f'old.{c}' for c in columns)
+    return [
+        f"CREATE VIRTUAL TABLE IF NOT EXISTS {fts} USING fts5({cols}, content='{table}', "
+        f"content_rowid='id', tokenize='porter unicode61')",
+        f"CREATE TRIGGER IF NOT EXISTS {fts}_ai AFTER INSERT ON {table} BEGIN "
+        f"INSERT INTO {fts}(rowid, {cols}) VALUES (new.id, {new}); END",
+        f"CREATE TRIGGER IF NOT EXISTS {fts}_ad AFTER DELETE ON {table} BEGIN "
+        f"INSERT INTO {fts}({fts}, rowid, {cols}) VALUES ('delete', old.id, {old}); END",
+        f"CREATE TRIGGER IF NOT EXISTS {fts}_au AFTER UPDATE OF {cols} ON {table} BEGIN "
+        f"INSERT INTO {fts}({fts}, rowid, {cols}) VALUES ('delete', old.id, {old}); "
+        f"INSERT INTO {fts}(rowid, {cols}) VALUES (new.id, {new}); END",
+        f"INSERT INTO {fts}({fts}) VALUES ('rebuild')",
+    ]
+
+
+def install(schema_editor, model):
+    """Create the search index for `model` (Case or Message) on this backend."""
+    table = model._meta.db_table
+    vendor = schema_editor.connection.vendor
+    if vendor == 'postgresql':
+        name, vector, _, _ = INDEXES[table]
+        schema_editor.add_index(model, GinIndex(vector, name=name))
+    elif vendor == 'sqlite':
+        for statement in _fts_statements(table):
+            schema_editor.execute(statement)
+
+
+def uninstall(schema_editor, model):
+    table = model._meta.db_table
+    vendor = schema_editor.connection.vendor
+    if vendor == 'postgresql':
+        name, vector, _, _ = INDEXES[table]
+        schema_editor.remove_index(model, GinIndex(vector, name=name))
+    elif vendor == 'sqlite':
+        for suffix in ('_ai', '_ad', '_au'):
+            schema_editor.execute(f'DROP TRIGGER IF EXISTS {table}_fts{suffix}')
+        schema_editor.execute(f'DROP TABLE IF EXISTS {table}_fts')
+
+
+def _fts5_query(text):
+    # Every word must match; quoting keeps FTS5 operators in user input inert
+    return ' '.join('"%s"' % word for word in re.findall(r'\w+', text))
+
+
+def search(queryset, text):
+    """
+    Filter `queryset` (of Case or Message) to rows matching `text` and
+    annotate `rank`. Backends without a full-text index fall back to
+    case-insensitive substring matching with a constant rank.
+    """
+    model = queryset.model
+    table = model._meta.db_table
+    vendor = connections[queryset.db].vendor
+    _, vector, columns, weights = INDEXES[table]
+
+    if vendor == 'postgresql':
+        query = SearchQuery(text, search_type='websearch', config=SEARCH_CONFIG)
+        # ts_rank() is float4; as float8 the value round-trips exactly through
+        # the float cursor of SearchRankCursorPagination, so ties compare equal
+        return queryset.alias(document=vector).filter(document=query).annotate(
+            rank=Cast(SearchRank(vector, query), FloatField()))
+
+    if vendor == 'sqlite':
+        match = _fts5_query(text)
+        if not match:
+            return queryset.none()
+        fts = f'{table}_fts'
+        bm25 = ', '.join(str(w) for w in weights)
+        return queryset.filter(
+            id__in=RawSQL(f'SELECT rowid FROM {fts} WHERE {fts} MATCH %s', [match])
+        ).annotate(rank=RawSQL(
+            f'SELECT -bm25({fts}, {bm25}) FROM {fts} WHERE {fts} MATCH %s AND {fts}.rowid = {table}.id',
+            [match], output_field=FloatField(),
+        ))
+
+    matches = Q()
+    for column in columns:
+        matches |= Q(**{f'{column}__icontains': text})
+    return queryset.filter(matches).annotate(rank=Value(0.0, output_field=FloatField()))
@@ -1,6 +1,11 @@
+import re
 from rest_framework import serializers
-from .models import User, Case, Message
-from django.contrib.auth import authenticate
+from .models import User, Case, Message, Conversation, ImageBlob, ImageUpload
+from django.conf import settings
+from django.urls import reverse
+from django.db.models.functions import Lower
+from rest_framework_simplejwt.serializers import TokenObtainPairSerializer
+from .authentication import authenticate_bounded
 
 class UserDataSerializer(serializers.ModelSerializer):
     """
@@ -93,24 +98,21 @@ class LoginSerializer(serializers.Serializer):
     password = serializers.CharField(write_only=True)
     
     def validate(self, data):
-        from .models import User
-        
         # Support both username and email for login
         identifier = data.get('username') or data.get('email')
         if not identifier:
             raise serializers.ValidationError("Username or email is required")
         
-        # If email is provided, look up the username
+        username = identifier
         if '@' in identifier:
-            try:
-                user_obj = User.objects.get(email=identifier)
-                username = user_obj.username
-            except User.DoesNotExist:
-                raise serializers.ValidationError("Invalid credentials")
-        else:
-            username = identifier
+            # Case-insensitive, served by the LOWER(email) index. An unknown
+            # email still goes through authenticate(), which pays one hash and
+            # sends user_login_failed, so timing does not reveal accounts
+            username = User.objects.annotate(email_lower=Lower('email')).filter(
+                email_lower=identifier.lower()
+            ).order_by('id').values_list('username', flat=True).first() or identifier
         
-        user = authenticate(username=username, password=data['password'])
+        user = authenticate_bounded(self.context.get('request'), username=username, password=data['password'])
         if not user:
             raise serializers.ValidationError("Invalid credentials")
         data['user'] = user
@@ -122,6 +124,74 @@ class CaseSerializer(serializers.ModelSerializer):
         model = Case
         fields = '__all__'
         read_only_fields = ['created_at', 'updated_at']
+        extra_kwargs = {'image_url': {'required': False}}
+    
+    def validate_image(self, value):
+        # Knowing a sha256 is not proof of having the image: attach only your own uploads
+        request = self.context.get('request')
+        if value is None or request is None or (self.instance is not None and self.instance.image_id == value.pk):
+            return value
+        if not ImageUpload.objects.filter(user_id=request.user.id, blob_id=value.pk).exists():
+            raise serializers.ValidationError("Upload this image first (POST /api/uploads/)")
+        return value
+    
+    def validate(self, data):
+        # An uploaded image stands in for image_url, which then points at it
+        if self.instance is None and not data.get('image_url'):
+            if not data.get('image'):
+                raise serializers.ValidationError({"image_url": "Provide image_url or an uploaded image"})
+            url = reverse('image-detail', args=[data['image'].sha256])
+            request = self.context.get('request')
+            data['image_url'] = request.build_absolute_uri(url) if request else url
+        return data
+
+
+class ImageBlobSerializer(serializers.ModelSerializer):
+    urls = serializers.SerializerMethodField()
+    
+    class Meta:
+        model = ImageBlob
+        fields = ['sha256', 'size', 'content_type', 'width', 'height', 'derivatives_status', 'urls']
+    
+    def get_urls(self, obj):
+        request = self.context.get('request')
+        urls = {
+            'original': reverse('image-detail', args=[obj.sha256]),
+            'model': reverse('image-model', args=[obj.sha256]),
+            'thumb': reverse('image-thumb', args=[obj.sha256]),
+        }
+        if request is not None:
+            urls = {name: request.build_absolute_uri(url) for name, url in urls.items()}
+        return urls
+
+
+class ImageUploadSerializer(serializers.ModelSerializer):
+    complete = serializers.SerializerMethodField()
+    image = ImageBlobSerializer(source='blob', read_only=True)
+    
+    class Meta:
+        model = ImageUpload
+        fields = ['id', 'size', 'received', 'content_type', 'sha256', 'complete', 'image', 'created_at']
+        read_only_fields = ['received', 'created_at']
+    
+    def get_complete(self, obj):
+        return obj.blob_id is not None
+    
+    def validate_size(self, value):
+        if not 0 < value <= settings.IMAGE_UPLOAD_MAX_SIZE:
+            raise serializers.ValidationError(f"Must be between 1 and {settings.IMAGE_UPLOAD_MAX_SIZE} bytes")
+        return value
+    
+    def validate_content_type(self, value):
+        if not value.startswith('image/'):
+            raise serializers.ValidationError("Only image/* uploads are accepted")
+        return value
+    
+    def validate_sha256(self, value):
+        value = value.lower()
+        if value and not re.fullmatch(r'[0-9a-f]{64}', value):
+            raise serializers.ValidationError("Expected a hex SHA-256 digest")
+        return value
 
 
 class MessageSerializer(serializers.ModelSerializer):
@@ -132,3 +202,22 @@ class MessageSerializer(serializers.ModelSerializer):
         model = Message
         fields = ['id', 'sender', 'sender_username', 'recipient', 'recipient_username', 'content', 'is_read', 'created_at']
         read_only_fields = ['created_at']
+
+
+class ConversationSerializer(serializers.ModelSerializer):
+    other_user = UserDataSerializer(source='peer', read_only=True)
+    last_message = MessageSerializer(read_only=True)
+    last_message_time = serializers.DateTimeField(source='last_message_at', read_only=True)
+    
+    class Meta:
+        model = Conversation
+        fields = ['id', 'other_user', 'last_message', 'last_message_time', 'unread_count']
+
+
+class RoleTokenObtainPairSerializer(TokenObtainPairSerializer):
+    """/api/token/ pair that also carries the `role` claim, like the tokens from login"""
+    @classmethod
+    def get_token(cls, user):
+        token = super().get_token(user)
+        token['role'] = user.role
+        return token
@@ -0,0 +1,66 @@
+from django.db import transaction
+from django.db.models.signals import post_delete, post_save
+from django.dispatch import receiver
+
+from . import analytics, cache
+from .authentication import user_cache
+from .consumers import broadcast, case_group, user_group
+from .models import Case, Message, User
+from .serializers import CaseSerializer, MessageSerializer
+
+
+@receiver(post_save, sender=User)
+@receiver(post_delete, sender=User)
+def invalidate_user_response(sender, instance, **kwargs):
+    cache.invalidate('user', instance.pk)
+    user_cache.delete(instance.pk)
+
+
+@receiver(post_save, sender=Case)
+@receiver(post_delete, sender=Case)
+def invalidate_case_response(sender, instance, **kwargs):
+    cache.invalidate('case', instance.pk)
+
+
+@receiver(post_delete, sender=Case)
+def mark_case_rollup_stale(sender, instance, **kwargs):
+    analytics.mark_stale(instance)
+
+
+@receiver(post_save, sender=Case)
+def mark_previous_owner_rollup_stale(sender, instance, created, **kwargs):
+    # The new owner's bucket is picked up through updated_at; the old one would keep counting the case
+    previous = getattr(instance, '_loaded_created_by_id', instance.created_by_id)
+    instance._loaded_created_by_id = instance.created_by_id
+    if not created and previous != instance.created_by_id:
+        analytics.mark_bucket_stale(instance.created_at, previous)
+
+
+@receiver(post_save, sender=Message)
+def push_new_message(sender, instance, created, **kwargs):
+    if not created:
+        return
+    payload = {'type': 'message.created', 'message': MessageSerializer(instance).data}
+    recipients = {instance.recipient_id, instance.sender_id}
+
+    def send():
+        for user_id in recipients:
+            broadcast(user_group(user_id), payload)
+    transaction.on_commit(send)
+
+
+@receiver(post_save, sender=Case)
+def push_case_status(sender, instance, created, **kwargs):
+    previous = getattr(instance, '_loaded_status', None)
+    instance._loaded_status = instance.status
+    if created or previous == instance.status:
+        return
+    payload = {'type': 'case.status', 'previous_status': previous, 'case': CaseSerializer(instance).data}
+    groups = [case_group(instance.pk)]
+    if instance.created_by_id is not None:
+        groups.append(user_group(instance.created_by_id))
+
+    def send():
+        for group in groups:
+            broadcast(group, payload)
+    transaction.on_commit(send)
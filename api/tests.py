@@ -1,3 +1,578 @@
-from django.test import TestCase
+import hashlib
+import io
+import json
+import os
+import tempfile
+from datetime import timedelta
+from unittest import mock
 
-# Create your tests here.
+from django.core.cache import cache
+from django.core.files.uploadedfile import SimpleUploadedFile
+from django.db import connection
+from django.test import override_settings
+from django.test.utils import CaptureQueriesContext
+from django.utils import timezone
+from rest_framework import status
+from rest_framework.test import APITestCase, APITransactionTestCase
+
+from . import factories
+from .authentication import token_for_user, user_cache
+from .importers import import_cases, iter_rows
+from .images import part_path
+from .management.commands.bench_api import Command as BenchAPICommand
+from .models import Case, Conversation, ImageBlob, ImageUpload, Message, User
+
+FAST_HASHERS = ['django.contrib.auth.hashers.MD5PasswordHasher']
+
+
+class APITestMixin:
+    """Fresh response/throttle caches per test and Bearer auth through StatelessJWTAuthentication."""
+
+    def setUp(self):
+        super().setUp()
+        cache.clear()
+        user_cache.clear()
+
+    def authenticate(self, user):
+        self.client.credentials(HTTP_AUTHORIZATION=f'Bearer {token_for_user(user).access_token}')
+
+    def walk(self, url, direction='next'):
+        """Follow `direction` links from `url`; returns the ids of every page, in order."""
+        pages = []
+        while url:
+            response = self.client.get(url)
+            self.assertEqual(response.status_code, status.HTTP_200_OK)
+            pages.append([row['id'] for row in response.data['results']])
+            url = response.data[direction]
+        return pages
+
+    def assertCoversOnce(self, pages, expected):
+        ids = [pk for page in pages for pk in page]
+        self.assertEqual(ids, expected)
+        self.assertEqual(len(ids), len(set(ids)))
+
+
+class CursorPaginationTests(APITestMixin, APITestCase):
+    def setUp(self):
+        super().setUp()
+        self.user = User.objects.create_user(username='alice', password='pw')
+        self.peer = User.objects.create_user(username='bob', password='pw')
+        self.authenticate(self.user)
+
+    def age(self, queryset, timestamps):
+        # Shared timestamps make the id tie-break decide the order
+        for obj, created_at in zip(queryset.order_by('id'), timestamps):
+            queryset.model.objects.filter(pk=obj.pk).update(created_at=created_at)
+
+    def test_cases_no_duplicates_or_gaps(self):
+        for i in range(23):
+            Case.objects.create(case_id=f'C-{i}', title=f'Case {i}', image_url='https://example.com/a.png',
+                                created_by=self.user)
+        now = timezone.now()
+        self.age(Case.objects.all(), [now - timedelta(minutes=i // 4) for i in range(23)])
+        expected = list(Case.objects.order_by('-created_at', '-id').values_list('id', flat=True))
+
+        pages = self.walk('/api/cases?page_size=5')
+        self.assertEqual([len(page) for page in pages], [5, 5, 5, 5, 3])
+        self.assertCoversOnce(pages, expected)
+
+    def test_previous_links_return_the_same_pages(self):
+        for i in range(12):
+            Case.objects.create(case_id=f'C-{i}', title=f'Case {i}', image_url='https://example.com/a.png')
+        self.age(Case.objects.all(), [timezone.now()] * 12)
+
+        forward = self.walk('/api/cases?page_size=5')
+        last = self.client.get('/api/cases?page_size=5')
+        while last.data['next']:
+            last = self.client.get(last.data['next'])
+        backward = self.walk(last.data['previous'], direction='previous')
+        self.assertEqual(backward, forward[-2::-1])
+
+    def test_messages_no_duplicates_or_gaps(self):
+        for i in range(17):
+            sender, recipient = (self.user, self.peer) if i % 2 else (self.peer, self.user)
+            Message.objects.create(sender=sender, recipient=recipient, content=f'message {i}')
+        Message.objects.create(sender=self.peer, recipient=self.peer, content='not mine')
+        self.age(Message.objects.all(), [timezone.now() - timedelta(seconds=i // 3) for i in range(18)])
+        expected = list(Message.objects.exclude(content='not mine')
+                        .order_by('-created_at', '-id').values_list('id', flat=True))
+
+        self.assertCoversOnce(self.walk('/api/messages?page_size=4'), expected)
+
+    def test_invalid_cursor(self):
+        response = self.client.get('/api/cases?cursor=not-a-cursor')
+        self.assertEqual(response.status_code, status.HTTP_404_NOT_FOUND)
+
+
+class ETagTests(APITestMixin, APITestCase):
+    def setUp(self):
+        super().setUp()
+        self.user = User.objects.create_user(username='alice', password='pw', first_name='Alice')
+        self.authenticate(self.user)
+
+    def assertRevalidates(self, url):
+        """304 for the current ETag; returns it."""
+        response = self.client.get(url)
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        etag = response['ETag']
+        response = self.client.get(url, HTTP_IF_NONE_MATCH=etag)
+        self.assertEqual(response.status_code, status.HTTP_304_NOT_MODIFIED)
+        self.assertEqual(response['ETag'], etag)
+        self.assertFalse(response.content)
+        return etag
+
+    def test_profile(self):
+        etag = self.assertRevalidates('/api/auth/profile')
+        response = self.client.post('/api/auth/update_profile', {'username': 'alice', 'first_name': 'Alicia'},
+                                    format='json')
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+
+        response = self.client.get('/api/auth/profile', HTTP_IF_NONE_MATCH=etag)
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        self.assertNotEqual(response['ETag'], etag)
+        self.assertIn('Alicia', response.data['name'])
+
+    def test_case_detail(self):
+        case = Case.objects.create(case_id='C-1', title='Before', image_url='https://example.com/a.png',
+                                   created_by=self.user)
+        url = f'/api/cases/{case.pk}'
+        etag = self.assertRevalidates(url)
+
+        case.title = 'After'
+        case.save()
+        response = self.client.get(url, HTTP_IF_NONE_MATCH=etag)
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        self.assertEqual(response.data['title'], 'After')
+        self.assertRevalidates(url)
+
+    def test_weak_and_wildcard_etags(self):
+        etag = self.assertRevalidates('/api/auth/profile')
+        for header in (f'W/{etag}', '*', f'"other", {etag}'):
+            response = self.client.get('/api/auth/profile', HTTP_IF_NONE_MATCH=header)
+            self.assertEqual(response.status_code, status.HTTP_304_NOT_MODIFIED, header)
+
+
+class ConversationTests(APITestMixin, APITestCase):
+    def setUp(self):
+        super().setUp()
+        self.user = User.objects.create_user(username='alice', password='pw')
+        self.other = User.objects.create_user(username='bob', password='pw')
+        self.third = User.objects.create_user(username='carol', password='pw')
+        self.authenticate(self.user)
+
+    def summary(self, user, peer):
+        conversation = Conversation.objects.filter(user=user, peer=peer).first()
+        return conversation and (conversation.last_message_id, conversation.unread_count)
+
+    def test_mark_conversation_read_requires_peer_id(self):
+        for body in ({'peer': 'abc'}, {}, [self.other.pk], {'peer': None}):
+            response = self.client.post('/api/messages/mark_conversation_read', body, format='json')
+            self.assertEqual(response.status_code, status.HTTP_400_BAD_REQUEST, body)
+
+        Message.objects.create(sender=self.other, recipient=self.user, content='hi')
+        response = self.client.post('/api/messages/mark_conversation_read', {'peer': str(self.other.pk)},
+                                    format='json')
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        self.assertEqual(response.data['marked_read'], 1)
+
+    def test_deleting_a_message_restores_the_previous_one(self):
+        first = Message.objects.create(sender=self.other, recipient=self.user, content='first')
+        last = Message.objects.create(sender=self.other, recipient=self.user, content='last')
+        self.assertEqual(self.summary(self.user, self.other), (last.pk, 2))
+
+        self.assertEqual(self.client.delete(f'/api/messages/{last.pk}').status_code, status.HTTP_204_NO_CONTENT)
+        self.assertEqual(self.summary(self.user, self.other), (first.pk, 1))
+        self.assertEqual(self.summary(self.other, self.user), (first.pk, 0))
+
+        first.delete()
+        self.assertIsNone(self.summary(self.user, self.other))
+        self.assertIsNone(self.summary(self.other, self.user))
+
+    def test_changing_recipient_moves_the_message(self):
+        earlier = Message.objects.create(sender=self.user, recipient=self.other, content='earlier')
+        message = Message.objects.create(sender=self.user, recipient=self.other, content='wrong person')
+
+        response = self.client.patch(f'/api/messages/{message.pk}', {'recipient': self.third.pk}, format='json')
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        self.assertEqual(self.summary(self.other, self.user), (earlier.pk, 1))
+        self.assertEqual(self.summary(self.third, self.user), (message.pk, 1))
+        self.assertEqual(self.summary(self.user, self.third), (message.pk, 0))
+
+    def test_rebuild_matches_incremental_summaries(self):
+        for i in range(6):
+            Message.objects.create(sender=[self.other, self.third][i % 2], recipient=self.user, content=f'm{i}',
+                                   is_read=i < 2)
+        Message.objects.create(sender=self.user, recipient=self.other, content='reply')
+        incremental = set(Conversation.objects.values_list('user', 'peer', 'last_message', 'unread_count'))
+        Conversation.objects.rebuild(User.objects.values_list('id', flat=True))
+        self.assertEqual(set(Conversation.objects.values_list('user', 'peer', 'last_message', 'unread_count')),
+                         incremental)
+
+
+class TokenUserTests(APITestMixin, APITestCase):
+    """Tokens stay valid, but the user row decides: changes apply once the cached row is gone."""
+
+    def setUp(self):
+        super().setUp()
+        self.user = User.objects.create_user(username='alice', password='pw', role='ADMIN')
+        self.authenticate(self.user)
+        self.assertEqual(self.client.get('/api/profiling').status_code, status.HTTP_200_OK)
+
+    def expire(self, **changes):
+        # Another process changed the row: no signal here, the cached row just expires
+        User.objects.filter(pk=self.user.pk).update(**changes)
+        user_cache.clear()
+
+    def test_inactive_user_rejected(self):
+        self.expire(is_active=False)
+        self.assertEqual(self.client.get('/api/auth/profile').status_code, status.HTTP_401_UNAUTHORIZED)
+
+    def test_deactivation_applies_immediately_in_process(self):
+        self.user.is_active = False
+        self.user.save()
+        self.assertEqual(self.client.get('/api/auth/profile').status_code, status.HTTP_401_UNAUTHORIZED)
+
+    def test_demoted_user_loses_admin_endpoints(self):
+        self.expire(role='STUDENT')
+        self.assertEqual(self.client.get('/api/profiling').status_code, status.HTTP_403_FORBIDDEN)
+        self.assertEqual(self.client.get('/api/auth/profile').status_code, status.HTTP_200_OK)
+
+    def test_deleted_user_rejected(self):
+        User.objects.filter(pk=self.user.pk).delete()
+        self.assertEqual(self.client.get('/api/auth/profile').status_code, status.HTTP_401_UNAUTHORIZED)
+
+
+@override_settings(PASSWORD_HASHERS=FAST_HASHERS)
+class LoginTests(APITestMixin, APITransactionTestCase):
+    """Transactional: authenticate() runs on the hashing pool, on its own database connection."""
+
+    def setUp(self):
+        super().setUp()
+        self.user = User.objects.create_user(username='alice', email='Alice@example.com', password='secret')
+
+    def login(self, data, **kwargs):
+        return self.client.post('/api/auth/login', data, format='json', **kwargs)
+
+    def test_login_by_username_and_email(self):
+        for identifier in ({'username': 'alice'}, {'email': 'alice@EXAMPLE.com'}):
+            response = self.login({**identifier, 'password': 'secret'})
+            self.assertEqual(response.status_code, status.HTTP_200_OK, identifier)
+            self.client.credentials(HTTP_AUTHORIZATION=f'Bearer {response.data["token"]}')
+            self.assertEqual(self.client.get('/api/auth/profile').data['id'], str(self.user.pk))
+            self.client.credentials()
+
+    def test_wrong_password(self):
+        response = self.login({'username': 'alice', 'password': 'wrong'})
+        self.assertEqual(response.status_code, status.HTTP_400_BAD_REQUEST)
+
+    def test_account_throttled(self):
+        for _ in range(5):
+            self.assertEqual(self.login({'username': 'alice', 'password': 'wrong'}).status_code,
+                             status.HTTP_400_BAD_REQUEST)
+        # Same account by email, from another address: still the same bucket
+        response = self.login({'email': ' ALICE ', 'password': 'secret'}, REMOTE_ADDR='10.0.0.2')
+        self.assertEqual(response.status_code, status.HTTP_429_TOO_MANY_REQUESTS)
+        self.assertIn('Retry-After', response)
+        self.assertEqual(self.login({'username': 'bob', 'password': 'x'}).status_code,
+                         status.HTTP_400_BAD_REQUEST)
+
+    def test_ip_throttled(self):
+        for i in range(20):
+            self.login({'username': f'user{i}', 'password': 'x'})
+        response = self.login({'username': 'alice', 'password': 'secret'})
+        self.assertEqual(response.status_code, status.HTTP_429_TOO_MANY_REQUESTS)
+
+    def test_non_object_body(self):
+        for body in (['alice', 'secret'], 'alice'):
+            self.assertEqual(self.login(body).status_code, status.HTTP_400_BAD_REQUEST, body)
+
+
+class BulkImportTests(APITestMixin, APITestCase):
+    def setUp(self):
+        super().setUp()
+        self.user = User.objects.create_user(username='alice', password='pw')
+        self.authenticate(self.user)
+        self.blob = ImageBlob.objects.create(sha256='ab' * 32, size=100, content_type='image/png')
+        ImageUpload.objects.create(user=self.user, size=100, received=100, content_type='image/png',
+                                   sha256=self.blob.sha256, blob=self.blob)
+
+    def ndjson(self, *rows):
+        return b''.join(row if isinstance(row, bytes) else json.dumps(row).encode() + b'\n' for row in rows)
+
+    def run_import(self, data, fmt='ndjson', batch_size=500):
+        return import_cases(iter_rows(io.BytesIO(data), fmt), created_by_id=self.user.id,
+                            batch_size=batch_size).as_dict()
+
+    def failed_fields(self, result):
+        return [(error['row'], list(error['errors'])) for error in result['errors']]
+
+    def test_endpoint(self):
+        data = b'case_id,title,image_url\nC-1,First,https://example.com/1.png\nC-2,,https://example.com/2.png\n'
+        response = self.client.post('/api/cases/bulk_import',
+                                    {'file': SimpleUploadedFile('cases.csv', data, 'text/csv')}, format='multipart')
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        self.assertEqual((response.data['created'], response.data['failed']), (1, 1))
+        self.assertEqual(response.data['errors'][0]['row'], 3)
+        self.assertEqual(Case.objects.get(case_id='C-1').created_by, self.user)
+
+    def test_image_only_rows(self):
+        result = self.run_import(self.ndjson({'case_id': 'C-1', 'title': 't', 'image': self.blob.sha256.upper()},
+                                             {'case_id': 'C-2', 'title': 't', 'image': 'cd' * 32},
+                                             {'case_id': 'C-3', 'title': 't'}))
+        self.assertEqual(result['created'], 1)
+        self.assertEqual(self.failed_fields(result), [(2, ['image']), (3, ['image_url'])])
+        case = Case.objects.get(case_id='C-1')
+        self.assertEqual(case.image_id, self.blob.sha256)
+        self.assertTrue(case.image_url.endswith(f'/images/{self.blob.sha256}'))
+
+    def test_invalid_utf8_is_a_row_error(self):
+        rows = self.ndjson({'case_id': 'C-1', 'title': 'ok', 'image_url': 'https://example.com/1.png'},
+                           b'{"case_id": "C-2", "title": "caf\xe9", "image_url": "https://example.com/2.png"}\n',
+                           {'case_id': 'C-3', 'title': 'caf\u00e9', 'image_url': 'https://example.com/3.png'})
+        result = self.run_import(rows)
+        self.assertEqual((result['created'], result['errors']),
+                         (2, [{'row': 2, 'errors': {'non_field_errors': ['Invalid UTF-8']}}]))
+        self.assertEqual(Case.objects.get(case_id='C-3').title, 'caf\u00e9')
+
+        csv_rows = ('\ufeffcase_id,title,image_url\nC-4,"two\nlines",https://example.com/4.png\n'.encode()
+                    + b'C-5,"bad\n\xff",https://example.com/5.png\nC-6,ok,https://example.com/6.png\n')
+        result = self.run_import(csv_rows, fmt='csv')
+        self.assertEqual(result['created'], 2)
+        self.assertEqual(result['errors'], [{'row': 5, 'errors': {'non_field_errors': ['Invalid UTF-8']}}])
+        self.assertEqual(Case.objects.get(case_id='C-4').title, 'two\nlines')
+
+    def test_lookups_are_per_batch(self):
+        def queries(count):
+            rows = self.ndjson(*({'case_id': f'N{count}-{i}', 'title': 't', 'image': self.blob.sha256,
+                                  'status': 'ANALYZED'} for i in range(count)))
+            with CaptureQueriesContext(connection) as captured:
+                self.assertEqual(self.run_import(rows)['created'], count)
+            return len(captured)
+
+        self.assertEqual(queries(5), queries(50))
+
+    def test_duplicates_and_choices(self):
+        result = self.run_import(self.ndjson(
+            {'case_id': 'C-1', 'title': 't', 'image_url': 'https://example.com/1.png'},
+            {'case_id': 'C-1', 'title': 't', 'image_url': 'https://example.com/1.png'},
+            {'case_id': 'C-2', 'title': 't', 'image_url': 'https://example.com/1.png', 'status': 'DONE'},
+        ), batch_size=2)
+        self.assertEqual(result['created'], 1)
+        self.assertEqual(self.failed_fields(result), [(2, ['case_id']), (3, ['status'])])
+
+
+class ExportTests(APITestMixin, APITestCase):
+    def setUp(self):
+        super().setUp()
+        self.user = User.objects.create_user(username='alice', password='pw')
+        self.other = User.objects.create_user(username='bob', password='pw')
+        self.authenticate(self.user)
+        for i, owner in enumerate([self.user, self.other, self.user]):
+            Case.objects.create(case_id=f'C-{i}', title=f'Case {i}', image_url='https://example.com/a.png',
+                                created_by=owner, status='ANALYZED' if i else 'PENDING')
+
+    def export(self, query=''):
+        response = self.client.get(f'/api/cases/export?type=ndjson{query}')
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        return [json.loads(line)['case_id'] for line in b''.join(response.streaming_content).splitlines()]
+
+    def test_filters(self):
+        self.assertEqual(self.export(), ['C-0', 'C-1', 'C-2'])
+        self.assertEqual(self.export('&status=analyzed'), ['C-1', 'C-2'])
+
+    def test_only_visible_cases(self):
+        def own_cases(user):
+            return Case.objects.filter(created_by_id=user.id)
+        with mock.patch('api.views.visible_cases', own_cases):
+            self.assertEqual(self.export(), ['C-0', 'C-2'])
+
+
+class SearchTests(APITestMixin, APITestCase):
+    def setUp(self):
+        super().setUp()
+        self.user = User.objects.create_user(username='alice', password='pw')
+        self.peer = User.objects.create_user(username='bob', password='pw')
+        self.authenticate(self.user)
+
+    def test_search_ties_no_duplicates_or_gaps(self):
+        # Identical documents score identical ranks, so only the id tie-break orders them
+        for i in range(12):
+            Case.objects.create(case_id=f'T-{i}', title='Ductal carcinoma', image_url='https://example.com/a.png')
+        Case.objects.create(case_id='OTHER', title='Fibroadenoma', image_url='https://example.com/a.png')
+        expected = list(Case.objects.filter(title='Ductal carcinoma').order_by('-id').values_list('id', flat=True))
+
+        self.assertCoversOnce(self.walk('/api/cases/search?q=carcinoma&page_size=5'), expected)
+
+    def test_best_match_first(self):
+        weak = Case.objects.create(case_id='W', title='Biopsy', description='possible carcinoma',
+                                   image_url='https://example.com/a.png')
+        strong = Case.objects.create(case_id='S', title='Carcinoma', image_url='https://example.com/a.png')
+        response = self.client.get('/api/cases/search?q=carcinoma')
+        self.assertEqual([row['id'] for row in response.data['results']], [strong.pk, weak.pk])
+        self.assertGreater(response.data['results'][0]['rank'], response.data['results'][1]['rank'])
+
+    def test_messages_only_own(self):
+        mine = Message.objects.create(sender=self.peer, recipient=self.user, content='slides are ready')
+        Message.objects.create(sender=self.peer, recipient=self.peer, content='slides for me only')
+        response = self.client.get('/api/messages/search?q=slides')
+        self.assertEqual([row['id'] for row in response.data['results']], [mine.pk])
+
+    def test_search_requires_query(self):
+        for url in ('/api/cases/search', '/api/messages/search?q=%20'):
+            self.assertEqual(self.client.get(url).status_code, status.HTTP_400_BAD_REQUEST, url)
+
+
+class UploadTests(APITestMixin, APITestCase):
+    def setUp(self):
+        super().setUp()
+        media = tempfile.TemporaryDirectory()
+        self.addCleanup(media.cleanup)
+        media_root = override_settings(MEDIA_ROOT=media.name)
+        media_root.enable()
+        self.addCleanup(media_root.disable)
+        self.user = User.objects.create_user(username='alice', password='pw')
+        self.other = User.objects.create_user(username='bob', password='pw')
+        self.authenticate(self.user)
+
+    def blob(self, owner):
+        blob = ImageBlob.objects.create(sha256='ab' * 32, size=100, content_type='image/png')
+        ImageUpload.objects.create(user=owner, size=100, received=100, content_type='image/png',
+                                   sha256=blob.sha256, blob=blob)
+        return blob
+
+    def test_upload_shortcut_only_reuses_own_blobs(self):
+        blob = self.blob(self.other)
+        body = {'size': 100, 'content_type': 'image/png', 'sha256': blob.sha256}
+        response = self.client.post('/api/uploads', body, format='json')
+        self.assertEqual(response.status_code, status.HTTP_201_CREATED)
+        self.assertEqual(response.data['received'], 0)
+        self.assertFalse(response.data['complete'])
+
+        self.authenticate(self.other)
+        response = self.client.post('/api/uploads', body, format='json')
+        self.assertTrue(response.data['complete'])
+
+    def test_case_image_requires_own_upload(self):
+        blob = self.blob(self.other)
+        response = self.client.post('/api/cases', {'case_id': 'C-1', 'title': 't', 'image': blob.sha256},
+                                    format='json')
+        self.assertEqual(response.status_code, status.HTTP_400_BAD_REQUEST)
+        self.assertIn('image', response.data)
+
+        self.authenticate(self.other)
+        response = self.client.post('/api/cases', {'case_id': 'C-1', 'title': 't', 'image': blob.sha256},
+                                    format='json')
+        self.assertEqual(response.status_code, status.HTTP_201_CREATED)
+
+    def test_upload_content_range_required(self):
+        response = self.client.post('/api/uploads', {'size': 10, 'content_type': 'image/png'}, format='json')
+        response = self.client.generic('PATCH', f'/api/uploads/{response.data["id"]}', b'0123456789',
+                                       content_type='application/octet-stream')
+        self.assertEqual(response.status_code, status.HTTP_400_BAD_REQUEST)
+
+    def patch(self, upload_id, data, start, total):
+        return self.client.generic('PATCH', f'/api/uploads/{upload_id}', data, content_type='application/octet-stream',
+                                   HTTP_CONTENT_RANGE=f'bytes {start}-{start + len(data) - 1}/{total}')
+
+    def test_chunked_upload(self):
+        data = os.urandom(1000)
+        response = self.client.post('/api/uploads', {'size': len(data), 'content_type': 'image/png',
+                                                     'sha256': hashlib.sha256(data).hexdigest()}, format='json')
+        upload_id = response.data['id']
+        self.assertEqual(self.patch(upload_id, data[:400], 0, 1000).data['received'], 400)
+        response = self.patch(upload_id, data[:400], 0, 1000)
+        self.assertEqual((response.status_code, response.data['received']), (status.HTTP_409_CONFLICT, 400))
+
+        response = self.patch(upload_id, data[400:], 400, 1000)
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        self.assertTrue(response.data['complete'])
+        self.assertEqual(response.data['image']['sha256'], hashlib.sha256(data).hexdigest())
+        # Chunk files and the part file are gone once the blob is stored
+        self.assertEqual(os.listdir(os.path.dirname(part_path(ImageUpload.objects.get(pk=upload_id)))), [])
+
+    def test_short_body_keeps_the_offset(self):
+        response = self.client.post('/api/uploads', {'size': 100, 'content_type': 'image/png'}, format='json')
+        upload_id = response.data['id']
+        response = self.client.generic('PATCH', f'/api/uploads/{upload_id}', b'x' * 10,
+                                       content_type='application/octet-stream', HTTP_CONTENT_RANGE='bytes 0-49/100')
+        self.assertEqual(response.status_code, status.HTTP_400_BAD_REQUEST)
+        self.assertEqual(self.patch(upload_id, b'y' * 100, 0, 100).data['received'], 100)
+
+    def test_import_requires_own_upload(self):
+        blob = self.blob(self.other)
+        rows = json.dumps({'case_id': 'C-1', 'title': 't', 'image_url': 'https://example.com/a.png',
+                           'image': blob.sha256}).encode()
+        for user, created in ((self.user, 0), (self.other, 1), (None, 0)):
+            result = import_cases(iter_rows(io.BytesIO(rows), 'ndjson'), created_by_id=user and user.id)
+            self.assertEqual(result.created, created, user)
+        self.assertEqual(Case.objects.get(case_id='C-1').created_by, self.other)
+
+
+@override_settings(PASSWORD_HASHERS=FAST_HASHERS)
+class SeedTests(APITestMixin, APITestCase):
+    sizes = {'users': 5, 'cases': 30, 'messages': 40, 'batch_size': 7}
+
+    def snapshot(self):
+        cases = Case.objects.order_by('case_id').values_list(
+            'case_id', 'title', 'description', 'patient_age', 'diagnosis', 'is_malignant', 'confidence_score',
+            'status', 'created_by__username')
+        messages = Message.objects.order_by('id').values_list('sender__username', 'recipient__username',
+                                                              'content', 'is_read')
+        return list(cases), list(messages)
+
+    def flush(self):
+        Message.objects.all().delete()
+        Conversation.objects.all().delete()
+        Case.objects.all().delete()
+        User.objects.all().delete()
+
+    def test_same_seed_same_rows(self):
+        factories.seed(**self.sizes)
+        first = self.snapshot()
+        self.flush()
+        factories.seed(**self.sizes)
+        self.assertEqual(self.snapshot(), first)
+        self.assertEqual((len(first[0]), len(first[1])), (30, 40))
+
+        self.flush()
+        factories.seed(**self.sizes, rng_seed=1)
+        self.assertNotEqual(self.snapshot(), first)
+
+    def test_top_up_matches_fresh_seed(self):
+        factories.seed(users=5, cases=900, messages=10)
+        factories.seed(users=5, cases=1100, messages=30)
+        topped_up = self.snapshot()
+        self.flush()
+        factories.seed(users=5, cases=1100, messages=30)
+        self.assertEqual(self.snapshot(), topped_up)
+
+    def test_reset_cases(self):
+        factories.seed(**self.sizes)
+        seeded = self.snapshot()
+        cases = list(Case.objects.order_by('?')[:10])
+        self.authenticate(cases[0].created_by)
+        etag = self.client.get(f'/api/cases/{cases[0].pk}')['ETag']
+        for case in cases:
+            case.status, case.is_malignant, case.confidence_score = 'ANALYZED', True, 0.91
+            case.save()
+        self.assertNotEqual(self.snapshot(), seeded)
+
+        self.assertEqual(factories.reset_cases([case.pk for case in cases]), 10)
+        self.assertEqual(self.snapshot(), seeded)
+        # The cached case response is dropped too
+        self.assertEqual(self.client.get(f'/api/cases/{cases[0].pk}', HTTP_IF_NONE_MATCH=etag).status_code,
+                         status.HTTP_200_OK)
+
+    def test_compare_report(self):
+        def report(commit, p50, rps):
+            return {'meta': {'commit': commit},
+                    'scenarios': {'inbox': {'requests': 10, 'p50_ms': p50, 'p95_ms': 2 * p50, 'rps': rps}}}
+        baseline, current = report('abc', 10.0, 100.0), report('def', 5.0, 150.0)
+        current['scenarios']['analyze'] = current['scenarios']['inbox']
+        out = io.StringIO()
+        BenchAPICommand(stdout=out).compare(baseline, current)
+        lines = out.getvalue().splitlines()
+        self.assertIn('compared with abc (now def)', lines[1])
+        self.assertEqual(lines[3].split(), ['inbox', '10.0', '->', '5.0', '(-50%)', '20.0', '->', '10.0', '(-50%)',
+                                            '100.0', '->', '150.0', '(+50%)'])
+        self.assertEqual(lines[4].split(), ['analyze', '(not', 'in', 'baseline)'])
@@ -1,11 +1,15 @@
 from django.urls import path, include
 from rest_framework.routers import DefaultRouter
-from .views import UserViewSet, CaseViewSet, MessageViewSet
+from .views import UserViewSet, CaseViewSet, MessageViewSet, AnalyticsViewSet, ImageUploadViewSet, ImageViewSet, ProfilingViewSet
 
 router = DefaultRouter(trailing_slash=False)
 router.register(r'auth', UserViewSet, basename='user')
 router.register(r'cases', CaseViewSet, basename='case')
 router.register(r'messages', MessageViewSet, basename='message')
+router.register(r'analytics', AnalyticsViewSet, basename='analytics')
+router.register(r'uploads', ImageUploadViewSet, basename='upload')
+router.register(r'images', ImageViewSet, basename='image')
+router.register(r'profiling', ProfilingViewSet, basename='profiling')
 
 urlpatterns = [
     path('', include(router.urls)),
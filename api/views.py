@@ -1,16 +1,58 @@
 from rest_framework import viewsets, status
 from rest_framework.response import Response
 from rest_framework.decorators import action
+from rest_framework.parsers import MultiPartParser
 from rest_framework.permissions import IsAuthenticated, AllowAny
-from rest_framework_simplejwt.tokens import RefreshToken
-from .models import User, Case, Message
-from .serializers import UserDataSerializer, UserRegistrationSerializer, LoginSerializer, CaseSerializer, MessageSerializer
+from .permissions import IsAdminRole, visible_cases
+from .models import User, Case, Message, Conversation, ImageBlob, ImageUpload
+from .serializers import UserDataSerializer, UserRegistrationSerializer, LoginSerializer, CaseSerializer, MessageSerializer, ConversationSerializer, ImageUploadSerializer
+from .pagination import KeysetCursorPagination, ConversationCursorPagination, SearchRankCursorPagination
+from .cache import cached_response, etag_matches as cache_etag_matches
+from .authentication import token_for_user
+from .throttling import LoginIPThrottle, LoginAccountThrottle
+from .importers import FORMATS, detect_format, import_cases, iter_rows
+from . import analytics, exporters, images, profiling
+from .search import search as full_text_search
+from .fast_serializers import CaseValuesSerializer, MessageValuesSerializer, UserDataValuesSerializer
 import requests
 from django.conf import settings
+from django.db import transaction
+from django.http import HttpResponse, StreamingHttpResponse
+from django.shortcuts import get_object_or_404
+import os
+import re
 
-class UserViewSet(viewsets.ModelViewSet):
-    queryset = User.objects.all()
+
+class ValuesListMixin:
+    """
+    Serves `list` (and any action calling `values_list_response`) from
+    `.values()` rows through `values_serializer`, which renders the same JSON
+    as `serializer_class` without building model instances.
+    """
+    values_serializer = None
+    
+    def list(self, request, *args, **kwargs):
+        return self.values_list_response(self.filter_queryset(self.get_queryset()))
+    
+    def values_list_response(self, queryset, extra=()):
+        rows = self.values_serializer.values(queryset, *extra)
+        page = self.paginate_queryset(rows)
+        if page is not None:
+            return self.get_paginated_response(self.values_serializer.serialize(page, extra))
+        return Response(self.values_serializer.serialize(rows, extra))
+    
+    def search_response(self, request, queryset):
+        """Full-text matches for `?q=` in `queryset`, best first, with their `rank`."""
+        text = request.query_params.get('q', '').strip()
+        if not text:
+            return Response({"error": "q is required"}, status=status.HTTP_400_BAD_REQUEST)
+        return self.values_list_response(full_text_search(queryset, text), extra=('rank',))
+
+
+class UserViewSet(ValuesListMixin, viewsets.ModelViewSet):
+    queryset = User.objects.all().order_by('id')
     serializer_class = UserDataSerializer
+    values_serializer = UserDataValuesSerializer()
     permission_classes = [IsAuthenticated]
     
     @action(detail=False, methods=['post'], permission_classes=[AllowAny])
@@ -18,7 +60,7 @@ class UserViewSet(viewsets.ModelViewSet):
         serializer = UserRegistrationSerializer(data=request.data)
         if serializer.is_valid():
             user = serializer.save()
-            refresh = RefreshToken.for_user(user)
+            refresh = token_for_user(user)
             return Response({
                 'message': 'Account created successfully',
                 'token': str(refresh.access_token),
@@ -26,12 +68,13 @@ class UserViewSet(viewsets.ModelViewSet):
             }, status=status.HTTP_201_CREATED)
         return Response(serializer.errors, status=status.HTTP_400_BAD_REQUEST)
     
-    @action(detail=False, methods=['post'], permission_classes=[AllowAny])
+    @action(detail=False, methods=['post'], permission_classes=[AllowAny],
+            throttle_classes=[LoginIPThrottle, LoginAccountThrottle])
     def login(self, request):
-        serializer = LoginSerializer(data=request.data)
+        serializer = LoginSerializer(data=request.data, context={'request': request})
         if serializer.is_valid():
             user = serializer.validated_data['user']
-            refresh = RefreshToken.for_user(user)
+            refresh = token_for_user(user)
             return Response({
                 'message': 'Login successful',
                 'token': str(refresh.access_token),
@@ -41,11 +84,12 @@ class UserViewSet(viewsets.ModelViewSet):
     
     @action(detail=False, methods=['get'])
     def profile(self, request):
-        return Response(UserDataSerializer(request.user).data)
+        user = request.user
+        return cached_response(request, 'user', user.pk, lambda: UserDataSerializer(user.load()).data)
     
     @action(detail=False, methods=['post'])
     def update_profile(self, request):
-        user = request.user
+        user = request.user.load()
         serializer = UserRegistrationSerializer(user, data=request.data, partial=True)
         if serializer.is_valid():
             serializer.save()
@@ -53,15 +97,56 @@ class UserViewSet(viewsets.ModelViewSet):
         return Response(serializer.errors, status=status.HTTP_400_BAD_REQUEST)
 
 
-class CaseViewSet(viewsets.ModelViewSet):
-    queryset = Case.objects.all().order_by('-created_at')
+class CaseViewSet(ValuesListMixin, viewsets.ModelViewSet):
+    queryset = Case.objects.all().order_by('-created_at', '-id')
     serializer_class = CaseSerializer
+    values_serializer = CaseValuesSerializer()
     permission_classes = [IsAuthenticated]
+    pagination_class = KeysetCursorPagination
+    
+    def get_queryset(self):
+        return visible_cases(self.request.user).order_by('-created_at', '-id')
+    
+    def retrieve(self, request, *args, **kwargs):
+        try:
+            pk = int(kwargs['pk'])
+        except (KeyError, ValueError):
+            return super().retrieve(request, *args, **kwargs)
+        return cached_response(request, 'case', pk, lambda: self.get_serializer(self.get_object()).data)
     
     @action(detail=False, methods=['get'])
     def my_cases(self, request):
-        cases = Case.objects.filter(created_by=request.user)
-        return Response(CaseSerializer(cases, many=True).data)
+        return self.values_list_response(Case.objects.filter(created_by_id=request.user.id))
+    
+    @action(detail=False, methods=['post'], parser_classes=[MultiPartParser])
+    def bulk_import(self, request):
+        upload = request.FILES.get('file')
+        if upload is None:
+            return Response({"error": "Upload a CSV or NDJSON file as 'file'"}, status=status.HTTP_400_BAD_REQUEST)
+        fmt = request.query_params.get('type') or detect_format(upload.name, upload.content_type)
+        if fmt not in FORMATS:
+            return Response({"error": f"Unknown file type; pass ?type= one of {', '.join(FORMATS)}"},
+                            status=status.HTTP_400_BAD_REQUEST)
+        result = import_cases(iter_rows(upload, fmt), created_by_id=request.user.id)
+        return Response(result.as_dict())
+    
+    @action(detail=False, methods=['get'], pagination_class=SearchRankCursorPagination)
+    def search(self, request):
+        return self.search_response(request, self.get_queryset())
+    
+    @action(detail=False, methods=['get'])
+    def export(self, request):
+        fmt = request.query_params.get('type', 'csv')
+        if fmt not in exporters.FORMATS:
+            return Response({"error": f"type must be one of {', '.join(exporters.FORMATS)}"},
+                            status=status.HTTP_400_BAD_REQUEST)
+        if fmt == 'parquet' and not exporters.parquet_available():
+            return Response({"error": "Parquet export needs pyarrow installed on the server"},
+                            status=status.HTTP_501_NOT_IMPLEMENTED)
+        cases = exporters.filter_cases(self.get_queryset().order_by('id'), request.query_params)
+        response = StreamingHttpResponse(exporters.STREAMERS[fmt](cases), content_type=exporters.CONTENT_TYPES[fmt])
+        response['Content-Disposition'] = f'attachment; filename="cases.{fmt}"'
+        return response
     
     @action(detail=True, methods=['post'])
     def analyze(self, request, pk=None):
@@ -70,7 +155,13 @@ class CaseViewSet(viewsets.ModelViewSet):
             return Response({"error": "No image"}, status=status.HTTP_400_BAD_REQUEST)
         try:
             ml_url = f"{settings.ML_SERVICE_URL}/predict"
-            resp = requests.post(ml_url, json={"image_url": case.image_url}, timeout=30)
+            with profiling.phase('ml'):
+                if case.image_id and case.image.derivatives_status == 'READY':
+                    # Already 224x224, so the ML service neither downloads nor resizes it
+                    with open(images.variant_path(case.image_id, 'model'), 'rb') as image:
+                        resp = requests.post(ml_url, files={"image": ("model.png", image, "image/png")}, timeout=30)
+                else:
+                    resp = requests.post(ml_url, json={"image_url": case.image_url}, timeout=30)
             if resp.status_code == 200:
                 result = resp.json()
                 case.confidence_score = result.get('confidence', 0)
@@ -83,13 +174,124 @@ class CaseViewSet(viewsets.ModelViewSet):
             return Response({"error": str(e)}, status=500)
 
 
-class MessageViewSet(viewsets.ModelViewSet):
+class ImageUploadViewSet(viewsets.GenericViewSet):
+    """
+    Resumable image uploads: POST the size/content type (and optionally the
+    sha256, which skips the upload when this user already uploaded that
+    content), then
+    PATCH raw bytes in order with `Content-Range: bytes <start>-<end>/<size>`.
+    GET reports how many bytes were received, to resume after a failure.
+    """
+    serializer_class = ImageUploadSerializer
+    permission_classes = [IsAuthenticated]
+    
+    def get_queryset(self):
+        return ImageUpload.objects.filter(user_id=self.request.user.id)
+    
+    def create(self, request):
+        serializer = self.get_serializer(data=request.data)
+        serializer.is_valid(raise_exception=True)
+        sha256 = serializer.validated_data.get('sha256')
+        # A declared hash proves nothing, so only the user's own completed uploads
+        # are reused; anyone else sends the bytes and store_upload() dedupes storage
+        blob = ImageBlob.objects.filter(
+            sha256=sha256, pk__in=ImageUpload.objects.filter(user_id=request.user.id).values('blob_id')
+        ).first() if sha256 else None
+        received = serializer.validated_data['size'] if blob else 0
+        upload = serializer.save(user_id=request.user.id, blob=blob, received=received)
+        return Response(self.get_serializer(upload).data, status=status.HTTP_201_CREATED)
+    
+    def retrieve(self, request, pk=None):
+        return Response(self.get_serializer(self.get_object()).data)
+    
+    def partial_update(self, request, pk=None):
+        match = re.fullmatch(r'bytes (\d+)-(\d+)/(\d+)', request.headers.get('Content-Range', ''))
+        if not match:
+            return Response({"error": "Content-Range: bytes <start>-<end>/<size> is required"},
+                            status=status.HTTP_400_BAD_REQUEST)
+        start, end, total = map(int, match.groups())
+        
+        upload = get_object_or_404(self.get_queryset(), pk=pk)
+        if upload.blob_id is not None:
+            return Response(self.get_serializer(upload).data)
+        if total != upload.size or end < start or end >= total:
+            return Response({"error": f"Range does not fit an upload of {upload.size} bytes"},
+                            status=status.HTTP_400_BAD_REQUEST)
+        if start != upload.received:
+            return self.chunk_conflict(upload)
+        # Receive the body before locking: a slow client must not hold the row lock
+        try:
+            chunk = images.receive_chunk(upload, request.stream, end - start + 1)
+        except ValueError as e:
+            return Response({"error": str(e)}, status=status.HTTP_400_BAD_REQUEST)
+        
+        with transaction.atomic():
+            upload = get_object_or_404(self.get_queryset().select_for_update(), pk=pk)
+            if upload.blob_id is not None or start != upload.received:
+                # A concurrent request delivered these bytes first
+                os.remove(chunk)
+                return self.chunk_conflict(upload)
+            images.append_chunk(upload, chunk)
+            upload.received = end + 1
+            if upload.received == upload.size:
+                try:
+                    upload.blob = images.store_upload(upload)
+                except ValueError as e:
+                    # The bytes are gone; the client has to start a new upload
+                    upload.delete()
+                    return Response({"error": str(e)}, status=status.HTTP_400_BAD_REQUEST)
+            upload.save()
+        return Response(self.get_serializer(upload).data)
+    
+    def chunk_conflict(self, upload):
+        if upload.blob_id is not None:
+            return Response(self.get_serializer(upload).data)
+        return Response({"error": "Chunk does not start at the received offset", "received": upload.received},
+                        status=status.HTTP_409_CONFLICT)
+
+
+class ImageViewSet(viewsets.GenericViewSet):
+    """
+    Stored images by sha256: `/images/<sha256>` (original), `/model` (224x224
+    PNG) and `/thumb`. Responses are immutable and support Range requests.
+    """
+    queryset = ImageBlob.objects.all()
+    permission_classes = [IsAuthenticated]
+    lookup_value_regex = '[0-9a-f]{64}'
+    
+    def retrieve(self, request, pk=None):
+        return self.serve(request, pk, 'original')
+    
+    @action(detail=True, methods=['get'])
+    def model(self, request, pk=None):
+        return self.serve(request, pk, 'model')
+    
+    @action(detail=True, methods=['get'])
+    def thumb(self, request, pk=None):
+        return self.serve(request, pk, 'thumb')
+    
+    def serve(self, request, sha256, variant):
+        etag = f'"{sha256}-{variant}"'
+        # Content never changes, so a matching ETag needs no lookup at all
+        if cache_etag_matches(request, etag):
+            return images.not_modified(etag)
+        blob = get_object_or_404(ImageBlob, pk=sha256)
+        if variant != 'original' and blob.derivatives_status != 'READY':
+            return Response({"error": f"Derivatives are {blob.derivatives_status.lower()}"},
+                            status=status.HTTP_404_NOT_FOUND)
+        content_type = images.VARIANTS[variant][1] or blob.content_type
+        return images.file_response(request, images.variant_path(sha256, variant), content_type, etag)
+
+
+class MessageViewSet(ValuesListMixin, viewsets.ModelViewSet):
     queryset = Message.objects.all()
     serializer_class = MessageSerializer
+    values_serializer = MessageValuesSerializer()
     permission_classes = [IsAuthenticated]
+    pagination_class = KeysetCursorPagination
     
     def get_queryset(self):
-        return Message.objects.filter(recipient=self.request.user) | Message.objects.filter(sender=self.request.user)
+        return (Message.objects.filter(recipient_id=self.request.user.id) | Message.objects.filter(sender_id=self.request.user.id)).select_related('sender', 'recipient')
     
     def create(self, request, *args, **kwargs):
         request.data['sender'] = request.user.id
@@ -97,6 +299,93 @@ class MessageViewSet(viewsets.ModelViewSet):
     
     @action(detail=False, methods=['get'])
     def inbox(self, request):
-        msgs = Message.objects.filter(recipient=request.user).order_by('-created_at')
-        return Response(MessageSerializer(msgs, many=True).data)
+        return self.values_list_response(Message.objects.filter(recipient_id=request.user.id))
+    
+    @action(detail=False, methods=['get'], pagination_class=SearchRankCursorPagination)
+    def search(self, request):
+        return self.search_response(request, self.get_queryset())
+    
+    @action(detail=False, methods=['get'], pagination_class=ConversationCursorPagination)
+    def conversations(self, request):
+        convs = Conversation.objects.filter(user_id=request.user.id).select_related(
+            'peer', 'last_message__sender', 'last_message__recipient'
+        )
+        page = self.paginate_queryset(convs)
+        return self.get_paginated_response(ConversationSerializer(page, many=True).data)
+    
+    @action(detail=False, methods=['post'])
+    def mark_conversation_read(self, request):
+        peer = request.data.get('peer') if isinstance(request.data, dict) else None
+        try:
+            peer_id = int(peer)
+        except (TypeError, ValueError):
+            return Response({"error": "peer must be a user id"}, status=status.HTTP_400_BAD_REQUEST)
+        count = Conversation.objects.mark_read(request.user.id, peer_id)
+        return Response({'marked_read': count})
+    
+    @action(detail=True, methods=['post'])
+    def mark_as_read(self, request, pk=None):
+        message = self.get_object()
+        if message.recipient_id != request.user.id:
+            return Response({"error": "Only the recipient can mark a message read"}, status=status.HTTP_403_FORBIDDEN)
+        if not message.is_read:
+            message.is_read = True
+            message.save(update_fields=['is_read'])
+        return Response(MessageSerializer(message).data)
+
 
+class AnalyticsViewSet(viewsets.ViewSet):
+    """
+    Dashboard aggregates read from CaseDailyRollup (see api/analytics.py), as of
+    the last `refresh_case_rollups` run. Every action accepts `from`, `to`, `user` and `status` filters.
+    """
+    permission_classes = [IsAuthenticated]
+    
+    @action(detail=False, methods=['get'])
+    def summary(self, request):
+        return Response(analytics.summary(analytics.filter_rollups(request.query_params)))
+    
+    @action(detail=False, methods=['get'])
+    def timeseries(self, request):
+        rollups = analytics.filter_rollups(request.query_params)
+        return Response(analytics.timeseries(rollups, request.query_params.get('bucket', 'day')))
+    
+    @action(detail=False, methods=['get'])
+    def by_user(self, request):
+        return Response(analytics.by_user(analytics.filter_rollups(request.query_params)))
+
+
+class ProfilingViewSet(viewsets.ViewSet):
+    """
+    Request traces recorded by ProfilingMiddleware in this process, newest
+    first; `?slowest=N` returns the N slowest instead.
+    """
+    permission_classes = [IsAuthenticated, IsAdminRole]
+    
+    def list(self, request):
+        traces = profiling.store.list()
+        if request.query_params.get('slowest'):
+            try:
+                count = int(request.query_params['slowest'])
+            except ValueError:
+                return Response({"error": "slowest must be an integer"}, status=status.HTTP_400_BAD_REQUEST)
+            traces = sorted(traces, key=lambda t: t['duration_ms'], reverse=True)[:count]
+        return Response({"enabled": settings.PROFILING['ENABLED'], "results": traces})
+    
+    def retrieve(self, request, pk=None):
+        for trace in profiling.store.list():
+            if str(trace['id']) == pk:
+                return Response(trace)
+        return Response({"error": "Trace not found (it may have left the buffer)"}, status=status.HTTP_404_NOT_FOUND)
+    
+    @action(detail=True, methods=['get'])
+    def profile(self, request, pk=None):
+        text = profiling.store.profile(int(pk)) if pk.isdigit() else None
+        if text is None:
+            return Response({"error": "No profile kept for this trace"}, status=status.HTTP_404_NOT_FOUND)
+        return HttpResponse(text, content_type='text/plain; charset=utf-8')
+    
+    @action(detail=False, methods=['post'])
+    def clear(self, request):
+        profiling.store.clear()
+        return Response(status=status.HTTP_204_NO_CONTENT)
@@ -0,0 +1,159 @@
+#!/usr/bin/env python3
+"""
+PathoVision Batched Augmentation
+================================
+The train_transform of train_anti_overfitting.py, applied to a whole
+collated batch with tensor ops (on the training device) instead of one PIL
+image at a time in DataLoader workers. Every sample still gets its own
+random parameters.
+
+- Crop, flips, rotation and affine are folded into one matrix per sample
+  and resampled once with grid_sample (bilinear, zero fill)
+- Colour jitter, Gaussian blur, normalisation and random erasing follow
+
+Input: uint8 (0-255) or float (0-1) batches of shape (N, 3, H, W).
+"""
+
+import math
+
+import torch
+import torch.nn as nn
+import torch.nn.functional as F
+
+IMAGENET_MEAN = (0.485, 0.456, 0.406)
+IMAGENET_STD = (0.229, 0.224, 0.225)
+GRAY_WEIGHTS = (0.299, 0.587, 0.114)
+
+# RGB <-> YIQ; hue is shifted by rotating the I/Q chroma plane
+RGB_TO_YIQ = ((0.299, 0.587, 0.114), (0.596, -0.274, -0.322), (0.211, -0.523, 0.312))
+
+
+class BatchAugment(nn.Module):
+    """Per-sample random augmentation of a batch (defaults match train_transform)."""
+    def __init__(self, crop_size=224, hflip=0.5, vflip=0.5, rotation=30, affine_degrees=20,
+                 translate=(0.15, 0.15), scale=(0.85, 1.15), brightness=0.2, contrast=0.2,
+                 saturation=0.15, hue=0.05, blur_p=0.3, blur_sigma=(0.1, 2.0), erase_p=0.2,
+                 erase_scale=(0.02, 0.15), erase_ratio=(0.3, 3.3), mean=IMAGENET_MEAN, std=IMAGENET_STD):
+        super().__init__()
+        self.crop_size = crop_size
+        self.hflip, self.vflip = hflip, vflip
+        self.rotation, self.affine_degrees = rotation, affine_degrees
+        self.translate, self.scale = translate, scale
+        self.brightness, self.contrast, self.saturation, self.hue = brightness, contrast, saturation, hue
+        self.blur_p, self.blur_sigma = blur_p, blur_sigma
+        self.erase_p, self.erase_scale, self.erase_ratio = erase_p, erase_scale, erase_ratio
+        yiq = torch.tensor(RGB_TO_YIQ)
+        self.register_buffer('yiq', yiq, persistent=False)
+        self.register_buffer('yiq_inv', torch.linalg.inv(yiq), persistent=False)
+        self.register_buffer('gray', torch.tensor(GRAY_WEIGHTS).view(1, 3, 1, 1), persistent=False)
+        self.register_buffer('mean', torch.tensor(mean).view(1, 3, 1, 1), persistent=False)
+        self.register_buffer('std', torch.tensor(std).view(1, 3, 1, 1), persistent=False)
+
+    def extra_repr(self):
+        # Part of the feature cache fingerprint (feature_cache.py), so list every hyperparameter
+        fields = ('crop_size', 'hflip', 'vflip', 'rotation', 'affine_degrees', 'translate', 'scale', 'brightness',
+                  'contrast', 'saturation', 'hue', 'blur_p', 'blur_sigma', 'erase_p', 'erase_scale', 'erase_ratio')
+        params = [f'{name}={getattr(self, name)!r}' for name in fields]
+        params += [f'{name}={tuple(getattr(self, name).flatten().tolist())!r}' for name in ('mean', 'std')]
+        return ', '.join(params)
+
+    @staticmethod
+    def _uniform(n, low, high, device):
+        return torch.empty(n, device=device).uniform_(low, high)
+
+    @torch.no_grad()
+    def forward(self, images):
+        if images.dtype == torch.uint8:
+            images = images.float().div_(255)
+        images = self._geometry(images)
+        images = self._color(images)
+        images = self._blur(images)
+        images = (images - self.mean) / self.std
+        return self._erase(images)
+
+    def _geometry(self, images):
+        n, c, in_h, in_w = images.shape
+        out_h = out_w = self.crop_size or in_h
+        dev = images.device
+
+        # Forward transform p' = s * R(angle) * flip * p + t, in pixels about the image centre
+        angle = torch.deg2rad(self._uniform(n, -self.rotation, self.rotation, dev)
+                              + self._uniform(n, -self.affine_degrees, self.affine_degrees, dev))
+        s = self._uniform(n, *self.scale, dev)
+        fx = 1 - 2 * (torch.rand(n, device=dev) < self.hflip).float()
+        fy = 1 - 2 * (torch.rand(n, device=dev) < self.vflip).float()
+        tx = self._uniform(n, -self.translate[0] * out_w, self.translate[0] * out_w, dev).round()
+        ty = self._uniform(n, -self.translate[1] * out_h, self.translate[1] * out_h, dev).round()
+        cos, sin = torch.cos(angle), torch.sin(angle)
+
+        # Inverse (output pixel -> source pixel): flip * R(-angle) * (p' - t) / s
+        a00, a01 = fx * cos / s, fx * sin / s
+        a10, a11 = -fy * sin / s, fy * cos / s
+        b0 = -(a00 * tx + a01 * ty)
+        b1 = -(a10 * tx + a11 * ty)
+
+        # Random crop offset, as a shift between the crop and input centres
+        ox = torch.randint(0, in_w - out_w + 1, (n,), device=dev).float()
+        oy = torch.randint(0, in_h - out_h + 1, (n,), device=dev).float()
+        b0 = b0 + ox + out_w / 2 - in_w / 2
+        b1 = b1 + oy + out_h / 2 - in_h / 2
+
+        # Normalised output coords -> output pixels -> source pixels -> normalised input coords
+        theta = torch.stack([
+            torch.stack([a00 * out_w / in_w, a01 * out_h / in_w, 2 * b0 / in_w], dim=1),
+            torch.stack([a10 * out_w / in_h, a11 * out_h / in_h, 2 * b1 / in_h], dim=1),
+        ], dim=1)
+        grid = F.affine_grid(theta, (n, c, out_h, out_w), align_corners=False)
+        return F.grid_sample(images, grid, mode='bilinear', padding_mode='zeros', align_corners=False)
+
+    def _color(self, images):
+        n, dev = images.shape[0], images.device
+        view = (n, 1, 1, 1)
+        b = self._uniform(n, 1 - self.brightness, 1 + self.brightness, dev).view(view)
+        images = (images * b).clamp_(0, 1)
+        c = self._uniform(n, 1 - self.contrast, 1 + self.contrast, dev).view(view)
+        mean = (images * self.gray).sum(1, keepdim=True).mean((2, 3), keepdim=True)
+        images = (c * images + (1 - c) * mean).clamp_(0, 1)
+        s = self._uniform(n, 1 - self.saturation, 1 + self.saturation, dev).view(view)
+        gray = (images * self.gray).sum(1, keepdim=True)
+        images = (s * images + (1 - s) * gray).clamp_(0, 1)
+
+        theta = self._uniform(n, -self.hue, self.hue, dev) * 2 * math.pi
+        cos, sin = torch.cos(theta), torch.sin(theta)
+        rotation = torch.zeros(n, 3, 3, device=dev)
+        rotation[:, 0, 0] = 1
+        rotation[:, 1, 1], rotation[:, 1, 2] = cos, -sin
+        rotation[:, 2, 1], rotation[:, 2, 2] = sin, cos
+        matrix = self.yiq_inv @ rotation @ self.yiq
+        return torch.einsum('nij,njhw->nihw', matrix, images).clamp_(0, 1)
+
+    def _blur(self, images):
+        selected = (torch.rand(images.shape[0], device=images.device) < self.blur_p).nonzero().squeeze(1)
+        if selected.numel() == 0:
+            return images
+        subset = images[selected]
+        m, c, h, w = subset.shape
+        sigma = self._uniform(m, *self.blur_sigma, images.device)
+        kernel = torch.exp(-torch.tensor([1.0, 0.0, 1.0], device=images.device) / (2 * sigma[:, None] ** 2))
+        kernel = (kernel / kernel.sum(1, keepdim=True)).repeat_interleave(c, dim=0)  # (m*c, 3)
+        flat = F.pad(subset.reshape(1, m * c, h, w), (1, 1, 1, 1), mode='reflect')
+        flat = F.conv2d(flat, kernel.view(m * c, 1, 1, 3), groups=m * c)
+        flat = F.conv2d(flat, kernel.view(m * c, 1, 3, 1), groups=m * c)
+        images[selected] = flat.view(m, c, h, w)
+        return images
+
+    def _erase(self, images):
+        n, _, h, w = images.shape
+        dev = images.device
+        area = self._uniform(n, *self.erase_scale, dev) * h * w
+        ratio = torch.exp(self._uniform(n, math.log(self.erase_ratio[0]), math.log(self.erase_ratio[1]), dev))
+        eh = (area * ratio).sqrt().round().clamp(1, h)
+        ew = (area / ratio).sqrt().round().clamp(1, w)
+        top = (torch.rand(n, device=dev) * (h - eh + 1)).floor()
+        left = (torch.rand(n, device=dev) * (w - ew + 1)).floor()
+        rows = torch.arange(h, device=dev).view(1, h, 1)
+        cols = torch.arange(w, device=dev).view(1, 1, w)
+        mask = ((rows >= top.view(n, 1, 1)) & (rows < (top + eh).view(n, 1, 1))
+                & (cols >= left.view(n, 1, 1)) & (cols < (left + ew).view(n, 1, 1))
+                & (torch.rand(n, device=dev) < self.erase_p).view(n, 1, 1))
+        return images.masked_fill_(mask.unsqueeze(1), 0)
@@ -0,0 +1,75 @@
+#!/usr/bin/env python3
+"""
+PathoVision Augmentation Benchmark
+==================================
+Images/sec of the training augmentation in train_anti_overfitting.py:
+
+- pil:          train_transform, one PIL image at a time (DataLoader worker)
+- shards:       train_tensor_transform, one uint8 shard image at a time
+- batch-cpu:    BatchAugment on collated batches, on the CPU
+- batch-cuda:   the same on the GPU, when one is available
+
+Per-image pipelines run single-threaded, like a DataLoader worker. Inputs
+are synthetic 256x256 RGB images, so decoding is not measured.
+
+Usage:
+    python ml/bench_augment.py [--images 512] [--batch-size 16] [--threads 1]
+"""
+
+import argparse
+import time
+
+import numpy as np
+import torch
+from PIL import Image
+
+from batch_augment import BatchAugment
+from train_anti_overfitting import train_tensor_transform, train_transform
+
+
+def timed(fn, images):
+    fn()  # warm up
+    started = time.perf_counter()
+    fn()
+    return images / (time.perf_counter() - started)
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.split('\n\n')[0])
+    parser.add_argument('--images', type=int, default=512)
+    parser.add_argument('--batch-size', type=int, default=16)
+    parser.add_argument('--threads', type=int, default=1, help='torch threads for the batched CPU run')
+    args = parser.parse_args()
+
+    rng = np.random.default_rng(0)
+    arrays = rng.integers(0, 256, (args.images, 256, 256, 3), dtype=np.uint8)
+    pil_images = [Image.fromarray(a) for a in arrays]
+    tensors = torch.from_numpy(arrays).permute(0, 3, 1, 2).contiguous()
+    batches = list(tensors.split(args.batch_size))
+
+    results = {}
+    torch.set_num_threads(1)
+    results['pil'] = timed(lambda: [train_transform(img) for img in pil_images], args.images)
+    results['shards'] = timed(lambda: [train_tensor_transform(t) for t in tensors], args.images)
+
+    torch.set_num_threads(args.threads)
+    augment = BatchAugment()
+    results['batch-cpu'] = timed(lambda: [augment(b) for b in batches], args.images)
+
+    if torch.cuda.is_available():
+        augment = augment.cuda()
+        gpu_batches = [b.cuda() for b in batches]
+
+        def on_gpu():
+            for b in gpu_batches:
+                augment(b)
+            torch.cuda.synchronize()
+        results['batch-cuda'] = timed(on_gpu, args.images)
+
+    print(f'{"pipeline":<12} {"images/s":>10} {"vs pil":>8}')
+    for name, rate in results.items():
+        print(f'{name:<12} {rate:>10.1f} {rate / results["pil"]:>7.1f}x')
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,95 @@
+#!/usr/bin/env python3
+"""
+PathoVision Distributed Scaling Benchmark
+=========================================
+Training throughput of the train_anti_overfitting.py model under DDP
+(gloo backend) with 1, 2, 4 and 8 processes on this machine, and the
+scaling efficiency:
+
+    efficiency(N) = images/sec(N) / (N * images/sec(1))
+
+Each process trains on a fixed per-process batch of synthetic 224x224
+images in fp32 with cpu_count / N threads, so data loading is not
+measured. Efficiency well below 1 points at the gradient all-reduce or at
+memory bandwidth; process counts above the core count are oversubscribed.
+
+Usage:
+    python ml/bench_distributed.py [--procs 1 2 4 8] [--steps 10] [--batch-size 16]
+"""
+
+import argparse
+import contextlib
+import io
+import json
+import os
+import tempfile
+import time
+
+import torch
+import torch.nn as nn
+import torch.optim as optim
+from torch.nn.parallel import DistributedDataParallel
+
+from distributed import barrier, cleanup, setup, spawn
+from train_anti_overfitting import CONFIG, create_model
+
+
+def _worker(batch_size, steps, result_path):
+    rank, world_size = setup()
+    torch.manual_seed(rank)
+    with contextlib.redirect_stdout(io.StringIO()):
+        model = create_model(torch.device('cpu'))
+    ddp_model = DistributedDataParallel(model) if world_size > 1 else model
+    optimizer = optim.Adam([p for p in model.parameters() if p.requires_grad], lr=CONFIG['lr'])
+    criterion = nn.CrossEntropyLoss()
+    images = torch.randn(batch_size, 3, 224, 224)
+    labels = torch.randint(0, 2, (batch_size,))
+
+    def step():
+        optimizer.zero_grad(set_to_none=True)
+        criterion(ddp_model(images), labels).backward()
+        optimizer.step()
+
+    step()  # warm up
+    barrier()
+    started = time.perf_counter()
+    for _ in range(steps):
+        step()
+    barrier()
+    elapsed = time.perf_counter() - started
+    if rank == 0:
+        with open(result_path, 'w') as f:
+            json.dump({'images_per_sec': world_size * batch_size * steps / elapsed,
+                       'threads': torch.get_num_threads()}, f)
+    cleanup()
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.split('\n\n')[0])
+    parser.add_argument('--procs', type=int, nargs='+', default=[1, 2, 4, 8])
+    parser.add_argument('--steps', type=int, default=10)
+    parser.add_argument('--batch-size', type=int, default=CONFIG['batch_size'], help='per process')
+    args = parser.parse_args()
+
+    cores = os.cpu_count()
+    results = {}
+    with tempfile.TemporaryDirectory() as tmp:
+        for nproc in args.procs:
+            result_path = os.path.join(tmp, f'{nproc}.json')
+            spawn(_worker, nproc, args.batch_size, args.steps, result_path)
+            with open(result_path) as f:
+                results[nproc] = json.load(f)
+            print(f'  {nproc} process(es): {results[nproc]["images_per_sec"]:.1f} img/s')
+
+    base = results[min(results)]['images_per_sec'] / min(results)
+    print(f'\n{cores} CPU cores, batch {args.batch_size} per process')
+    print(f'{"procs":>5} {"threads":>8} {"images/s":>10} {"speedup":>8} {"efficiency":>11}')
+    for nproc, result in results.items():
+        rate = result['images_per_sec']
+        note = '  (oversubscribed)' if nproc > cores else ''
+        print(f'{nproc:>5} {result["threads"]:>8} {rate:>10.1f} {rate / (base * min(results)):>7.2f}x '
+              f'{rate / (base * nproc):>10.0%}{note}')
+
+
+if __name__ == '__main__':
+    main()
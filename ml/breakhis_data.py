@@ -0,0 +1,335 @@
+#!/usr/bin/env python3
+"""
+PathoVision BreakHis Data Helpers
+=================================
+Shared by the training scripts (keep this file next to them, also when
+uploading the code to Kaggle).
+
+- Image manifest: one validation pass over the dataset, cached on disk and
+  keyed on (path, size, mtime), so reruns only re-check files that changed
+- Shards: images decoded and resized once into memory-mapped uint8 .npy
+  files, read back by ShardDataset without re-decoding PNGs every epoch
+- Split manifest: the patient-level train/val/test split and CV folds,
+  computed once and read back by every script
+"""
+
+import glob
+import hashlib
+import json
+import os
+import re
+import time
+from concurrent.futures import ProcessPoolExecutor
+
+import numpy as np
+import pandas as pd
+import torch
+from PIL import Image
+from sklearn.model_selection import StratifiedKFold, train_test_split
+from torch.utils.data import Dataset
+from tqdm import tqdm
+
+from ranks import log
+
+MANIFEST_VERSION = 1
+SHARDS_VERSION = 1
+SHARD_IMAGES = 1024    # Images per shard file
+CONVERT_CHUNK = 64     # Images per conversion task
+SPLITS_VERSION = 1
+
+# ============================================================
+# PATIENT IDS
+# ============================================================
+# SOB_<class>_<tumor type>-<patient>-<magnification>-<sequence>.png
+PATIENT_PATTERN = re.compile(r'SOB_[BM]_[^-]+-(.+)-\d+-\d+\.\w+$')
+
+def extract_patient_id(filepath):
+    """Extract patient ID from BreakHis filename.
+    Format: SOB_B_A-14-22549AB-400-001.png -> 14-22549AB
+    """
+    filename = os.path.basename(filepath)
+    match = PATIENT_PATTERN.match(filename)
+    return match.group(1) if match else filename
+
+# ============================================================
+# IMAGE MANIFEST (CACHED VALIDATION)
+# ============================================================
+def probe_image(path, full_decode=False):
+    """Check one image; returns (valid, width, height, mode, error).
+
+    By default only the header is parsed and the file's chunk checksums are
+    verified (Image.verify), which catches truncated and corrupted PNGs
+    without decompressing pixels. full_decode=True decodes every pixel.
+    """
+    try:
+        with Image.open(path) as img:
+            width, height = img.size
+            mode = img.mode
+            if full_decode:
+                img.convert('RGB').load()
+            else:
+                img.verify()
+    except Exception as e:
+        return False, 0, 0, '', f'{type(e).__name__}: {e}'
+    if width <= 0 or height <= 0:
+        return False, width, height, mode, 'empty image'
+    return True, width, height, mode, ''
+
+def _probe(args):
+    return probe_image(*args)
+
+def _write_json_atomic(data, path):
+    os.makedirs(os.path.dirname(os.path.abspath(path)), exist_ok=True)
+    tmp = f'{path}.tmp'
+    with open(tmp, 'w') as f:
+        json.dump(data, f)
+    os.replace(tmp, path)
+
+def _read_manifest(path):
+    try:
+        with open(path) as f:
+            data = json.load(f)
+    except (OSError, ValueError):
+        return {}
+    if data.get('version') != MANIFEST_VERSION:
+        return {}
+    return {row['path']: row for row in data['images']}
+
+def build_manifest(paths, labels, manifest_path, workers=None, full_decode=False):
+    """Validate images in a process pool and cache the results.
+
+    Returns a DataFrame with one row per image: path, label, patient_id,
+    size, mtime_ns, valid, width, height, mode, error. Rows whose file size
+    and mtime are unchanged since the last run are taken from the manifest
+    at manifest_path instead of being re-checked.
+    """
+    cached = _read_manifest(manifest_path)
+    check = 'decode' if full_decode else 'verify'
+
+    rows, stale = [], []
+    for path, label in zip(paths, labels):
+        try:
+            stat = os.stat(path)
+        except OSError as e:
+            rows.append({'path': path, 'size': 0, 'mtime_ns': 0, 'valid': False, 'width': 0,
+                         'height': 0, 'mode': '', 'error': f'{type(e).__name__}: {e}', 'check': check})
+        else:
+            row = cached.get(path)
+            # A full decode also satisfies a later verify-only run, not vice versa
+            if (row is None or row['size'] != stat.st_size or row['mtime_ns'] != stat.st_mtime_ns
+                    or (full_decode and row['check'] != 'decode')):
+                row = {'path': path, 'size': stat.st_size, 'mtime_ns': stat.st_mtime_ns, 'check': check}
+                stale.append(row)
+            rows.append(row)
+        rows[-1]['label'] = int(label)
+        rows[-1]['patient_id'] = extract_patient_id(path)
+
+    log(f'  Manifest: {len(rows) - len(stale)} cached, {len(stale)} to check')
+    if stale:
+        started = time.perf_counter()
+        with ProcessPoolExecutor(max_workers=workers) as pool:
+            results = pool.map(_probe, [(row['path'], full_decode) for row in stale], chunksize=64)
+            for row, result in zip(stale, tqdm(results, total=len(stale), desc='Validating')):
+                row['valid'], row['width'], row['height'], row['mode'], row['error'] = result
+        log(f'  Checked {len(stale)} images in {time.perf_counter() - started:.1f}s')
+    if stale or len(cached) != len(rows):
+        _write_json_atomic({'version': MANIFEST_VERSION, 'images': rows}, manifest_path)
+
+    return pd.DataFrame(rows, columns=['path', 'label', 'patient_id', 'size', 'mtime_ns', 'valid',
+                                       'width', 'height', 'mode', 'error'])
+
+# ============================================================
+# MEMORY-MAPPED SHARDS (PRE-RESIZED IMAGES)
+# ============================================================
+def _fingerprint(df, size):
+    digest = hashlib.sha1(f'{SHARDS_VERSION}:{size}'.encode())
+    for path, nbytes, mtime_ns in zip(df['path'], df['size'], df['mtime_ns']):
+        digest.update(f'{path}\0{nbytes}\0{mtime_ns}\n'.encode())
+    return digest.hexdigest()
+
+def _convert(args):
+    """Resize images into rows start.. of an existing shard file."""
+    shard_path, start, paths, size = args
+    shard = np.load(shard_path, mmap_mode='r+')
+    ok = []
+    for i, path in enumerate(paths):
+        try:
+            with Image.open(path) as img:
+                # Same resampling as T.Resize((size, size)) on a PIL image
+                shard[start + i] = np.asarray(img.convert('RGB').resize((size, size), Image.BILINEAR))
+            ok.append(True)
+        except Exception:
+            ok.append(False)
+    shard.flush()
+    del shard
+    return ok
+
+def build_shards(df, shard_dir, size, workers=None):
+    """Write every image in df (manifest rows) as size x size RGB uint8.
+
+    Shards are (n, size, size, 3) .npy files plus index.json mapping each
+    path to (shard, offset) with its label and patient ID. The index is
+    written last and carries a fingerprint of the inputs, so an unchanged
+    dataset reuses the shards and an interrupted conversion is redone.
+    Returns the index path.
+    """
+    index_path = os.path.join(shard_dir, 'index.json')
+    df = df.sort_values('path')  # Same shards whatever order the caller listed the images in
+    fingerprint = _fingerprint(df, size)
+    try:
+        with open(index_path) as f:
+            if json.load(f).get('fingerprint') == fingerprint:
+                log(f'  Shards: reusing {shard_dir}')
+                return index_path
+    except (OSError, ValueError):
+        pass
+
+    os.makedirs(shard_dir, exist_ok=True)
+    for stale in glob.glob(os.path.join(shard_dir, '*.json')) + glob.glob(os.path.join(shard_dir, 'images-*.npy')):
+        os.remove(stale)
+
+    rows = df[['path', 'label', 'patient_id']].to_dict('records')
+    shards, tasks = [], []
+    for number, first in enumerate(range(0, len(rows), SHARD_IMAGES)):
+        count = min(SHARD_IMAGES, len(rows) - first)
+        name = f'images-{number:03d}.npy'
+        shard_path = os.path.join(shard_dir, name)
+        np.lib.format.open_memmap(shard_path, mode='w+', dtype=np.uint8, shape=(count, size, size, 3)).flush()
+        shards.append(name)
+        for offset, row in enumerate(rows[first:first + count]):
+            row['shard'], row['offset'] = number, offset
+        for start in range(0, count, CONVERT_CHUNK):
+            chunk = rows[first + start:first + min(start + CONVERT_CHUNK, count)]
+            tasks.append((shard_path, start, [row['path'] for row in chunk], size))
+
+    started = time.perf_counter()
+    with ProcessPoolExecutor(max_workers=workers) as pool:
+        results = pool.map(_convert, tasks)
+        ok = [flag for flags in tqdm(results, total=len(tasks), desc=f'Converting {size}px') for flag in flags]
+    images = [row for row, converted in zip(rows, ok) if converted]
+    log(f'  Shards: {len(images)} images at {size}px in {time.perf_counter() - started:.1f}s '
+        f'({len(rows) - len(images)} unreadable)')
+
+    _write_json_atomic({'version': SHARDS_VERSION, 'fingerprint': fingerprint, 'size': size,
+                        'shards': shards, 'images': images}, index_path)
+    return index_path
+
+class ShardDataset(Dataset):
+    """Images from build_shards() as uint8 CHW tensors.
+
+    Each item is a view into the memory-mapped shard (copy-on-write, so
+    transforms may modify it), so memory use does not grow with the
+    dataset. paths selects and orders the images; paths missing from the
+    index (unreadable files) are skipped and counted in `missing`.
+    """
+    def __init__(self, index_path, paths=None, transform=None):
+        with open(index_path) as f:
+            index = json.load(f)
+        self.shard_dir = os.path.dirname(index_path)
+        self.shard_files = index['shards']
+        rows = index['images']
+        if paths is not None:
+            by_path = {row['path']: row for row in rows}
+            rows = [by_path[path] for path in paths if path in by_path]
+            self.missing = len(paths) - len(rows)
+        else:
+            self.missing = 0
+        self.shard = np.array([row['shard'] for row in rows], dtype=np.int64)
+        self.offset = np.array([row['offset'] for row in rows], dtype=np.int64)
+        self.samples = [(row['path'], row['label']) for row in rows]  # As in ImageFolder
+        self.targets = [row['label'] for row in rows]
+        self.patient_ids = [extract_patient_id(path) for path, _ in self.samples]
+        self.transform = transform
+        self._shards = None
+
+    def __getstate__(self):
+        # Memmaps would be pickled as full arrays; workers map the files themselves
+        state = self.__dict__.copy()
+        state['_shards'] = None
+        return state
+
+    def __len__(self):
+        return len(self.targets)
+
+    def __getitem__(self, idx):
+        if self._shards is None:
+            self._shards = [np.load(os.path.join(self.shard_dir, name), mmap_mode='c')
+                            for name in self.shard_files]
+        img = torch.from_numpy(self._shards[self.shard[idx]][self.offset[idx]]).permute(2, 0, 1)
+        if self.transform:
+            img = self.transform(img)
+        return img, self.targets[idx]
+
+# ============================================================
+# PATIENT-LEVEL SPLITS (PERSISTED)
+# ============================================================
+def split_patients(df, test_size=0.2, val_size=0.25, folds=5, seed=42):
+    """Assign every image to a split and a CV fold, grouped by patient.
+
+    df needs path, label and patient_id columns. Patients (labelled by their
+    first image) are split stratified by label into test and train+val, and
+    train+val into train and val (val_size is a fraction of it). The
+    train+val patients are also dealt into `folds` stratified folds for
+    cross-validation; test patients get fold -1. Returns a DataFrame with
+    path, label, patient_id, split ('train'/'val'/'test') and fold.
+    """
+    patients = df.groupby('patient_id', sort=True)['label'].first()
+    train_val, test = train_test_split(patients.index.to_numpy(), test_size=test_size,
+                                       stratify=patients.to_numpy(), random_state=seed)
+    train, val = train_test_split(train_val, test_size=val_size,
+                                  stratify=patients.loc[train_val].to_numpy(), random_state=seed)
+
+    split = pd.Series('train', index=patients.index)
+    split.loc[val] = 'val'
+    split.loc[test] = 'test'
+    fold = pd.Series(-1, index=patients.index)
+    if folds > 1:
+        remaining = np.sort(train_val)
+        kfold = StratifiedKFold(n_splits=folds, shuffle=True, random_state=seed)
+        for number, (_, held_out) in enumerate(kfold.split(remaining, patients.loc[remaining])):
+            fold.loc[remaining[held_out]] = number
+
+    out = df[['path', 'label', 'patient_id']].reset_index(drop=True)
+    out['split'] = out['patient_id'].map(split).to_numpy()
+    out['fold'] = out['patient_id'].map(fold).to_numpy()
+    return out
+
+def _split_fingerprint(df):
+    digest = hashlib.sha1(f'{SPLITS_VERSION}'.encode())
+    for path, label, patient_id in sorted(zip(df['path'], df['label'], df['patient_id'])):
+        digest.update(f'{path}\0{label}\0{patient_id}\n'.encode())
+    return digest.hexdigest()
+
+def load_split_manifest(path):
+    """Split manifest written by build_split_manifest(), as a DataFrame."""
+    with open(path) as f:
+        data = json.load(f)
+    if data.get('version') != SPLITS_VERSION:
+        raise ValueError(f'{path}: split manifest version {data.get("version")}, expected {SPLITS_VERSION}')
+    return pd.DataFrame(data['images'])
+
+def build_split_manifest(df, manifest_path, test_size=0.2, val_size=0.25, folds=5, seed=42):
+    """Split with split_patients() once and persist the result.
+
+    The manifest stores the split parameters and a fingerprint of the
+    images (path, label, patient ID); it is reused while both match, so
+    every script and run trains and evaluates on the same patients. The
+    images are stored column-wise and load straight into a DataFrame.
+    """
+    params = {'test_size': test_size, 'val_size': val_size, 'folds': folds, 'seed': seed}
+    fingerprint = _split_fingerprint(df)
+    try:
+        with open(manifest_path) as f:
+            data = json.load(f)
+        if (data.get('version') == SPLITS_VERSION and data['params'] == params
+                and data['fingerprint'] == fingerprint):
+            log(f'  Splits: reusing {manifest_path}')
+            return pd.DataFrame(data['images'])
+    except (OSError, ValueError, KeyError):
+        pass
+
+    splits = split_patients(df, **params).sort_values('path', ignore_index=True)
+    _write_json_atomic({'version': SPLITS_VERSION, 'params': params, 'fingerprint': fingerprint,
+                        'images': splits.to_dict('list')}, manifest_path)
+    log(f'  Splits: {splits["patient_id"].nunique()} patients written to {manifest_path}')
+    return splits
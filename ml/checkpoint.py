@@ -0,0 +1,179 @@
+#!/usr/bin/env python3
+"""
+PathoVision Training Checkpoints
+================================
+Full training state, saved every `checkpoint_every` epochs so a crash
+costs at most that many epochs of work:
+
+- model, optimizer, scheduler and GradScaler state
+- early-stopping state and metric history
+- Python, NumPy and torch (CPU and CUDA) RNG states of every rank: the
+  weighted sampler, DataLoader worker seeds and BatchAugment all draw from
+  these, so a resumed run replays the same batches and augmentations
+
+State is copied to CPU on the training thread and written by a background
+thread to a temporary file that is then renamed over the target, so a file
+on disk is always a complete checkpoint. The best model (by validation
+AUC) is written the same way instead of being kept in memory.
+
+Layout of checkpoint_dir: last.pt (latest full state), best.pt (weights).
+Under torch.distributed every rank calls save() (the RNG states are
+gathered) but only rank 0 writes.
+"""
+
+import copy
+import os
+import random
+from concurrent.futures import ThreadPoolExecutor
+
+import numpy as np
+import torch
+import torch.distributed as dist
+
+from ranks import log
+
+CHECKPOINT_VERSION = 2
+
+
+def _snapshot(obj):
+    """Deep copy with every tensor cloned to CPU (training keeps mutating the originals)."""
+    if isinstance(obj, torch.Tensor):
+        return obj.detach().to('cpu', copy=True)
+    if isinstance(obj, dict):
+        return {k: _snapshot(v) for k, v in obj.items()}
+    if isinstance(obj, (list, tuple)):
+        return type(obj)(_snapshot(v) for v in obj)
+    return copy.deepcopy(obj)
+
+
+def save_atomic(obj, path):
+    tmp = f'{path}.tmp'
+    with open(tmp, 'wb') as f:
+        torch.save(obj, f)
+        f.flush()
+        os.fsync(f.fileno())
+    os.replace(tmp, path)
+
+
+def rng_state():
+    return {
+        'python': random.getstate(),
+        'numpy': np.random.get_state(),
+        'torch': torch.get_rng_state(),
+        'cuda': torch.cuda.get_rng_state_all() if torch.cuda.is_available() else [],
+    }
+
+
+def _distributed():
+    return dist.is_available() and dist.is_initialized()
+
+
+def _all_rng_states():
+    """RNG states of every rank, indexed by rank."""
+    if not _distributed():
+        return [rng_state()]
+    states = [None] * dist.get_world_size()
+    dist.all_gather_object(states, rng_state())
+    return states
+
+
+def set_rng_state(state):
+    random.setstate(state['python'])
+    np.random.set_state(state['numpy'])
+    torch.set_rng_state(state['torch'])
+    if state['cuda'] and torch.cuda.is_available():
+        torch.cuda.set_rng_state_all(state['cuda'])
+
+
+class Checkpointer:
+    """Background, atomic checkpoint writer for one training run.
+
+    A fresh run (resume=False) deletes the checkpoints of the previous run
+    in directory, so they can neither be resumed nor loaded as best model.
+    With enabled=False (ranks other than 0) nothing is written or deleted.
+    """
+    def __init__(self, directory, every=1, resume=False, enabled=True):
+        self.every = every
+        self.enabled = enabled
+        self.last_path = os.path.join(directory, 'last.pt')
+        self.best_path = os.path.join(directory, 'best.pt')
+        if enabled:
+            os.makedirs(directory, exist_ok=True)
+        if enabled and not resume:
+            for path in (self.last_path, self.best_path):
+                if os.path.exists(path):
+                    os.remove(path)
+        # One writer thread: files are written in submission order
+        self._executor = ThreadPoolExecutor(max_workers=1, thread_name_prefix='checkpoint')
+        self._pending = []
+
+    def _submit(self, state, path):
+        if not self.enabled:
+            return
+        # Surface failures of earlier writes instead of losing them
+        pending = []
+        for future in self._pending:
+            if future.done():
+                future.result()
+            else:
+                pending.append(future)
+        pending.append(self._executor.submit(save_atomic, _snapshot(state), path))
+        self._pending = pending
+
+    def wait(self):
+        """Block until every submitted checkpoint is on disk."""
+        pending, self._pending = self._pending, []
+        for future in pending:
+            future.result()
+
+    def due(self, epoch, last=False):
+        return last or epoch % self.every == 0
+
+    def save(self, epoch, model, optimizer, scheduler, perf, early_stopping, history):
+        """Queue the full state after `epoch` (1-based) completed epochs."""
+        rng = _all_rng_states()  # Collective: every rank must call save()
+        self._submit({
+            'version': CHECKPOINT_VERSION,
+            'epoch': epoch,
+            'model': model.state_dict(),
+            'optimizer': optimizer.state_dict(),
+            'scheduler': scheduler.state_dict() if scheduler is not None else None,
+            'scaler': perf.state_dict(),
+            'early_stopping': early_stopping.state_dict(),
+            'history': history,
+            'rng': rng,
+        }, self.last_path)
+
+    def save_best(self, model):
+        self._submit(model.state_dict(), self.best_path)
+
+    def load_best(self, model):
+        self.wait()
+        model.load_state_dict(torch.load(self.best_path, map_location='cpu'))
+
+    def resume(self, model, optimizer, scheduler, perf, early_stopping):
+        """Restore last.pt into the given objects; returns (epoch, history).
+
+        Call it last before the training loop: it also restores the RNG
+        states, which anything drawing random numbers afterwards would shift.
+        """
+        if not os.path.exists(self.last_path):
+            raise FileNotFoundError(f'No checkpoint to resume from: {self.last_path}')
+        # Our own file; it pickles the NumPy RNG state, which weights_only loading rejects
+        state = torch.load(self.last_path, map_location='cpu', weights_only=False)
+        if state.get('version') != CHECKPOINT_VERSION:
+            raise ValueError(f'{self.last_path}: checkpoint version {state.get("version")}, '
+                             f'expected {CHECKPOINT_VERSION}')
+        model.load_state_dict(state['model'])
+        optimizer.load_state_dict(state['optimizer'])
+        if scheduler is not None:
+            scheduler.load_state_dict(state['scheduler'])
+        perf.load_state_dict(state['scaler'])
+        early_stopping.load_state_dict(state['early_stopping'])
+        world_size, rank = (dist.get_world_size(), dist.get_rank()) if _distributed() else (1, 0)
+        if len(state['rng']) != world_size:
+            raise ValueError(f'{self.last_path} was written by {len(state["rng"])} process(es); '
+                             f'resume with the same number (running {world_size})')
+        set_rng_state(state['rng'][rank])
+        log(f'↻ Resuming after epoch {state["epoch"]} from {self.last_path}')
+        return state['epoch'], state['history']
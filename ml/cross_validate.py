@@ -0,0 +1,232 @@
+#!/usr/bin/env python3
+"""
+PathoVision Cross-Validation Runner
+===================================
+Patient-grouped k-fold cross-validation of train_anti_overfitting.py.
+With ~82 patients a single validation split gives a noisy AUC; here every
+train+val patient is validated exactly once (the test patients stay fixed).
+
+- Folds come from the split manifest (cache_dir/breakhis_splits.json,
+  CONFIG['cv_folds'] folds); the manifest and image shards are built once
+  up front and then shared read-only by every fold
+- Folds train in parallel worker processes sized to the machine: each gets
+  cpu_count / jobs threads (or its own GPU)
+- Each fold writes to output_dir/fold<k>/: config.json, train.log,
+  checkpoints/, the trained model and result.json (only on success)
+- Completed folds are skipped, so rerunning the same command retries only
+  the failed folds; these resume from their last checkpoint
+- output_dir/summary.json and summary.csv hold per-fold metrics and their
+  mean and standard deviation
+
+Usage:
+    python ml/cross_validate.py [--folds 0 2] [--jobs 2] [--output-dir cv] [--force]
+"""
+
+import argparse
+import json
+import os
+import queue
+import subprocess
+import sys
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+import pandas as pd
+import torch
+
+import train_anti_overfitting
+from train_anti_overfitting import CONFIG, load_dataset, split_by_patient
+
+# Below this many intra-op threads per fold, more folds at once stop paying off
+MIN_THREADS_PER_FOLD = 4
+
+METRICS = ['best_val_auc', 'test_auc', 'test_acc', 'test_f1', 'sensitivity', 'specificity']
+
+
+def _write_json(data, path):
+    tmp = f'{path}.tmp'
+    with open(tmp, 'w') as f:
+        json.dump(data, f, indent=2)
+    os.replace(tmp, path)
+
+
+def _read_json(path):
+    try:
+        with open(path) as f:
+            return json.load(f)
+    except (OSError, ValueError):
+        return None
+
+
+def fold_config(fold, output_dir):
+    """CONFIG for one fold: its own validation patients, checkpoints and model directory."""
+    fold_dir = os.path.join(output_dir, f'fold{fold}')
+    return dict(CONFIG, fold=fold, save_dir=fold_dir, checkpoint_dir=os.path.join(fold_dir, 'checkpoints'))
+
+
+def fold_status(config, force=False):
+    """'done', 'resume' or 'new' for the fold described by config.
+
+    A result or checkpoint only counts if it was produced with the same
+    config; after a CONFIG change every fold trains again.
+    """
+    fold_dir = config['save_dir']
+    same_config = not force and _read_json(os.path.join(fold_dir, 'config.json')) == config
+    if same_config and os.path.exists(os.path.join(fold_dir, 'result.json')):
+        return 'done'
+    if same_config and os.path.exists(os.path.join(config['checkpoint_dir'], 'last.pt')):
+        return 'resume'
+    return 'new'
+
+
+def run_fold(config, status, threads, gpu=None):
+    """Train one fold in a fresh process; returns its exit code."""
+    fold_dir = config['save_dir']
+    os.makedirs(fold_dir, exist_ok=True)
+    if status == 'new':
+        for name in ('result.json', 'config.json'):
+            if os.path.exists(os.path.join(fold_dir, name)):
+                os.remove(os.path.join(fold_dir, name))
+    _write_json(config, os.path.join(fold_dir, 'config.json'))
+
+    env = dict(os.environ, OMP_NUM_THREADS=str(threads), MKL_NUM_THREADS=str(threads))
+    for name in ('RANK', 'LOCAL_RANK', 'WORLD_SIZE', 'LOCAL_WORLD_SIZE'):
+        env.pop(name, None)  # Each fold is a single-process run
+    if gpu is not None:
+        env['CUDA_VISIBLE_DEVICES'] = str(gpu)
+    command = [sys.executable, os.path.abspath(__file__), '--worker', fold_dir, '--threads', str(threads)]
+    if status == 'resume':
+        command.append('--resume')
+    with open(os.path.join(fold_dir, 'train.log'), 'a') as log:
+        log.write(f'\n===== {time.strftime("%Y-%m-%d %H:%M:%S")} {" ".join(command)}\n')
+        log.flush()
+        return subprocess.run(command, stdout=log, stderr=subprocess.STDOUT, env=env).returncode
+
+
+def _worker(fold_dir, threads, resume):
+    """Entry point of a fold process: train with fold_dir/config.json, write result.json."""
+    torch.set_num_threads(threads)
+    with open(os.path.join(fold_dir, 'config.json')) as f:
+        CONFIG.update(json.load(f))
+    started = time.perf_counter()
+    result = train_anti_overfitting.main(resume)
+    result['seconds'] = time.perf_counter() - started
+    _write_json({k: float(v) if k in METRICS else v for k, v in result.items()},
+                os.path.join(fold_dir, 'result.json'))
+
+
+def summarize(output_dir, folds):
+    """Per-fold metrics, mean and std of every fold with a current result."""
+    results = []
+    for fold in folds:
+        config = fold_config(fold, output_dir)
+        if fold_status(config) == 'done':
+            results.append(_read_json(os.path.join(config['save_dir'], 'result.json')))
+    if not results:
+        return None
+    df = pd.DataFrame(results).set_index('fold').sort_index()
+    summary = {
+        'folds': len(folds),
+        'completed': df.index.tolist(),
+        'missing': sorted(set(folds) - set(df.index)),
+        'mean': df[METRICS].mean().to_dict(),
+        'std': df[METRICS].std(ddof=1).fillna(0.0).to_dict(),
+        'results': results,
+    }
+    _write_json(summary, os.path.join(output_dir, 'summary.json'))
+    df.to_csv(os.path.join(output_dir, 'summary.csv'))
+    return df, summary
+
+
+def main():
+    parser = argparse.ArgumentParser(description='PathoVision patient-grouped cross-validation')
+    parser.add_argument('--folds', type=int, nargs='+', default=None,
+                        help=f'folds to train (default: all {CONFIG["cv_folds"]})')
+    parser.add_argument('--jobs', type=int, default=None,
+                        help='folds trained at once (default: one per GPU, or cpu_count / '
+                             f'{MIN_THREADS_PER_FOLD} on CPU)')
+    parser.add_argument('--output-dir', default='cv', help='per-fold results and the summary')
+    parser.add_argument('--force', action='store_true', help='retrain completed folds too')
+    parser.add_argument('--worker', help=argparse.SUPPRESS)
+    parser.add_argument('--threads', type=int, default=1, help=argparse.SUPPRESS)
+    parser.add_argument('--resume', action='store_true', help=argparse.SUPPRESS)
+    args = parser.parse_args()
+    if args.worker:
+        _worker(args.worker, args.threads, args.resume)
+        return
+
+    print('=' * 60)
+    print(f'PathoVision {CONFIG["cv_folds"]}-Fold Patient-Grouped Cross-Validation')
+    print('=' * 60)
+
+    all_folds = list(range(CONFIG['cv_folds']))
+    folds = args.folds if args.folds is not None else all_folds
+    unknown = sorted(set(folds) - set(all_folds))
+    if unknown:
+        parser.error(f'no fold(s) {unknown}: cv_folds is {CONFIG["cv_folds"]}')
+
+    # Shared cache: shards and split manifest are built here once, the folds only read them
+    _, dataset, _, _ = load_dataset(CONFIG['data_root'])
+    split_by_patient(dataset, seed=CONFIG['seed'])
+
+    status = {fold: fold_status(fold_config(fold, args.output_dir), args.force) for fold in folds}
+    pending = [fold for fold in folds if status[fold] != 'done']
+    skipped = [fold for fold in folds if status[fold] == 'done']
+    if skipped:
+        print(f'\n✓ Already trained (use --force to retrain): folds {skipped}')
+
+    failed = []
+    if pending:
+        gpus = torch.cuda.device_count()
+        cores = os.cpu_count() or 1
+        jobs = args.jobs or (gpus if gpus else cores // MIN_THREADS_PER_FOLD)
+        jobs = max(1, min(jobs, len(pending)))
+        threads = max(1, cores // jobs)
+        print(f'\n🚀 Training folds {pending}: {jobs} at a time, {threads} threads each'
+              f'{f", {gpus} GPU(s)" if gpus else ""}')
+
+        # Worker slots: a slot keeps its GPU for every fold it runs
+        slots = queue.Queue()
+        for slot in range(jobs):
+            slots.put(slot)
+
+        def train(fold):
+            slot = slots.get()
+            try:
+                started = time.perf_counter()
+                code = run_fold(fold_config(fold, args.output_dir), status[fold], threads,
+                                gpu=slot % gpus if gpus else None)
+            finally:
+                slots.put(slot)
+            log = os.path.join(args.output_dir, f'fold{fold}', 'train.log')
+            resumed = ' (resumed)' if status[fold] == 'resume' else ''
+            if code == 0:
+                print(f'  ✓ Fold {fold} done in {time.perf_counter() - started:.0f}s{resumed}')
+            else:
+                print(f'  ❌ Fold {fold} failed (exit code {code}){resumed}, see {log}')
+                failed.append(fold)
+
+        with ThreadPoolExecutor(max_workers=jobs) as executor:
+            list(executor.map(train, pending))
+
+    summary = summarize(args.output_dir, all_folds)
+    if summary is not None:
+        df, summary = summary
+        print('\n' + '=' * 60)
+        print('CROSS-VALIDATION SUMMARY')
+        print('=' * 60)
+        print(df[['epochs'] + METRICS].to_string(float_format='{:.4f}'.format))
+        print()
+        for metric in METRICS:
+            print(f'  {metric:<13} {summary["mean"][metric]:.4f} ± {summary["std"][metric]:.4f}')
+        if summary['missing']:
+            print(f'\n  ⚠ Not trained yet: folds {summary["missing"]}')
+        print(f'\n✅ Summary saved to: {os.path.join(args.output_dir, "summary.json")}')
+    if failed:
+        print(f'\n❌ Failed folds: {sorted(failed)}. Rerun the same command to retry them '
+              f'(completed folds are skipped, failed ones resume from their last checkpoint)')
+        sys.exit(1)
+
+
+if __name__ == '__main__':
+    main()
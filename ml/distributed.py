@@ -0,0 +1,165 @@
+#!/usr/bin/env python3
+"""
+PathoVision Distributed Training
+================================
+Data-parallel training across CPU processes (gloo backend, no GPU needed):
+
+- one machine:   python ml/train_anti_overfitting.py --nproc 4
+- several nodes: torchrun --nnodes 2 --nproc-per-node 4 --rdzv-endpoint HOST:PORT \\
+                     ml/train_anti_overfitting.py
+
+Every rank computes the same patient-level split (checked at start-up) and
+trains on its share of each epoch's class-balanced sample. Validation is
+sharded and the metrics are gathered across ranks, so every rank makes the
+same early-stopping decision. Only rank 0 reports (ranks.log()) and writes
+checkpoints and the model.
+
+Caches (manifests, shards, feature caches) are built under
+main_process_first(): rank 0 first, then the first process of every other
+node, which reuses them if cache_dir is a shared filesystem and builds its
+own copy if it is node-local. Checkpoints are written by rank 0 only, and
+after training rank 0 broadcasts the best weights, so checkpoint_dir may be
+node-local too; --resume on several nodes, however, reads last.pt on every
+rank and needs checkpoint_dir on a shared filesystem (or copied to each node).
+
+Each rank runs cpu_count / processes-per-machine intra-op threads.
+"""
+
+import math
+import os
+import socket
+from contextlib import contextmanager
+
+import torch
+import torch.distributed as dist
+import torch.multiprocessing as mp
+from torch.utils.data import Sampler
+
+from ranks import get_rank, get_world_size, is_local_main, is_main
+
+
+def setup():
+    """Join the process group described by RANK/WORLD_SIZE/MASTER_ADDR/MASTER_PORT.
+
+    Returns (rank, world_size); without WORLD_SIZE (or with 1) training stays
+    single-process and nothing changes.
+    """
+    world_size = int(os.environ.get('WORLD_SIZE', 1))
+    if world_size == 1:
+        return 0, 1
+    dist.init_process_group('gloo', init_method='env://')
+    local_world_size = int(os.environ.get('LOCAL_WORLD_SIZE', world_size))
+    torch.set_num_threads(max(1, (os.cpu_count() or 1) // local_world_size))
+    return get_rank(), world_size
+
+
+def cleanup():
+    if dist.is_available() and dist.is_initialized():
+        dist.destroy_process_group()
+
+
+def barrier():
+    if get_world_size() > 1:
+        dist.barrier()
+
+
+@contextmanager
+def main_process_first():
+    """Run the block on rank 0, then on each other node's first process, then on the rest.
+
+    Caches built in the block are reused by later stages: across nodes when
+    cache_dir is shared, and within each node when it is node-local.
+    """
+    stage = 0 if is_main() else 1 if is_local_main() else 2
+    for _ in range(stage):
+        barrier()
+    yield
+    for _ in range(2 - stage):
+        barrier()
+
+
+def check_consistent(name, value):
+    """Raise if `value` (any picklable object) differs between ranks."""
+    if get_world_size() == 1:
+        return
+    values = [None] * get_world_size()
+    dist.all_gather_object(values, value)
+    if any(v != values[0] for v in values):
+        raise RuntimeError(f'{name} differs across ranks; every rank must see the same data and seed')
+
+
+@torch.no_grad()
+def sync_buffers(model):
+    """Copy rank 0's buffers (BatchNorm running stats) to every rank before evaluation."""
+    if get_world_size() == 1:
+        return
+    for buffer in model.buffers():
+        dist.broadcast(buffer, 0)
+
+
+@torch.no_grad()
+def sync_model(model):
+    """Copy rank 0's parameters and buffers to every rank (e.g. after rank 0 loaded a checkpoint)."""
+    if get_world_size() == 1:
+        return
+    for tensor in model.state_dict().values():
+        dist.broadcast(tensor, 0)
+
+
+class DistributedWeightedSampler(Sampler):
+    """WeightedRandomSampler (with replacement) split across ranks.
+
+    Every epoch each rank draws the same indices from a generator seeded
+    with seed + epoch and keeps every world_size-th one, so the ranks
+    together cover one class-balanced epoch. Call set_epoch() each epoch.
+    """
+    def __init__(self, weights, num_samples, seed=0):
+        self.weights = torch.as_tensor(weights, dtype=torch.double)
+        self.rank, self.world_size = get_rank(), get_world_size()
+        self.num_samples = math.ceil(num_samples / self.world_size)
+        self.seed = seed
+        self.epoch = 0
+
+    def set_epoch(self, epoch):
+        self.epoch = epoch
+
+    def __iter__(self):
+        generator = torch.Generator()
+        generator.manual_seed(self.seed + self.epoch)
+        indices = torch.multinomial(self.weights, self.num_samples * self.world_size,
+                                    replacement=True, generator=generator)
+        return iter(indices[self.rank::self.world_size].tolist())
+
+    def __len__(self):
+        return self.num_samples
+
+
+class DistributedEvalSampler(Sampler):
+    """Every world_size-th index, without padding: gathered metrics stay exact."""
+    def __init__(self, dataset):
+        self.indices = range(get_rank(), len(dataset), get_world_size())
+
+    def __iter__(self):
+        return iter(self.indices)
+
+    def __len__(self):
+        return len(self.indices)
+
+
+def _free_port():
+    with socket.socket() as s:
+        s.bind(('127.0.0.1', 0))
+        return s.getsockname()[1]
+
+
+def _run(local_rank, nproc, fn, args):
+    os.environ.update(RANK=str(local_rank), LOCAL_RANK=str(local_rank),
+                      WORLD_SIZE=str(nproc), LOCAL_WORLD_SIZE=str(nproc))
+    fn(*args)
+
+
+def spawn(fn, nproc, *args):
+    """Run fn(*args) in nproc processes on this machine; fn calls setup()."""
+    os.environ.setdefault('MASTER_ADDR', '127.0.0.1')
+    os.environ.setdefault('MASTER_PORT', str(_free_port()))
+    mp.spawn(_run, args=(nproc, fn, args), nprocs=nproc)
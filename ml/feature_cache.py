@@ -0,0 +1,213 @@
+#!/usr/bin/env python3
+"""
+PathoVision Frozen-Trunk Feature Cache
+======================================
+Both training scripts freeze the ResNet50 layers below layer4 (or below
+layer3[-1]), yet every epoch recomputes their activations, which is most
+of the forward FLOPs. With the feature cache the frozen trunk runs once:
+
+- validation images under the eval transform (1 view)
+- training images under the training augmentation (a fixed number of
+  random views; each epoch picks one view per image at random)
+
+Activations are stored as float16 in memory-mapped .npy files and
+training runs only the unfrozen tail and the head. The trunk always runs
+in eval mode (BatchNorm uses its running statistics), which is what makes
+its output cacheable. check_consistency() compares cached logits with the
+full model on a few validation images.
+
+Cache size: 1024x14x14 float16 = 392 KiB per image and view.
+"""
+
+import hashlib
+import json
+import os
+import random
+
+import numpy as np
+import torch
+import torch.nn as nn
+from torch.utils.data import DataLoader, Dataset, Subset
+from tqdm import tqdm
+
+from ranks import log
+
+CACHE_VERSION = 1
+RESNET_LAYERS = ['conv1', 'bn1', 'relu', 'maxpool', 'layer1', 'layer2', 'layer3', 'layer4']
+
+
+class _Float(nn.Module):
+    """Cached activations are float16; the tail computes in float32."""
+    def forward(self, x):
+        return x.float()
+
+
+def _frozen(module):
+    return all(not p.requires_grad for p in module.parameters())
+
+
+def split_frozen(model):
+    """Split a ResNet into (trunk, tail) at the first trainable block.
+
+    Both share the model's modules, so training the tail trains the model.
+    """
+    trunk, tail = [], []
+    for name in RESNET_LAYERS:
+        module = getattr(model, name)
+        if tail:
+            tail.append(module)
+        elif _frozen(module):
+            trunk.append(module)
+        elif isinstance(module, nn.Sequential):
+            blocks = list(module)
+            first = next(i for i, block in enumerate(blocks) if not _frozen(block))
+            trunk.extend(blocks[:first])
+            tail.extend(blocks[first:])
+        else:
+            tail.append(module)
+    if not trunk:
+        raise ValueError('No frozen layers to cache')
+    tail += [model.avgpool, nn.Flatten(1), model.fc]
+    return nn.Sequential(*trunk).eval(), nn.Sequential(_Float(), *tail)
+
+
+def _paths(dataset):
+    if isinstance(dataset, Subset):
+        paths = _paths(dataset.dataset)
+        return [paths[i] for i in dataset.indices]
+    if hasattr(dataset, 'samples'):
+        return [path for path, _ in dataset.samples]
+    return list(dataset.df['path'])
+
+
+def _transform(dataset):
+    while isinstance(dataset, Subset):
+        dataset = dataset.dataset
+    return getattr(dataset, 'transform', None) or getattr(dataset, 'transforms', None)
+
+
+def _fingerprint(trunk, dataset, views, augment):
+    digest = hashlib.sha1(f'{CACHE_VERSION}:{views}:{_transform(dataset)!r}:{augment!r}'.encode())
+    for tensor in trunk.state_dict().values():
+        digest.update(tensor.detach().cpu().numpy().tobytes())
+    digest.update('\n'.join(_paths(dataset)).encode())
+    return digest.hexdigest()
+
+
+class FeatureDataset(Dataset):
+    """Cached trunk activations; each access returns one random view."""
+    def __init__(self, path, targets, views):
+        self.path = path
+        self.targets = list(targets)
+        self.views = views
+        self._features = None
+
+    def __getstate__(self):
+        state = self.__dict__.copy()
+        state['_features'] = None
+        return state
+
+    def __len__(self):
+        return len(self.targets)
+
+    def __getitem__(self, idx):
+        if self._features is None:
+            self._features = np.load(self.path, mmap_mode='r')
+        view = random.randrange(self.views) if self.views > 1 else 0
+        return torch.from_numpy(np.array(self._features[idx, view])), self.targets[idx]
+
+
+@torch.no_grad()
+def build_features(trunk, dataset, cache_dir, name, views=1, augment=None, device='cpu',
+                   batch_size=64, num_workers=2):
+    """Run the trunk over `views` passes of dataset and cache the activations.
+
+    Reused while the trunk weights, images, transform and view count are
+    unchanged. augment is applied to each collated batch (BatchAugment).
+    """
+    fingerprint = _fingerprint(trunk, dataset, views, augment)
+    path = os.path.join(cache_dir, f'{name}.npy')
+    meta_path = os.path.join(cache_dir, f'{name}.json')
+    try:
+        with open(meta_path) as f:
+            meta = json.load(f)
+        if meta['fingerprint'] == fingerprint:
+            log(f'  Features: reusing {path}')
+            return FeatureDataset(path, meta['targets'], views)
+    except (OSError, ValueError, KeyError):
+        pass
+
+    os.makedirs(cache_dir, exist_ok=True)
+    if os.path.exists(meta_path):
+        os.remove(meta_path)
+    trunk.eval()
+    loader = DataLoader(dataset, batch_size=batch_size, shuffle=False, num_workers=num_workers)
+    features, targets = None, []
+    for view in range(views):
+        offset = 0
+        for images, labels in tqdm(loader, desc=f'Caching {name} view {view + 1}/{views}', leave=False):
+            images = images.to(device)
+            if augment is not None:
+                images = augment(images)
+            out = trunk(images).half().cpu().numpy()
+            if features is None:
+                features = np.lib.format.open_memmap(path, mode='w+', dtype=np.float16,
+                                                     shape=(len(dataset), views) + out.shape[1:])
+            features[offset:offset + len(out), view] = out
+            if view == 0:
+                targets.extend(int(label) for label in labels)
+            offset += len(out)
+    features.flush()
+    del features
+
+    with open(f'{meta_path}.tmp', 'w') as f:
+        json.dump({'fingerprint': fingerprint, 'targets': targets}, f)
+    os.replace(f'{meta_path}.tmp', meta_path)
+    size = os.path.getsize(path) / 2 ** 30
+    log(f'  Features: {len(dataset)} images x {views} views cached in {path} ({size:.2f} GiB)')
+    return FeatureDataset(path, targets, views)
+
+
+@torch.no_grad()
+def check_consistency(model, tail, dataset, features, device='cpu', samples=8, tolerance=1e-2):
+    """Relative logit difference between the full model and tail(cached features).
+
+    Compares the first `samples` images of an eval-transform dataset with
+    view 0 of its cache; raises RuntimeError beyond tolerance (float16
+    rounding stays well below it).
+    """
+    model.eval()
+    count = min(samples, len(dataset))
+    images = torch.stack([dataset[i][0] for i in range(count)]).to(device)
+    cached = torch.from_numpy(np.load(features.path, mmap_mode='r')[:count, 0].copy()).to(device)
+    full, fast = model(images), tail(cached)
+    diff = ((full - fast).abs().max() / full.abs().max().clamp(min=1e-6)).item()
+    log(f'  Features: relative logit difference vs full model {diff:.2e}')
+    if diff > tolerance:
+        raise RuntimeError(f'Cached features disagree with the full model (relative logit diff {diff:.3f}); '
+                           f'delete the feature cache and rebuild')
+    return diff
+
+
+def cached_loaders(model, train_loader, val_loader, cache_dir, views, device, augment=None):
+    """Swap image loaders for loaders over cached trunk activations.
+
+    Returns (tail, train_loader, val_loader): train `tail` with the same
+    loop as the full model. Both loaders keep their original samplers.
+    """
+    log('\n🧊 Caching frozen-trunk features...')
+    trunk, tail = split_frozen(model)
+    workers = train_loader.num_workers
+    train_features = build_features(trunk, train_loader.dataset, cache_dir, 'train', views=views,
+                                    augment=augment, device=device,
+                                    batch_size=train_loader.batch_size, num_workers=workers)
+    val_features = build_features(trunk, val_loader.dataset, cache_dir, 'val', device=device,
+                                  batch_size=val_loader.batch_size, num_workers=workers)
+    check_consistency(model, tail, val_loader.dataset, val_features, device)
+    return (
+        tail,
+        DataLoader(train_features, batch_size=train_loader.batch_size, sampler=train_loader.sampler,
+                   num_workers=workers),
+        DataLoader(val_features, batch_size=val_loader.batch_size, sampler=val_loader.sampler,
+                   num_workers=workers),
+    )
@@ -0,0 +1,153 @@
+#!/usr/bin/env python3
+"""
+PathoVision Epoch Metrics
+=========================
+Binary classification metrics accumulated on the training device, so the
+train/eval loops never call .item() or .cpu() per batch (each of which
+waits for the device to finish):
+
+- EpochMetrics: labels, predictions and malignant probabilities written
+  into preallocated device buffers; one transfer per epoch, then exact
+  metrics (sklearn ROC-AUC) in one vectorised step
+- StreamingMetrics: only confusion counts and per-class probability
+  histograms, so memory stays constant however large the dataset; AUC is
+  computed from the histograms (pairs within the same bin count as ties)
+
+Both return the same dictionary from compute(). Under torch.distributed,
+all_reduce() merges every rank's samples first (a no-op in one process).
+"""
+
+import numpy as np
+import torch
+import torch.distributed as dist
+from sklearn.metrics import roc_auc_score
+
+
+def _world_size():
+    return dist.get_world_size() if dist.is_available() and dist.is_initialized() else 1
+
+
+def _divide(a, b):
+    return a / b if b else 0.0
+
+
+def confusion_metrics(confusion):
+    """Metrics from a 2x2 [true, predicted] count matrix (class 1 = malignant)."""
+    (tn, fp), (fn, tp) = confusion.tolist()
+    total = tn + fp + fn + tp
+    f1 = _divide(2 * tp, 2 * tp + fp + fn)
+    f1_benign = _divide(2 * tn, 2 * tn + fn + fp)
+    recall, specificity = _divide(tp, tp + fn), _divide(tn, tn + fp)
+    return {
+        'acc': _divide(tp + tn, total),
+        'precision': _divide(tp, tp + fp),
+        'recall': recall,
+        'specificity': specificity,
+        'f1': f1,
+        'f1_weighted': _divide(f1_benign * (tn + fp) + f1 * (fn + tp), total),
+        # Equals ROC-AUC of the hard predictions
+        'balanced_acc': (recall + specificity) / 2,
+        'confusion': confusion,
+    }
+
+
+class EpochMetrics:
+    """Exact epoch metrics from preallocated on-device buffers."""
+    def __init__(self, size, device):
+        self.labels = torch.empty(size, dtype=torch.long, device=device)
+        self.preds = torch.empty(size, dtype=torch.long, device=device)
+        self.probs = torch.empty(size, dtype=torch.float32, device=device)
+        self.loss_sum = torch.zeros((), dtype=torch.float64, device=device)
+        self.count = 0
+        self._arrays = None
+
+    @torch.no_grad()
+    def update(self, outputs, labels, loss=None):
+        n = labels.shape[0]
+        batch = slice(self.count, self.count + n)
+        outputs = outputs.detach().float()
+        self.labels[batch] = labels
+        self.preds[batch] = outputs.argmax(1)
+        self.probs[batch] = torch.softmax(outputs, dim=1)[:, 1]
+        if loss is not None:
+            self.loss_sum += loss.detach().double() * n
+        self.count += n
+
+    def all_reduce(self):
+        """Gather the samples of every rank (via CPU, gloo-compatible); returns self."""
+        world_size = _world_size()
+        if world_size == 1:
+            return self
+        counts = [torch.zeros(1, dtype=torch.long) for _ in range(world_size)]
+        dist.all_gather(counts, torch.tensor([self.count]))
+        local = torch.zeros(3, max(int(c) for c in counts))
+        local[:, :self.count] = torch.stack([self.labels[:self.count].float(), self.preds[:self.count].float(),
+                                             self.probs[:self.count]]).cpu()
+        gathered = [torch.zeros_like(local) for _ in range(world_size)]
+        dist.all_gather(gathered, local)
+        merged = torch.cat([g[:, :int(c)] for g, c in zip(gathered, counts)], dim=1).numpy()
+        self._arrays = merged[0].astype(np.int64), merged[1].astype(np.int64), merged[2]
+        self.loss_sum = self.loss_sum.cpu()
+        dist.all_reduce(self.loss_sum)
+        self.count = merged.shape[1]
+        return self
+
+    def arrays(self):
+        """(labels, preds, probs) as NumPy arrays; the only host sync of the epoch."""
+        if self._arrays is None:
+            stacked = torch.stack([self.labels[:self.count].float(), self.preds[:self.count].float(),
+                                   self.probs[:self.count]]).cpu().numpy()
+            self._arrays = stacked[0].astype(np.int64), stacked[1].astype(np.int64), stacked[2]
+        return self._arrays
+
+    def compute(self):
+        labels, preds, probs = self.arrays()
+        metrics = confusion_metrics(np.bincount(labels * 2 + preds, minlength=4).reshape(2, 2))
+        metrics['loss'] = self.loss_sum.item() / max(self.count, 1)
+        metrics['auc'] = roc_auc_score(labels, probs) if len(np.unique(labels)) == 2 else float('nan')
+        return metrics
+
+
+class StreamingMetrics:
+    """Constant-memory epoch metrics: confusion counts and probability histograms."""
+    def __init__(self, device, bins=4096):
+        self.bins = bins
+        self.confusion = torch.zeros(4, dtype=torch.long, device=device)
+        self.histogram = torch.zeros(2 * bins, dtype=torch.long, device=device)
+        self.loss_sum = torch.zeros((), dtype=torch.float64, device=device)
+        self.count = 0
+
+    @torch.no_grad()
+    def update(self, outputs, labels, loss=None):
+        outputs = outputs.detach().float()
+        preds = outputs.argmax(1)
+        probs = torch.softmax(outputs, dim=1)[:, 1]
+        self.confusion += torch.bincount(labels * 2 + preds, minlength=4)
+        bucket = (probs * self.bins).long().clamp_(max=self.bins - 1)
+        self.histogram += torch.bincount(labels * self.bins + bucket, minlength=2 * self.bins)
+        if loss is not None:
+            self.loss_sum += loss.detach().double() * labels.shape[0]
+        self.count += labels.shape[0]
+
+    def all_reduce(self):
+        """Sum counts, histograms and loss over every rank (via CPU); returns self."""
+        if _world_size() == 1:
+            return self
+        counts = torch.cat([self.confusion, self.histogram]).cpu()
+        dist.all_reduce(counts)
+        self.confusion, self.histogram = counts[:4], counts[4:]
+        totals = torch.stack([self.loss_sum.cpu(), torch.tensor(self.count, dtype=torch.float64)])
+        dist.all_reduce(totals)
+        self.loss_sum, self.count = totals[0], int(totals[1])
+        return self
+
+    def compute(self):
+        confusion = self.confusion.cpu().numpy().reshape(2, 2)
+        negatives, positives = self.histogram.cpu().numpy().reshape(2, self.bins).astype(np.float64)
+        metrics = confusion_metrics(confusion)
+        metrics['loss'] = self.loss_sum.item() / max(self.count, 1)
+        pairs = negatives.sum() * positives.sum()
+        # P(score_pos > score_neg) + 0.5 * P(same bin)
+        below = np.cumsum(negatives) - negatives
+        metrics['auc'] = float((positives * (below + 0.5 * negatives)).sum() / pairs) if pairs else float('nan')
+        return metrics
@@ -0,0 +1,128 @@
+#!/usr/bin/env python3
+"""
+PathoVision Training Performance Mode
+=====================================
+Optional speedups shared by the training scripts:
+
+- amp: autocast to bfloat16 on CPU, float16 with a GradScaler on CUDA
+  (bfloat16 pays off on CPUs with AVX512-BF16/AMX; older CPUs may slow down,
+  so amp='auto' enables it only on CUDA and on such CPUs)
+- channels_last: NHWC weights and inputs, faster convolutions on CPU and
+  tensor cores
+- compile: torch.compile the model used for the training/eval forward pass
+
+Disabled features are no-ops, so the training loop is the same in every
+mode. EpochTimer reports images/sec and peak memory per epoch.
+"""
+
+import resource
+import sys
+import time
+
+import torch
+
+
+def cpu_has_bf16():
+    """True if the CPU advertises native bfloat16 math (AVX512-BF16 or AMX)."""
+    try:
+        with open('/proc/cpuinfo') as f:
+            flags = set(next((line for line in f if line.startswith('flags')), '').split())
+    except OSError:
+        return False
+    return bool(flags & {'avx512_bf16', 'amx_bf16'})
+
+
+def _grad_scaler(enabled):
+    # torch.amp.GradScaler('cuda') replaces the deprecated torch.cuda.amp.GradScaler (torch >= 2.3)
+    if hasattr(torch.amp, 'GradScaler'):
+        return torch.amp.GradScaler('cuda', enabled=enabled)
+    return torch.cuda.amp.GradScaler(enabled=enabled)
+
+
+class PerformanceMode:
+    def __init__(self, device, amp=False, channels_last=False, compile=False):
+        self.device = torch.device(device)
+        if amp == 'auto':
+            amp = self.device.type == 'cuda' or (self.device.type == 'cpu' and cpu_has_bf16())
+        self.amp = amp
+        self.dtype = torch.float16 if self.device.type == 'cuda' else torch.bfloat16
+        self.channels_last = channels_last
+        self.compile = compile
+        # bfloat16 has float32's range, so only float16 needs loss scaling
+        self.scaler = _grad_scaler(enabled=amp and self.device.type == 'cuda')
+
+    def __str__(self):
+        enabled = [name for name, on in [(f'amp ({str(self.dtype)[6:]})', self.amp),
+                                         ('channels_last', self.channels_last),
+                                         ('torch.compile', self.compile)] if on]
+        return ', '.join(enabled) or 'fp32 eager'
+
+    def prepare(self, model):
+        """Convert model in place; returns the module to call for forward passes.
+
+        Keep using the original model for state_dict(): a compiled wrapper
+        prefixes every key with `_orig_mod.`.
+        """
+        if self.channels_last:
+            model = model.to(memory_format=torch.channels_last)
+        if self.compile:
+            model = torch.compile(model)
+        return model
+
+    def inputs(self, images):
+        if self.channels_last and images.dim() == 4:
+            return images.contiguous(memory_format=torch.channels_last)
+        return images
+
+    def autocast(self):
+        return torch.autocast(self.device.type, dtype=self.dtype, enabled=self.amp)
+
+    def backward_step(self, loss, optimizer, parameters, max_norm=1.0):
+        """backward, unscale, clip and step (plain backward/step without float16)."""
+        self.scaler.scale(loss).backward()
+        self.scaler.unscale_(optimizer)
+        torch.nn.utils.clip_grad_norm_(parameters, max_norm=max_norm)
+        self.scaler.step(optimizer)
+        self.scaler.update()
+
+    def state_dict(self):
+        return self.scaler.state_dict()
+
+    def load_state_dict(self, state):
+        self.scaler.load_state_dict(state)
+
+
+class EpochTimer:
+    """Images/sec and peak memory for the block it wraps."""
+    def __init__(self, device, images):
+        self.device = torch.device(device)
+        self.images = images
+        self.elapsed = None
+
+    def __enter__(self):
+        if self.device.type == 'cuda':
+            torch.cuda.synchronize()
+            torch.cuda.reset_peak_memory_stats()
+        self.started = time.perf_counter()
+        return self
+
+    def __exit__(self, *exc):
+        if self.device.type == 'cuda':
+            torch.cuda.synchronize()
+        self.elapsed = time.perf_counter() - self.started
+
+    @property
+    def images_per_sec(self):
+        return self.images / self.elapsed
+
+    @property
+    def peak_memory_mb(self):
+        if self.device.type == 'cuda':
+            return torch.cuda.max_memory_allocated() / 2 ** 20
+        # Peak resident set size of the process so far (KiB on Linux, bytes on macOS)
+        peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+        return peak / 2 ** 20 if sys.platform == 'darwin' else peak / 2 ** 10
+
+    def __str__(self):
+        kind = 'GPU' if self.device.type == 'cuda' else 'RSS'
+        return f'{self.images_per_sec:.1f} img/s | peak {kind} {self.peak_memory_mb:.0f} MiB'
@@ -0,0 +1,36 @@
+#!/usr/bin/env python3
+"""
+PathoVision Process Ranks
+=========================
+Which process this is, and console output from rank 0 only. Kept apart
+from distributed.py (process groups, samplers, DDP helpers) so the data,
+cache and checkpoint modules can report progress without depending on it;
+in a single process every helper here is a no-op answer (rank 0 of 1).
+"""
+
+import os
+
+import torch.distributed as dist
+
+
+def get_world_size():
+    return dist.get_world_size() if dist.is_available() and dist.is_initialized() else 1
+
+
+def get_rank():
+    return dist.get_rank() if dist.is_available() and dist.is_initialized() else 0
+
+
+def is_main():
+    return get_rank() == 0
+
+
+def is_local_main():
+    """First process on this machine (LOCAL_RANK 0, set by torchrun and spawn())."""
+    return int(os.environ.get('LOCAL_RANK', get_rank())) == 0
+
+
+def log(*args, **kwargs):
+    """print() on rank 0 only, so the console shows every report once."""
+    if is_main():
+        print(*args, **kwargs)
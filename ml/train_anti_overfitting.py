@@ -11,9 +11,9 @@ Addresses unrealistic 99%+ accuracy through:
 - Class balancing with focal loss
 """
 
+import argparse
 import os
 import random
-import re
 import numpy as np
 import pandas as pd
 from pathlib import Path
@@ -23,22 +23,31 @@ from collections import Counter
 import torch
 import torch.nn as nn
 import torch.optim as optim
+from torch.nn.parallel import DistributedDataParallel
 from torch.utils.data import DataLoader, Subset, WeightedRandomSampler
 from torchvision import datasets, models, transforms as T
 from torchvision.models import ResNet50_Weights
 
-from sklearn.metrics import (
-    accuracy_score, precision_score, recall_score,
-    f1_score, roc_auc_score, classification_report,
-    confusion_matrix
+from sklearn.metrics import classification_report, confusion_matrix
+
+from batch_augment import BatchAugment
+from breakhis_data import ShardDataset, build_manifest, build_shards, build_split_manifest, extract_patient_id
+from checkpoint import Checkpointer
+from distributed import (
+    DistributedEvalSampler, DistributedWeightedSampler, check_consistent, cleanup,
+    main_process_first, setup, spawn, sync_buffers, sync_model
 )
+from feature_cache import cached_loaders
+from metrics import EpochMetrics, StreamingMetrics
+from performance import EpochTimer, PerformanceMode
+from ranks import get_world_size, is_main, log
 
 # ============================================================
 # ANTI-OVERFITTING CONFIGURATION
 # ============================================================
 CONFIG = {
     'seed': 42,
-    'batch_size': 16,          # Smaller batch = more stochastic
+    'batch_size': 16,          # Smaller batch = more stochastic (per process under DDP)
     'epochs': 50,              # Longer training
     'lr': 1e-4,                # Slower learning rate
     'weight_decay': 5e-4,      # Strong L2 regularization (50x increase)
@@ -51,6 +60,21 @@ CONFIG = {
     'min_delta': 0.001,
     'data_root': '/kaggle/input/breakhis',  # Modify for local use
     'save_dir': 'models',
+    'cache_dir': 'cache',      # Writable dir for the manifest and shards
+    'num_workers': os.cpu_count(),  # Preprocessing processes
+    'use_shards': True,        # Train from pre-resized memory-mapped shards
+    'batch_augment': True,     # Augment collated batches on the device (batch_augment.py)
+    'feature_cache': False,    # Cache frozen-trunk activations, train only layer4 + head
+    'feature_cache_views': 4,  # Augmented views cached per training image
+    'amp': 'auto',             # fp16 + GradScaler on CUDA, bf16 autocast on AVX512-BF16/AMX CPUs only
+    'channels_last': True,     # NHWC memory format for weights and inputs
+    'compile': False,          # torch.compile the training model
+    'amp_auc_tolerance': 0.005,  # Max val AUC gap between AMP and fp32 inference
+    'streaming_metrics': False,  # Constant-memory evaluation metrics (histogram-binned AUC)
+    'checkpoint_dir': 'checkpoints/anti_overfitting',  # Resumable training state and best weights
+    'checkpoint_every': 1,     # Epochs between full-state checkpoints
+    'cv_folds': 5,             # Patient-grouped CV folds recorded in the split manifest
+    'fold': None,              # Validate on this CV fold (None: the fixed train/val split)
 }
 
 # ============================================================
@@ -69,62 +93,39 @@ set_seed(CONFIG['seed'])
 # ============================================================
 # PATIENT-LEVEL DATA SPLITTING (PREVENT LEAKAGE)
 # ============================================================
-def extract_patient_id(filepath):
-    """Extract patient ID from BreakHis filename.
-    Format: SOB_B_A-14-22549AB-400-001.png -> A-14-22549AB
-    """
-    filename = os.path.basename(filepath)
-    match = re.search(r'SOB_[BM]_(.+?)-\d+', filename)
-    return match.group(1) if match else filename
-
-def split_by_patient(dataset, test_size=0.2, val_size=0.25, seed=42):
-    """Split dataset by PATIENT (not by image) to prevent data leakage."""
-    from sklearn.model_selection import train_test_split
-    
-    # Extract patient IDs and labels
-    patient_ids = []
-    for path, label in dataset.samples:
-        patient_id = extract_patient_id(path)
-        patient_ids.append(patient_id)
-    
-    # Group by unique patients
-    unique_patients = list(set(patient_ids))
-    patient_to_label = {}
-    for pid, label in zip(patient_ids, dataset.targets):
-        if pid not in patient_to_label:
-            patient_to_label[pid] = label
-    
-    print(f'\n📊 Dataset Statistics:')
-    print(f'  Total images: {len(dataset)}')
-    print(f'  Unique patients: {len(unique_patients)}')
-    print(f'  Images per patient (avg): {len(dataset) / len(unique_patients):.1f}')
-    
-    # Split by PATIENT
-    train_val_patients, test_patients = train_test_split(
-        unique_patients,
-        test_size=test_size,
-        stratify=[patient_to_label[p] for p in unique_patients],
-        random_state=seed
-    )
-    
-    train_patients, val_patients = train_test_split(
-        train_val_patients,
-        test_size=val_size,  # 25% of 80% = 20%
-        stratify=[patient_to_label[p] for p in train_val_patients],
-        random_state=seed
-    )
-    
-    # Map images to splits
-    train_indices = [i for i, pid in enumerate(patient_ids) if pid in train_patients]
-    val_indices = [i for i, pid in enumerate(patient_ids) if pid in val_patients]
-    test_indices = [i for i, pid in enumerate(patient_ids) if pid in test_patients]
+def split_by_patient(dataset, test_size=0.2, val_size=0.25, seed=42, fold=None):
+    """Split dataset by PATIENT (not by image) to prevent data leakage.
     
-    print(f'\n✓ Patient-Level Splits:')
-    print(f'  Train: {len(train_patients)} patients, {len(train_indices)} images')
-    print(f'  Val:   {len(val_patients)} patients, {len(val_indices)} images')
-    print(f'  Test:  {len(test_patients)} patients, {len(test_indices)} images')
-    
-    return train_indices, val_indices, test_indices
+    The split is computed once and persisted in cache_dir/breakhis_splits.json
+    (shared with train_offline.py); later runs load it. fold=k validates on CV
+    fold k and trains on the other folds instead; the test patients never change.
+    """
+    paths = [path for path, _ in dataset.samples]
+    df = pd.DataFrame({'path': paths, 'label': dataset.targets})
+    df['patient_id'] = df['path'].map(extract_patient_id)
+    with main_process_first():
+        splits = build_split_manifest(df, os.path.join(CONFIG['cache_dir'], 'breakhis_splits.json'),
+                                      test_size, val_size, CONFIG['cv_folds'], seed)
+    splits = splits.set_index('path').reindex(paths)
+    
+    if fold is None:
+        split = splits['split'].to_numpy()
+    else:
+        split = np.where(splits['fold'] == fold, 'val', np.where(splits['split'] == 'test', 'test', 'train'))
+    indices = {name: np.flatnonzero(split == name) for name in ('train', 'val', 'test')}
+    patients = {name: splits['patient_id'].iloc[idx].nunique() for name, idx in indices.items()}
+    
+    log(f'\n📊 Dataset Statistics:')
+    log(f'  Total images: {len(dataset)}')
+    log(f'  Unique patients: {df["patient_id"].nunique()}')
+    log(f'  Images per patient (avg): {len(dataset) / df["patient_id"].nunique():.1f}')
+    
+    log(f'\n✓ Patient-Level Splits{f" (CV fold {fold})" if fold is not None else ""}:')
+    log(f'  Train: {patients["train"]} patients, {len(indices["train"])} images')
+    log(f'  Val:   {patients["val"]} patients, {len(indices["val"])} images')
+    log(f'  Test:  {patients["test"]} patients, {len(indices["test"])} images')
+    
+    return indices['train'].tolist(), indices['val'].tolist(), indices['test'].tolist()
 
 # ============================================================
 # AGGRESSIVE AUGMENTATION (PREVENT MEMORIZATION)
@@ -138,9 +139,9 @@ train_transform = T.Compose([
     T.ColorJitter(brightness=0.2, contrast=0.2, saturation=0.15, hue=0.05),  # Increased
     T.RandomAffine(degrees=20, translate=(0.15, 0.15), scale=(0.85, 1.15)),  # Increased
     T.RandomApply([T.GaussianBlur(kernel_size=3, sigma=(0.1, 2.0))], p=0.3),  # NEW
-    T.RandomErasing(p=0.2, scale=(0.02, 0.15)),  # NEW: Cutout-style
     T.ToTensor(),
-    T.Normalize(mean=[0.485, 0.456, 0.406], std=[0.229, 0.224, 0.225])
+    T.Normalize(mean=[0.485, 0.456, 0.406], std=[0.229, 0.224, 0.225]),
+    T.RandomErasing(p=0.2, scale=(0.02, 0.15)),  # NEW: Cutout-style (tensor-only, so after ToTensor)
 ])
 
 val_transform = T.Compose([
@@ -149,11 +150,30 @@ val_transform = T.Compose([
     T.Normalize(mean=[0.485, 0.456, 0.406], std=[0.229, 0.224, 0.225])
 ])
 
+# Same pipelines for uint8 tensors read from the shards (256px train, 224px eval).
+# Per image, PIL ops are faster than tensor ops on the CPU (see bench_augment.py)
+train_tensor_transform = T.Compose([T.ToPILImage()] + train_transform.transforms[1:])  # Already 256px
+
+val_tensor_transform = T.Compose([
+    T.ConvertImageDtype(torch.float),
+    T.Normalize(mean=[0.485, 0.456, 0.406], std=[0.229, 0.224, 0.225])
+])
+
+# With batch_augment the loader only collates uint8 256px images; BatchAugment does the rest
+train_batch_transform = T.Compose([
+    T.Resize((256, 256)),
+    T.PILToTensor()
+])
+
 # ============================================================
 # DATA LOADING WITH VALIDATION
 # ============================================================
-def load_data(data_root):
-    """Load BreakHis dataset with patient-level splits."""
+def load_dataset(data_root):
+    """Full dataset (from the shards with use_shards, building them on first use).
+    
+    Returns (data_path, full_dataset, eval_index, train_index); the shard
+    indexes are None without use_shards.
+    """
     data_path = Path(data_root) / 'BreaKHis_v1' / 'histopathologic_images' / 'breast'
     
     if not data_path.exists():
@@ -165,17 +185,48 @@ def load_data(data_root):
     # Load full dataset (no transform yet)
     full_dataset = datasets.ImageFolder(data_path)
     
-    print(f'\n📁 Dataset loaded from: {data_path}')
-    print(f'  Classes: {full_dataset.classes}')
-    print(f'  Class distribution: {Counter(full_dataset.targets)}')
+    log(f'\n📁 Dataset loaded from: {data_path}')
+    log(f'  Classes: {full_dataset.classes}')
+    log(f'  Class distribution: {Counter(full_dataset.targets)}')
+    
+    if CONFIG['use_shards']:
+        # One-time conversion; later runs (and the other DDP ranks) reuse the shards
+        log('\n📦 Preparing shards...')
+        with main_process_first():
+            manifest = build_manifest([path for path, _ in full_dataset.samples], full_dataset.targets,
+                                      os.path.join(CONFIG['cache_dir'], 'breakhis_manifest.json'),
+                                      workers=CONFIG['num_workers'])
+            valid = manifest[manifest['valid']]
+            eval_index = build_shards(valid, os.path.join(CONFIG['cache_dir'], 'shards-224'), 224,
+                                      workers=CONFIG['num_workers'])
+            train_index = build_shards(valid, os.path.join(CONFIG['cache_dir'], 'shards-256'), 256,
+                                       workers=CONFIG['num_workers'])
+        full_dataset = ShardDataset(eval_index)
+    else:
+        eval_index = train_index = None
+    return data_path, full_dataset, eval_index, train_index
+
+
+def load_data(data_root):
+    """Load BreakHis dataset with patient-level splits."""
+    data_path, full_dataset, eval_index, train_index = load_dataset(data_root)
     
     # Patient-level split
-    train_idx, val_idx, test_idx = split_by_patient(full_dataset)
+    train_idx, val_idx, test_idx = split_by_patient(full_dataset, seed=CONFIG['seed'], fold=CONFIG['fold'])
+    check_consistent('Patient split', (train_idx, val_idx, test_idx))
     
     # Create subsets with appropriate transforms
-    train_ds = Subset(datasets.ImageFolder(data_path, transform=train_transform), train_idx)
-    val_ds = Subset(datasets.ImageFolder(data_path, transform=val_transform), val_idx)
-    test_ds = Subset(datasets.ImageFolder(data_path, transform=val_transform), test_idx)
+    if CONFIG['use_shards']:
+        train_ds = ShardDataset(train_index, [full_dataset.samples[i][0] for i in train_idx],
+                                transform=None if CONFIG['batch_augment'] else train_tensor_transform)
+        val_ds = Subset(ShardDataset(eval_index, transform=val_tensor_transform), val_idx)
+        test_ds = Subset(ShardDataset(eval_index, transform=val_tensor_transform), test_idx)
+    else:
+        train_ds = Subset(datasets.ImageFolder(
+            data_path, transform=train_batch_transform if CONFIG['batch_augment'] else train_transform
+        ), train_idx)
+        val_ds = Subset(datasets.ImageFolder(data_path, transform=val_transform), val_idx)
+        test_ds = Subset(datasets.ImageFolder(data_path, transform=val_transform), test_idx)
     
     # Compute class weights for imbalanced data
     train_labels = [full_dataset.targets[i] for i in train_idx]
@@ -186,15 +237,18 @@ def load_data(data_root):
     ])
     class_weights /= class_weights.sum()  # Normalize
     
-    print(f'\n⚖️  Class weights: Benign={class_weights[0]:.3f}, Malignant={class_weights[1]:.3f}')
+    log(f'\n⚖️  Class weights: Benign={class_weights[0]:.3f}, Malignant={class_weights[1]:.3f}')
     
-    # Weighted sampler for balanced batches
+    # Weighted sampler for balanced batches (split across ranks under DDP)
     sample_weights = [class_weights[label] for label in train_labels]
-    sampler = WeightedRandomSampler(
-        weights=sample_weights,
-        num_samples=len(sample_weights),
-        replacement=True
-    )
+    if get_world_size() > 1:
+        sampler = DistributedWeightedSampler(sample_weights, len(sample_weights), seed=CONFIG['seed'])
+    else:
+        sampler = WeightedRandomSampler(
+            weights=sample_weights,
+            num_samples=len(sample_weights),
+            replacement=True
+        )
     
     # Data loaders
     train_loader = DataLoader(
@@ -208,6 +262,7 @@ def load_data(data_root):
         val_ds,
         batch_size=CONFIG['batch_size'],
         shuffle=False,
+        sampler=DistributedEvalSampler(val_ds) if get_world_size() > 1 else None,
         num_workers=2,
         pin_memory=True
     )
@@ -226,16 +281,16 @@ def load_data(data_root):
 # ============================================================
 def create_model(device, pretrained=True):
     """Create ResNet50 with aggressive regularization."""
-    print('\n🏗️  Building model...')
+    log('\n🏗️  Building model...')
     
     try:
         if pretrained:
             model = models.resnet50(weights=ResNet50_Weights.IMAGENET1K_V2)
-            print('  ✓ Loaded ImageNet pretrained weights')
+            log('  ✓ Loaded ImageNet pretrained weights')
         else:
             raise Exception('Using fallback')
     except Exception:
-        print('  ⚠ Network unavailable, initializing from scratch')
+        log('  ⚠ Network unavailable, initializing from scratch')
         model = models.resnet50(weights=None)
     
     # Freeze early layers (only train deeper features)
@@ -262,9 +317,9 @@ def create_model(device, pretrained=True):
     
     total_params = sum(p.numel() for p in model.parameters())
     trainable_params = sum(p.numel() for p in model.parameters() if p.requires_grad)
-    print(f'  Total parameters: {total_params:,}')
-    print(f'  Trainable parameters: {trainable_params:,}')
-    print(f'  Training ratio: {100 * trainable_params / total_params:.1f}%')
+    log(f'  Total parameters: {total_params:,}')
+    log(f'  Trainable parameters: {trainable_params:,}')
+    log(f'  Training ratio: {100 * trainable_params / total_params:.1f}%')
     
     return model
 
@@ -296,108 +351,137 @@ class FocalLoss(nn.Module):
 # ============================================================
 class EarlyStoppingAUC:
     """Early stopping based on validation AUC with stricter criteria."""
-    def __init__(self, patience=12, min_delta=0.001):
+    def __init__(self, patience=12, min_delta=0.001, checkpointer=None):
         self.patience = patience
         self.min_delta = min_delta
         self.counter = 0
         self.best_auc = 0
         self.early_stop = False
+        self.checkpointer = checkpointer  # Best weights go to checkpointer.best_path, not RAM
         self.best_model_state = None
     
     def __call__(self, val_auc, model):
         if val_auc > self.best_auc + self.min_delta:
             self.best_auc = val_auc
             self.counter = 0
-            self.best_model_state = {k: v.cpu().clone() for k, v in model.state_dict().items()}
+            if self.checkpointer is not None:
+                self.checkpointer.save_best(model)
+            else:
+                self.best_model_state = {k: v.cpu().clone() for k, v in model.state_dict().items()}
         else:
             self.counter += 1
             if self.counter >= self.patience:
                 self.early_stop = True
     
+    def state_dict(self):
+        return {'counter': self.counter, 'best_auc': self.best_auc, 'early_stop': self.early_stop}
+    
+    def load_state_dict(self, state):
+        self.counter, self.best_auc, self.early_stop = state['counter'], state['best_auc'], state['early_stop']
+    
     def load_best_model(self, model):
-        if self.best_model_state is not None:
+        if self.checkpointer is not None and self.best_auc > 0:
+            self.checkpointer.load_best(model)
+        elif self.best_model_state is not None:
             model.load_state_dict(self.best_model_state)
 
 # ============================================================
 # TRAINING & EVALUATION
 # ============================================================
-def train_one_epoch(model, loader, optimizer, criterion, device):
+def train_one_epoch(model, loader, optimizer, criterion, device, augment=None, perf=None):
+    perf = perf or PerformanceMode(device)
     model.train()
-    running_loss, correct, total = 0.0, 0, 0
-    all_preds, all_labels = [], []
+    metrics = EpochMetrics(len(loader.sampler), device)  # No per-batch host syncs
     
-    for images, labels in tqdm(loader, desc='Training', leave=False):
-        images, labels = images.to(device), labels.to(device)
-        
-        optimizer.zero_grad()
-        outputs = model(images)
-        loss = criterion(outputs, labels)
-        loss.backward()
-        
-        # Gradient clipping
-        torch.nn.utils.clip_grad_norm_(model.parameters(), max_norm=1.0)
-        
-        optimizer.step()
+    for images, labels in tqdm(loader, desc='Training', leave=False, disable=not is_main()):
+        images, labels = images.to(device, non_blocking=True), labels.to(device, non_blocking=True)
+        if augment is not None:
+            images = augment(images)
+        images = perf.inputs(images)
         
-        running_loss += loss.item()
-        _, preds = torch.max(outputs, 1)
-        correct += (preds == labels).sum().item()
-        total += labels.size(0)
+        optimizer.zero_grad(set_to_none=True)
+        with perf.autocast():
+            outputs = model(images)
+            loss = criterion(outputs, labels)
         
-        all_preds.extend(preds.cpu().numpy())
-        all_labels.extend(labels.cpu().numpy())
-    
-    acc = accuracy_score(all_labels, all_preds)
-    f1 = f1_score(all_labels, all_preds, average='weighted')
-    auc = roc_auc_score(all_labels, all_preds)
+        # Backward, gradient clipping and step (with loss scaling under fp16)
+        perf.backward_step(loss, optimizer, model.parameters(), max_norm=1.0)
+        metrics.update(outputs, labels, loss)
     
-    return running_loss / len(loader), acc, f1, auc
+    m = metrics.all_reduce().compute()  # Merged over ranks under DDP
+    # Train AUC is the ROC-AUC of the hard predictions, i.e. balanced accuracy
+    return m['loss'], m['acc'], m['f1_weighted'], m['balanced_acc']
 
 @torch.no_grad()
-def evaluate(model, loader, criterion, device):
+def evaluate(model, loader, criterion, device, perf=None, streaming=False):
+    perf = perf or PerformanceMode(device)
     model.eval()
-    running_loss, all_preds, all_labels = 0.0, [], []
-    all_probs = []
+    metrics = StreamingMetrics(device) if streaming else EpochMetrics(len(loader.sampler), device)
     
     for images, labels in loader:
-        images, labels = images.to(device), labels.to(device)
-        outputs = model(images)
-        loss = criterion(outputs, labels)
-        
-        running_loss += loss.item()
-        probs = torch.softmax(outputs, dim=1)
-        _, preds = torch.max(outputs, 1)
-        
-        all_preds.extend(preds.cpu().numpy())
-        all_labels.extend(labels.cpu().numpy())
-        all_probs.extend(probs[:, 1].cpu().numpy())
-    
-    acc = accuracy_score(all_labels, all_preds)
-    f1 = f1_score(all_labels, all_preds, average='weighted')
-    auc = roc_auc_score(all_labels, all_probs)
+        images = perf.inputs(images.to(device, non_blocking=True))
+        labels = labels.to(device, non_blocking=True)
+        with perf.autocast():
+            outputs = model(images)
+            loss = criterion(outputs, labels)
+        metrics.update(outputs, labels, loss)
     
-    return running_loss / len(loader), acc, f1, auc
+    m = metrics.all_reduce().compute()  # Merged over ranks under DDP
+    return m['loss'], m['acc'], m['f1_weighted'], m['auc']
 
 # ============================================================
 # MAIN TRAINING LOOP
 # ============================================================
-def main():
-    print('=' * 60)
-    print('PathoVision Anti-Overfitting Training')
-    print('=' * 60)
+def main(resume=False):
+    """Train, then evaluate on the test set; rank 0 returns the final metrics."""
+    # Joins the DDP process group when launched with --nproc or torchrun
+    rank, world_size = setup()
+    
+    log('=' * 60)
+    log('PathoVision Anti-Overfitting Training')
+    log('=' * 60)
     
     # Device
-    device = torch.device('cuda' if torch.cuda.is_available() else 'cpu')
-    print(f'\n🖥️  Device: {device}')
     if torch.cuda.is_available():
-        print(f'  GPU: {torch.cuda.get_device_name(0)}')
-        print(f'  CUDA Version: {torch.version.cuda}')
+        device = torch.device('cuda', int(os.environ.get('LOCAL_RANK', 0)) % torch.cuda.device_count())
+    else:
+        device = torch.device('cpu')
+    log(f'\n🖥️  Device: {device}')
+    if world_size > 1:
+        log(f'  Distributed: {world_size} processes (gloo), {torch.get_num_threads()} threads each')
+    if torch.cuda.is_available():
+        log(f'  GPU: {torch.cuda.get_device_name(0)}')
+        log(f'  CUDA Version: {torch.version.cuda}')
     
     # Load data
     train_loader, val_loader, test_loader, class_weights = load_data(CONFIG['data_root'])
     
-    # Create model
-    model = create_model(device)
+    # Create model (rank 0 first: it downloads the pretrained weights)
+    with main_process_first():
+        model = create_model(device)
+    augment = BatchAugment().to(device) if CONFIG['batch_augment'] else None
+    
+    # Optionally train the unfrozen tail on cached trunk activations
+    train_model = model
+    if CONFIG['feature_cache']:
+        # Each CV fold trains on different patients, so it needs its own cache
+        feature_cache_name = 'features-anti' if CONFIG['fold'] is None else f'features-anti-fold{CONFIG["fold"]}'
+        with main_process_first():
+            train_model, train_loader, val_loader = cached_loaders(
+                model, train_loader, val_loader, os.path.join(CONFIG['cache_dir'], feature_cache_name),
+                CONFIG['feature_cache_views'], device, augment
+            )
+        augment = None  # Already applied to the cached views
+    
+    # Mixed precision / channels_last / torch.compile (keep `model` for state_dict)
+    perf = PerformanceMode(device, amp=CONFIG['amp'], channels_last=CONFIG['channels_last'],
+                           compile=CONFIG['compile'])
+    log(f'\n⚡ Performance mode: {perf}')
+    train_model = perf.prepare(train_model)
+    
+    # DDP averages gradients across ranks (and starts every rank from rank 0's weights);
+    # evaluation runs on the plain module with gathered metrics
+    ddp_model = DistributedDataParallel(train_model) if world_size > 1 else train_model
     
     # Focal Loss with label smoothing
     criterion = FocalLoss(
@@ -422,25 +506,41 @@ def main():
         eta_min=1e-6
     )
     
-    # Early stopping
+    # Early stopping (best weights are written to checkpoint_dir)
+    checkpointer = Checkpointer(CONFIG['checkpoint_dir'], CONFIG['checkpoint_every'], resume,
+                                enabled=is_main())
     early_stopping = EarlyStoppingAUC(
         patience=CONFIG['patience'],
-        min_delta=CONFIG['min_delta']
+        min_delta=CONFIG['min_delta'],
+        checkpointer=checkpointer
     )
     
+    history = {'train_loss': [], 'train_acc': [], 'train_auc': [],
+               'val_loss': [], 'val_acc': [], 'val_auc': []}
+    epoch = 0
+    if resume:
+        epoch, history = checkpointer.resume(model, optimizer, scheduler, perf, early_stopping)
+    
     # Training loop
-    print(f'\n🚀 Starting training for {CONFIG["epochs"]} epochs...\n')
+    log(f'\n🚀 Starting training for {CONFIG["epochs"]} epochs...\n')
     
-    best_val_auc = 0
-    for epoch in range(1, CONFIG['epochs'] + 1):
-        # Train
-        train_loss, train_acc, train_f1, train_auc = train_one_epoch(
-            model, train_loader, optimizer, criterion, device
-        )
+    for epoch in range(epoch + 1, CONFIG['epochs'] + 1):
+        if early_stopping.early_stop:
+            break
         
-        # Validate
+        # Train (images/sec counts all ranks)
+        if hasattr(train_loader.sampler, 'set_epoch'):
+            train_loader.sampler.set_epoch(epoch)
+        timer = EpochTimer(device, len(train_loader.sampler) * world_size)
+        with timer:
+            train_loss, train_acc, train_f1, train_auc = train_one_epoch(
+                ddp_model, train_loader, optimizer, criterion, device, augment, perf
+            )
+        
+        # Validate (with rank 0's BatchNorm statistics on every rank)
+        sync_buffers(train_model)
         val_loss, val_acc, val_f1, val_auc = evaluate(
-            model, val_loader, criterion, device
+            train_model, val_loader, criterion, device, perf, CONFIG['streaming_metrics']
         )
         
         # Update LR
@@ -448,51 +548,68 @@ def main():
         current_lr = optimizer.param_groups[0]['lr']
         
         # Print progress
-        print(f'Epoch {epoch:2d}/{CONFIG["epochs"]} | '
-              f'Train Loss: {train_loss:.4f} | Train Acc: {train_acc:.4f} | Train AUC: {train_auc:.4f} | '
-              f'Val Loss: {val_loss:.4f} | Val Acc: {val_acc:.4f} | Val AUC: {val_auc:.4f} | '
-              f'LR: {current_lr:.2e}')
+        log(f'Epoch {epoch:2d}/{CONFIG["epochs"]} | '
+            f'Train Loss: {train_loss:.4f} | Train Acc: {train_acc:.4f} | Train AUC: {train_auc:.4f} | '
+            f'Val Loss: {val_loss:.4f} | Val Acc: {val_acc:.4f} | Val AUC: {val_auc:.4f} | '
+            f'LR: {current_lr:.2e}')
+        log(f'           ⏱  {timer}')
         
-        # Track best
-        if val_auc > best_val_auc:
-            best_val_auc = val_auc
+        for key, value in [('train_loss', train_loss), ('train_acc', train_acc), ('train_auc', train_auc),
+                           ('val_loss', val_loss), ('val_acc', val_acc), ('val_auc', val_auc)]:
+            history[key].append(value)
         
         # Early stopping check
         early_stopping(val_auc, model)
+        if checkpointer.due(epoch, last=early_stopping.early_stop or epoch == CONFIG['epochs']):
+            checkpointer.save(epoch, model, optimizer, scheduler, perf, early_stopping, history)
         if early_stopping.early_stop:
-            print(f'\n✓ Early stopping triggered at epoch {epoch}')
+            log(f'\n✓ Early stopping triggered at epoch {epoch}')
             break
     
     # Load best model
-    early_stopping.load_best_model(model)
-    print(f'\n✓ Training complete! Best Val AUC: {early_stopping.best_auc:.4f}')
+    checkpointer.wait()
+    if is_main():  # best.pt is written by rank 0, possibly to a node-local disk
+        early_stopping.load_best_model(model)
+    sync_model(model)
+    log(f'\n✓ Training complete! Best Val AUC: {early_stopping.best_auc:.4f}')
+    
+    # Reduced precision must not cost accuracy: compare with fp32 inference
+    if perf.amp:
+        fp32_auc = evaluate(train_model, val_loader, criterion, device)[3]
+        amp_auc = evaluate(train_model, val_loader, criterion, device, perf)[3]
+        gap = abs(fp32_auc - amp_auc)
+        log(f'  AMP parity: val AUC fp32 {fp32_auc:.4f} vs {str(perf.dtype)[6:]} {amp_auc:.4f} (Δ {gap:.4f})')
+        if gap > CONFIG['amp_auc_tolerance']:
+            log(f'  ⚠ AUC gap above {CONFIG["amp_auc_tolerance"]}; consider amp=False')
+    
+    # Rank 0 alone evaluates on the test set and saves
+    cleanup()
+    if rank != 0:
+        return
     
     # Final test evaluation
-    print('\n' + '=' * 60)
-    print('FINAL TEST SET EVALUATION')
-    print('=' * 60)
+    log('\n' + '=' * 60)
+    log('FINAL TEST SET EVALUATION')
+    log('=' * 60)
     
     test_loss, test_acc, test_f1, test_auc = evaluate(
         model, test_loader, criterion, device
     )
     
-    print(f'\n📊 Test Results:')
-    print(f'  Accuracy:  {test_acc:.4f} ({test_acc * 100:.2f}%)')
-    print(f'  F1 Score:  {test_f1:.4f}')
-    print(f'  AUC-ROC:   {test_auc:.4f}')
+    log(f'\n📊 Test Results:')
+    log(f'  Accuracy:  {test_acc:.4f} ({test_acc * 100:.2f}%)')
+    log(f'  F1 Score:  {test_f1:.4f}')
+    log(f'  AUC-ROC:   {test_auc:.4f}')
     
     # Detailed classification report
     model.eval()
-    all_preds, all_labels = [], []
+    metrics = EpochMetrics(len(test_loader.sampler), device)
     with torch.no_grad():
         for images, labels in test_loader:
-            images = images.to(device)
-            outputs = model(images)
-            _, preds = torch.max(outputs, 1)
-            all_preds.extend(preds.cpu().numpy())
-            all_labels.extend(labels.cpu().numpy())
+            metrics.update(model(images.to(device)), labels.to(device))
+    all_labels, all_preds, _ = metrics.arrays()
     
-    print('\n' + classification_report(
+    log('\n' + classification_report(
         all_labels, all_preds,
         target_names=['Benign', 'Malignant'],
         digits=4
@@ -500,18 +617,18 @@ def main():
     
     # Confusion matrix
     cm = confusion_matrix(all_labels, all_preds)
-    print('Confusion Matrix:')
-    print(f'         Predicted')
-    print(f'           B    M')
-    print(f'Actual B {cm[0, 0]:4d} {cm[0, 1]:4d}')
-    print(f'       M {cm[1, 0]:4d} {cm[1, 1]:4d}')
+    log('Confusion Matrix:')
+    log(f'         Predicted')
+    log(f'           B    M')
+    log(f'Actual B {cm[0, 0]:4d} {cm[0, 1]:4d}')
+    log(f'       M {cm[1, 0]:4d} {cm[1, 1]:4d}')
     
     # Calculate specificity/sensitivity
     tn, fp, fn, tp = cm.ravel()
     sensitivity = tp / (tp + fn)
     specificity = tn / (tn + fp)
-    print(f'\nSensitivity (Recall): {sensitivity:.4f}')
-    print(f'Specificity:          {specificity:.4f}')
+    log(f'\nSensitivity (Recall): {sensitivity:.4f}')
+    log(f'Specificity:          {specificity:.4f}')
     
     # Save model
     os.makedirs(CONFIG['save_dir'], exist_ok=True)
@@ -524,11 +641,32 @@ def main():
         'test_auc': test_auc,
         'test_f1': test_f1,
         'epoch': epoch,
-        'best_val_auc': early_stopping.best_auc
+        'best_val_auc': early_stopping.best_auc,
+        'history': history
     }, save_path)
     
-    print(f'\n✅ Model saved to: {save_path}')
-    print('=' * 60)
+    log(f'\n✅ Model saved to: {save_path}')
+    log('=' * 60)
+    
+    return {
+        'fold': CONFIG['fold'],
+        'epochs': epoch,
+        'best_val_auc': early_stopping.best_auc,
+        'test_auc': test_auc,
+        'test_acc': test_acc,
+        'test_f1': test_f1,
+        'sensitivity': sensitivity,
+        'specificity': specificity,
+    }
 
 if __name__ == '__main__':
-    main()
+    parser = argparse.ArgumentParser(description='PathoVision Anti-Overfitting Training')
+    parser.add_argument('--resume', action='store_true',
+                        help=f'continue from the last checkpoint in {CONFIG["checkpoint_dir"]}')
+    parser.add_argument('--nproc', type=int, default=1,
+                        help='data-parallel training processes on this machine (DDP, gloo backend)')
+    args = parser.parse_args()
+    if args.nproc > 1:
+        spawn(main, args.nproc, args.resume)
+    else:
+        main(args.resume)
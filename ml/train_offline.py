@@ -4,6 +4,7 @@ PathoVision BreakHis Training Script - Offline Compatible Version
 Robust training pipeline with fallback mechanisms for network issues
 """
 
+import argparse
 import os
 import random
 import numpy as np
@@ -21,11 +22,13 @@ from torch.utils.data import Dataset, DataLoader
 import torchvision.transforms as T
 import torchvision.models as models
 
-from sklearn.model_selection import train_test_split
-from sklearn.metrics import (
-    accuracy_score, precision_score, recall_score, f1_score,
-    confusion_matrix, roc_curve, auc, classification_report
-)
+from sklearn.metrics import confusion_matrix, classification_report
+
+from breakhis_data import ShardDataset, build_manifest, build_shards, build_split_manifest
+from checkpoint import Checkpointer
+from feature_cache import cached_loaders
+from metrics import EpochMetrics, StreamingMetrics
+from performance import EpochTimer, PerformanceMode
 
 # ============================================================================
 # CONFIGURATION
@@ -43,6 +46,22 @@ CONFIG = {
     'label_smoothing': 0.1,
     'early_stopping_patience': 8,
     'early_stopping_min_delta': 0.002,
+    'test_size': 0.2,                     # Fraction of patients held out for testing
+    'val_size': 0.25,                     # Fraction of the remaining patients for validation
+    'cv_folds': 5,                        # Patient-grouped CV folds recorded in the split manifest
+    'cache_dir': 'cache',                 # Writable dir for the image manifest
+    'num_workers': os.cpu_count(),        # Validation processes
+    'full_decode_validation': False,      # True: decode every pixel instead of verifying checksums
+    'use_shards': True,                   # Train from pre-resized memory-mapped shards in cache_dir
+    'feature_cache': False,               # Cache frozen-trunk activations, train only the unfrozen tail
+    'feature_cache_views': 4,             # Augmented views cached per training image
+    'amp': 'auto',                        # fp16 + GradScaler on CUDA, bf16 autocast on AVX512-BF16/AMX CPUs only
+    'channels_last': True,                # NHWC memory format for weights and inputs
+    'compile': False,                     # torch.compile the training model
+    'amp_auc_tolerance': 0.005,           # Max val AUC gap between AMP and fp32 inference
+    'streaming_metrics': False,           # Constant-memory validation metrics (histogram AUC)
+    'checkpoint_dir': 'checkpoints/offline',  # Resumable training state and best weights
+    'checkpoint_every': 1,                # Epochs between full-state checkpoints
     'device': 'cuda' if torch.cuda.is_available() else 'cpu'
 }
 
@@ -84,28 +103,18 @@ def load_dataset(data_root, config):
     if len(benign_paths) == 0 or len(malignant_paths) == 0:
         raise ValueError(f'No images found. Check dataset structure.')
     
-    # Create dataframe
     all_paths = benign_paths + malignant_paths
     all_labels = [0] * len(benign_paths) + [1] * len(malignant_paths)
-    df = pd.DataFrame({'path': all_paths, 'label': all_labels})
     
-    # Validate images
+    # Validate images (parallel; unchanged files come from the manifest)
     print('\nValidating image integrity...')
-    valid_indices = []
-    corrupted_count = 0
-    
-    for idx, row in tqdm(df.iterrows(), total=len(df), desc='Validating'):
-        try:
-            img = Image.open(row['path']).convert('RGB')
-            img_array = np.array(img)
-            if img_array.shape == (img_array.shape[0], img_array.shape[1], 3) and img_array.size > 0:
-                valid_indices.append(idx)
-            else:
-                corrupted_count += 1
-        except Exception as e:
-            corrupted_count += 1
+    manifest = build_manifest(all_paths, all_labels,
+                              os.path.join(config['cache_dir'], 'breakhis_manifest.json'),
+                              workers=config['num_workers'],
+                              full_decode=config['full_decode_validation'])
+    df = manifest[manifest['valid']].reset_index(drop=True)
+    corrupted_count = len(manifest) - len(df)
     
-    df = df.loc[valid_indices].reset_index(drop=True)
     print(f'\n✓ Valid images: {len(df)} (removed {corrupted_count} corrupted)')
     print(f'Class distribution:')
     print(df['label'].value_counts().sort_index())
@@ -122,15 +131,20 @@ def create_dataloaders(df, config):
     print('PREPARING DATASETS')
     print('='*60)
     
-    # Split data
-    train_df, temp_df = train_test_split(
-        df, test_size=0.30, random_state=config['seed'], stratify=df['label']
-    )
-    val_df, test_df = train_test_split(
-        temp_df, test_size=0.50, random_state=config['seed'], stratify=temp_df['label']
-    )
+    # One-time conversion to pre-resized shards (reused while the images are unchanged)
+    if config['use_shards']:
+        index_path = build_shards(df, os.path.join(config['cache_dir'], f'shards-{config["img_size"]}'),
+                                  config['img_size'], workers=config['num_workers'])
+        df = df[df['path'].isin([path for path, _ in ShardDataset(index_path).samples])]
+    
+    # Patient-level split, shared with train_anti_overfitting.py (no patient in two splits)
+    splits = build_split_manifest(df, os.path.join(config['cache_dir'], 'breakhis_splits.json'),
+                                  config['test_size'], config['val_size'], config['cv_folds'], config['seed'])
+    split = df['path'].map(splits.set_index('path')['split'])
+    train_df, val_df, test_df = df[split == 'train'], df[split == 'val'], df[split == 'test']
     
-    print(f'Train: {len(train_df)} | Val: {len(val_df)} | Test: {len(test_df)}')
+    print(f'Train: {len(train_df)} | Val: {len(val_df)} | Test: {len(test_df)} '
+          f'({df["patient_id"].nunique()} patients)')
     
     # Augmentation transforms
     train_tfms = T.Compose([
@@ -151,6 +165,15 @@ def create_dataloaders(df, config):
         T.Normalize(mean=[0.485, 0.456, 0.406], std=[0.229, 0.224, 0.225])
     ])
     
+    # Same augmentation for uint8 tensors read from the shards (already resized);
+    # per image, PIL ops are faster than tensor ops on the CPU
+    train_shard_tfms = T.Compose([T.ToPILImage()] + train_tfms.transforms[1:])
+    
+    val_shard_tfms = T.Compose([
+        T.ConvertImageDtype(torch.float),
+        T.Normalize(mean=[0.485, 0.456, 0.406], std=[0.229, 0.224, 0.225])
+    ])
+    
     # Dataset class
     class BreakHisDataset(Dataset):
         def __init__(self, df, transforms=None):
@@ -169,9 +192,14 @@ def create_dataloaders(df, config):
             return img, label
     
     # Datasets
-    train_ds = BreakHisDataset(train_df, transforms=train_tfms)
-    val_ds = BreakHisDataset(val_df, transforms=val_tfms)
-    test_ds = BreakHisDataset(test_df, transforms=val_tfms)
+    if config['use_shards']:
+        train_ds = ShardDataset(index_path, list(train_df['path']), transform=train_shard_tfms)
+        val_ds = ShardDataset(index_path, list(val_df['path']), transform=val_shard_tfms)
+        test_ds = ShardDataset(index_path, list(test_df['path']), transform=val_shard_tfms)
+    else:
+        train_ds = BreakHisDataset(train_df, transforms=train_tfms)
+        val_ds = BreakHisDataset(val_df, transforms=val_tfms)
+        test_ds = BreakHisDataset(test_df, transforms=val_tfms)
     
     # Class-balanced sampling
     class_counts = train_df['label'].value_counts().sort_index().values
@@ -266,111 +294,113 @@ def build_model(config, class_weights):
 # ============================================================================
 
 class EarlyStoppingAUC:
-    def __init__(self, patience=8, min_delta=0.002):
+    def __init__(self, patience=8, min_delta=0.002, checkpointer=None):
         self.patience = patience
         self.min_delta = min_delta
         self.counter = 0
         self.best_auc = 0
         self.early_stop = False
+        self.checkpointer = checkpointer  # Best weights go to checkpointer.best_path, not RAM
         self.best_model_state = None
     
     def __call__(self, val_auc, model):
         if val_auc > self.best_auc + self.min_delta:
             self.best_auc = val_auc
             self.counter = 0
-            self.best_model_state = {k: v.cpu().clone() for k, v in model.state_dict().items()}
+            if self.checkpointer is not None:
+                self.checkpointer.save_best(model)
+            else:
+                self.best_model_state = {k: v.cpu().clone() for k, v in model.state_dict().items()}
         else:
             self.counter += 1
             if self.counter >= self.patience:
                 self.early_stop = True
     
+    def state_dict(self):
+        return {'counter': self.counter, 'best_auc': self.best_auc, 'early_stop': self.early_stop}
+    
+    def load_state_dict(self, state):
+        self.counter, self.best_auc, self.early_stop = state['counter'], state['best_auc'], state['early_stop']
+    
     def load_best_model(self, model):
-        if self.best_model_state is not None:
+        if self.checkpointer is not None and self.best_auc > 0:
+            self.checkpointer.load_best(model)
+        elif self.best_model_state is not None:
             model.load_state_dict(self.best_model_state)
 
-def train_one_epoch(model, loader, optimizer, criterion, scheduler, device):
+def train_one_epoch(model, loader, optimizer, criterion, scheduler, device, perf=None):
+    perf = perf or PerformanceMode(device)
     model.train()
-    running_loss, correct, total = 0.0, 0, 0
-    all_preds, all_labels = [], []
+    metrics = EpochMetrics(len(loader.sampler), device)
     
     for images, labels in tqdm(loader, desc='Training', leave=False):
-        images, labels = images.to(device), labels.to(device)
+        images = perf.inputs(images.to(device, non_blocking=True))
+        labels = labels.to(device, non_blocking=True)
         
-        optimizer.zero_grad()
-        outputs = model(images)
-        loss = criterion(outputs, labels)
-        
-        torch.nn.utils.clip_grad_norm_(model.parameters(), max_norm=1.0)
-        loss.backward()
-        optimizer.step()
-        
-        running_loss += loss.item() * images.size(0)
-        _, preds = torch.max(outputs, 1)
-        correct += (preds == labels).sum().item()
-        total += labels.size(0)
+        optimizer.zero_grad(set_to_none=True)
+        with perf.autocast():
+            outputs = model(images)
+            loss = criterion(outputs, labels)
         
-        all_preds.extend(preds.cpu().numpy())
-        all_labels.extend(labels.cpu().numpy())
+        # Clip after backward (and after unscaling under fp16), then step
+        perf.backward_step(loss, optimizer, model.parameters(), max_norm=1.0)
+        metrics.update(outputs, labels, loss)
     
     if scheduler is not None:
         scheduler.step()
     
-    epoch_loss = running_loss / total
-    epoch_acc = correct / total
-    epoch_f1 = f1_score(all_labels, all_preds, zero_division=0)
-    
-    return epoch_loss, epoch_acc, epoch_f1
+    m = metrics.compute()
+    return m['loss'], m['acc'], m['f1']
 
-def evaluate(model, loader, criterion, device):
+def evaluate(model, loader, criterion, device, perf=None, streaming=False):
+    perf = perf or PerformanceMode(device)
     model.eval()
-    running_loss, correct, total = 0.0, 0, 0
-    all_preds, all_probs = [], []
-    all_labels = []
+    metrics = StreamingMetrics(device) if streaming else EpochMetrics(len(loader.sampler), device)
     
     with torch.no_grad():
         for images, labels in tqdm(loader, desc='Evaluating', leave=False):
-            images, labels = images.to(device), labels.to(device)
-            outputs = model(images)
-            loss = criterion(outputs, labels)
-            
-            running_loss += loss.item() * images.size(0)
-            probs = torch.softmax(outputs, dim=1)
-            preds = torch.argmax(probs, dim=1)
-            
-            correct += (preds == labels).sum().item()
-            total += labels.size(0)
-            
-            all_preds.extend(preds.cpu().numpy())
-            all_probs.extend(probs[:, 1].cpu().numpy())
-            all_labels.extend(labels.cpu().numpy())
-    
-    epoch_loss = running_loss / total
-    epoch_acc = correct / total
-    epoch_f1 = f1_score(all_labels, all_preds, zero_division=0)
-    epoch_auc = auc(*roc_curve(all_labels, all_probs)[:2])
-    
-    return epoch_loss, epoch_acc, epoch_f1, epoch_auc
+            images = perf.inputs(images.to(device, non_blocking=True))
+            labels = labels.to(device, non_blocking=True)
+            with perf.autocast():
+                outputs = model(images)
+                loss = criterion(outputs, labels)
+            metrics.update(outputs, labels, loss)
+    
+    m = metrics.compute()
+    return m['loss'], m['acc'], m['f1'], m['auc']
 
 # ============================================================================
 # MAIN TRAINING LOOP
 # ============================================================================
 
-def train(model, train_loader, val_loader, optimizer, criterion, scheduler, config, device):
-    """Main training loop"""
+def train(model, train_loader, val_loader, optimizer, criterion, scheduler, config, device, perf=None,
+          resume=False):
+    """Main training loop (resume=True continues from config['checkpoint_dir'])"""
     print('\n' + '='*60)
     print('TRAINING')
     print('='*60)
     
+    perf = perf or PerformanceMode(device)
+    checkpointer = Checkpointer(config['checkpoint_dir'], config['checkpoint_every'], resume)
     early_stopping = EarlyStoppingAUC(patience=config['early_stopping_patience'],
-                                     min_delta=config['early_stopping_min_delta'])
+                                     min_delta=config['early_stopping_min_delta'],
+                                     checkpointer=checkpointer)
     
     history = {'train_loss': [], 'val_loss': [], 'train_acc': [], 'val_acc': [],
                'train_f1': [], 'val_f1': [], 'val_auc': []}
+    start_epoch = 0
+    if resume:
+        start_epoch, history = checkpointer.resume(model, optimizer, scheduler, perf, early_stopping)
     
-    for epoch in range(config['epochs']):
-        train_loss, train_acc, train_f1 = train_one_epoch(model, train_loader, optimizer, 
-                                                         criterion, scheduler, device)
-        val_loss, val_acc, val_f1, val_auc = evaluate(model, val_loader, criterion, device)
+    for epoch in range(start_epoch, config['epochs']):
+        if early_stopping.early_stop:
+            break
+        timer = EpochTimer(device, len(train_loader.dataset))
+        with timer:
+            train_loss, train_acc, train_f1 = train_one_epoch(model, train_loader, optimizer, 
+                                                             criterion, scheduler, device, perf)
+        val_loss, val_acc, val_f1, val_auc = evaluate(model, val_loader, criterion, device, perf,
+                                                      config['streaming_metrics'])
         
         history['train_loss'].append(train_loss)
         history['val_loss'].append(val_loss)
@@ -383,13 +413,17 @@ def train(model, train_loader, val_loader, optimizer, criterion, scheduler, conf
         print(f'Epoch {epoch+1:2d}/{config["epochs"]} | '
               f'Train Loss: {train_loss:.4f} | Val Loss: {val_loss:.4f} | '
               f'Val Acc: {val_acc:.4f} | Val AUC: {val_auc:.4f}')
+        print(f'         ⏱  {timer}')
         
         early_stopping(val_auc, model)
+        if checkpointer.due(epoch + 1, last=early_stopping.early_stop or epoch + 1 == config['epochs']):
+            checkpointer.save(epoch + 1, model, optimizer, scheduler, perf, early_stopping, history)
         if early_stopping.early_stop:
             print(f'✓ Early stopping at epoch {epoch+1}')
-            early_stopping.load_best_model(model)
-            break
     
+    if early_stopping.early_stop:
+        early_stopping.load_best_model(model)
+    checkpointer.wait()
     return model, history
 
 # ============================================================================
@@ -403,37 +437,15 @@ def evaluate_on_test(model, test_loader, device):
     print('='*60)
     
     model.eval()
-    all_labels = []
-    all_preds = []
-    all_probs = []
+    metrics = EpochMetrics(len(test_loader.sampler), device)
     
     with torch.no_grad():
         for images, labels in tqdm(test_loader, desc='Testing'):
-            images = images.to(device)
-            outputs = model(images)
-            probs = torch.softmax(outputs, dim=1)
-            preds = torch.argmax(probs, dim=1)
-            
-            all_labels.extend(labels.numpy())
-            all_preds.extend(preds.cpu().numpy())
-            all_probs.extend(probs[:, 1].cpu().numpy())
-    
-    all_labels = np.array(all_labels)
-    all_preds = np.array(all_preds)
-    all_probs = np.array(all_probs)
-    
-    acc = accuracy_score(all_labels, all_preds)
-    prec = precision_score(all_labels, all_preds, zero_division=0)
-    rec = recall_score(all_labels, all_preds, zero_division=0)
-    f1 = f1_score(all_labels, all_preds, zero_division=0)
-    fpr, tpr, _ = roc_curve(all_labels, all_probs)
-    roc_auc = auc(fpr, tpr)
-    
-    tn = ((all_preds == 0) & (all_labels == 0)).sum()
-    fp = ((all_preds == 1) & (all_labels == 0)).sum()
-    fn = ((all_preds == 0) & (all_labels == 1)).sum()
-    tp = ((all_preds == 1) & (all_labels == 1)).sum()
-    specificity = tn / (tn + fp) if (tn + fp) > 0 else 0
+            metrics.update(model(images.to(device)), labels.to(device))
+    
+    m = metrics.compute()
+    acc, prec, rec, f1 = m['acc'], m['precision'], m['recall'], m['f1']
+    specificity, roc_auc = m['specificity'], m['auc']
     
     print(f'\nAccuracy:   {acc:.4f}')
     print(f'Precision:  {prec:.4f}')
@@ -469,6 +481,11 @@ def save_model(model, config, metrics):
 # ============================================================================
 
 if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description='PathoVision BreakHis Training - Offline Compatible Version')
+    parser.add_argument('--resume', action='store_true',
+                        help=f'continue from the last checkpoint in {CONFIG["checkpoint_dir"]}')
+    args = parser.parse_args()
+    
     print('PathoVision BreakHis Training - Offline Compatible Version')
     print('='*60)
     
@@ -487,9 +504,31 @@ if __name__ == '__main__':
     # Build model
     model, criterion, optimizer, scheduler, device = build_model(CONFIG, class_weights)
     
-    # Train
-    model, history = train(model, train_loader, val_loader, optimizer, criterion, 
-                          scheduler, CONFIG, device)
+    # Optionally train the unfrozen tail on cached trunk activations
+    train_model = model
+    if CONFIG['feature_cache']:
+        train_model, train_loader, val_loader = cached_loaders(
+            model, train_loader, val_loader, os.path.join(CONFIG['cache_dir'], 'features-offline'),
+            CONFIG['feature_cache_views'], device)
+    
+    # Mixed precision / channels_last / torch.compile (keep `model` for state_dict)
+    perf = PerformanceMode(device, amp=CONFIG['amp'], channels_last=CONFIG['channels_last'],
+                           compile=CONFIG['compile'])
+    print(f'Performance mode: {perf}')
+    train_model = perf.prepare(train_model)
+    
+    # Train (train_model shares its weights with model)
+    _, history = train(train_model, train_loader, val_loader, optimizer, criterion, 
+                       scheduler, CONFIG, device, perf, args.resume)
+    
+    # Reduced precision must not cost accuracy: compare with fp32 inference
+    if perf.amp:
+        fp32_auc = evaluate(train_model, val_loader, criterion, device)[3]
+        amp_auc = evaluate(train_model, val_loader, criterion, device, perf)[3]
+        gap = abs(fp32_auc - amp_auc)
+        print(f'AMP parity: val AUC fp32 {fp32_auc:.4f} vs {str(perf.dtype)[6:]} {amp_auc:.4f} (Δ {gap:.4f})')
+        if gap > CONFIG['amp_auc_tolerance']:
+            print(f'⚠ AUC gap above {CONFIG["amp_auc_tolerance"]}; consider amp=False')
     
     # Evaluate
     metrics = evaluate_on_test(model, test_loader, device)
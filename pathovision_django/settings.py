@@ -4,17 +4,29 @@ Django settings for pathovision_django project.
 
 from pathlib import Path
 import os
+from django.core.exceptions import ImproperlyConfigured
 from dotenv import load_dotenv
 
 load_dotenv()
 
 BASE_DIR = Path(__file__).resolve().parent.parent
 
-SECRET_KEY = 'django-insecure-pathovision-backend-key-2024'
+# Settings profile: 'development' (default) or 'production'. Production turns
+# DEBUG off (no per-query logging in memory), drops the query-count header,
+# keeps database connections open between requests and requires
+# DJANGO_SECRET_KEY.
+PROFILE = os.getenv('DJANGO_PROFILE', 'development')
+if PROFILE not in ('development', 'production'):
+    raise ImproperlyConfigured(f"DJANGO_PROFILE must be 'development' or 'production', not {PROFILE!r}")
+PRODUCTION = PROFILE == 'production'
 
-DEBUG = True
+SECRET_KEY = os.getenv('DJANGO_SECRET_KEY', '' if PRODUCTION else 'django-insecure-pathovision-backend-key-2024')
+if not SECRET_KEY:
+    raise ImproperlyConfigured('DJANGO_SECRET_KEY is required in the production profile')
 
-ALLOWED_HOSTS = ['*']
+DEBUG = os.getenv('DJANGO_DEBUG', '0' if PRODUCTION else '1') == '1'
+
+ALLOWED_HOSTS = os.getenv('DJANGO_ALLOWED_HOSTS', '*').split(',')
 
 # Disable automatic slash appending for mobile app compatibility
 APPEND_SLASH = False
@@ -28,10 +40,12 @@ INSTALLED_APPS = [
     'django.contrib.staticfiles',
     'rest_framework',
     'rest_framework_simplejwt',
+    'channels',
     'api',
 ]
 
 MIDDLEWARE = [
+    'api.middleware.ProfilingMiddleware',
     'django.middleware.security.SecurityMiddleware',
     'django.contrib.sessions.middleware.SessionMiddleware',
     'django.middleware.common.CommonMiddleware',
@@ -40,6 +54,9 @@ MIDDLEWARE = [
     'django.contrib.messages.middleware.MessageMiddleware',
     'django.middleware.clickjacking.XFrameOptionsMiddleware',
 ]
+if not PRODUCTION:
+    # X-DB-Queries response header; wraps every connection, so development only
+    MIDDLEWARE.append('api.middleware.QueryCountMiddleware')
 
 ROOT_URLCONF = 'pathovision_django.urls'
 
@@ -60,19 +77,64 @@ TEMPLATES = [
 ]
 
 WSGI_APPLICATION = 'pathovision_django.wsgi.application'
+ASGI_APPLICATION = 'pathovision_django.asgi.application'
+
+# WebSocket push (api/consumers.py). The in-memory layer only fans out within
+# one process; switch to channels_redis when running several ASGI workers.
+CHANNEL_LAYERS = {
+    'default': {
+        'BACKEND': 'channels.layers.InMemoryChannelLayer',
+    }
+}
+# Shared by all worker processes when Redis is available (needs channels_redis)
+REDIS_URL = os.getenv('REDIS_URL', '')
+if REDIS_URL:
+    CHANNEL_LAYERS['default'] = {
+        'BACKEND': 'channels_redis.core.RedisChannelLayer',
+        'CONFIG': {'hosts': [REDIS_URL]},
+    }
 
 # Database - PostgreSQL (same database as Node.js backend)
 DATABASES = {
     'default': {
         'ENGINE': 'django.db.backends.postgresql',
-        'NAME': 'pathovision',
-        'USER': 'postgres',
-        'PASSWORD': 'Hemanth@55',
-        'HOST': 'localhost',
-        'PORT': '5432',
+        'NAME': os.getenv('DB_NAME', 'pathovision'),
+        'USER': os.getenv('DB_USER', 'postgres'),
+        'PASSWORD': os.getenv('DB_PASSWORD', 'Hemanth@55'),
+        'HOST': os.getenv('DB_HOST', 'localhost'),
+        'PORT': os.getenv('DB_PORT', '5432'),
+        # Seconds a connection is reused across requests (0 = reconnect every
+        # request); health checks replace connections the server dropped
+        'CONN_MAX_AGE': int(os.getenv('DB_CONN_MAX_AGE', '600' if PRODUCTION else '0')),
+        'CONN_HEALTH_CHECKS': PRODUCTION,
+        # Behind PgBouncer in transaction pooling mode server-side cursors
+        # (QuerySet.iterator(), e.g. case export) do not survive; set DB_PGBOUNCER=1
+        'DISABLE_SERVER_SIDE_CURSORS': os.getenv('DB_PGBOUNCER', '0') == '1',
     }
 }
 
+# Cache - Redis when REDIS_URL is set (shared by all processes, so response
+# cache invalidation and login throttles hold across workers), otherwise local
+# memory per process
+if REDIS_URL:
+    CACHES = {
+        'default': {
+            'BACKEND': 'django.core.cache.backends.redis.RedisCache',
+            'LOCATION': REDIS_URL,
+            'KEY_PREFIX': 'pathovision',
+        }
+    }
+else:
+    CACHES = {
+        'default': {
+            'BACKEND': 'django.core.cache.backends.locmem.LocMemCache',
+            'LOCATION': 'pathovision',
+        }
+    }
+
+# Seconds a cached profile / case detail response may live (see api/cache.py)
+RESPONSE_CACHE_TIMEOUT = int(os.getenv('RESPONSE_CACHE_TIMEOUT', '300'))
+
 AUTH_PASSWORD_VALIDATORS = [
     {
         'NAME': 'django.contrib.auth.password_validation.UserAttributeSimilarityValidator',
@@ -104,7 +166,7 @@ DEFAULT_AUTO_FIELD = 'django.db.models.BigAutoField'
 # REST Framework Configuration
 REST_FRAMEWORK = {
     'DEFAULT_AUTHENTICATION_CLASSES': [
-        'rest_framework_simplejwt.authentication.JWTAuthentication',
+        'api.authentication.StatelessJWTAuthentication',
     ],
     'DEFAULT_RENDERER_CLASSES': [
         'rest_framework.renderers.JSONRenderer',
@@ -113,6 +175,40 @@ REST_FRAMEWORK = {
     'PAGE_SIZE': 20,
 }
 
+# Login hardening (api/throttling.py, api/authentication.py)
+# Token buckets as (burst capacity, refill tokens per second)
+LOGIN_THROTTLE = {
+    'ip': (20, 20 / 60),
+    'account': (5, 5 / 60),
+}
+# Threads hashing passwords for logins, and how long a login waits for a slot
+LOGIN_HASH_WORKERS = int(os.getenv('LOGIN_HASH_WORKERS', str(max(1, (os.cpu_count() or 2) // 2))))
+LOGIN_HASH_QUEUE_TIMEOUT = float(os.getenv('LOGIN_HASH_QUEUE_TIMEOUT', '2'))
+
+# Seconds between incremental case rollup refreshes by
+# `manage.py refresh_case_rollups --loop` (analytics requests never refresh)
+ANALYTICS_REFRESH_INTERVAL = int(os.getenv('ANALYTICS_REFRESH_INTERVAL', '60'))
+
+# Image uploads (api/images.py): largest accepted image and threads that
+# generate the model-ready/thumbnail derivatives
+IMAGE_UPLOAD_MAX_SIZE = int(os.getenv('IMAGE_UPLOAD_MAX_SIZE', str(200 * 1024 * 1024)))
+IMAGE_WORKERS = int(os.getenv('IMAGE_WORKERS', '2'))
+
+# Request profiling (api/profiling.py), off unless PROFILING_ENABLED=1.
+# Traces of a SAMPLE_RATE share of requests stay in a per-process ring buffer
+# of BUFFER_SIZE, browsable by admins at /api/profiling; with PROFILE_SLOWEST
+# > 0 every sampled request runs under PROFILER ('cprofile' or 'pyinstrument')
+# and the output of the slowest N is kept.
+PROFILING = {
+    'ENABLED': os.getenv('PROFILING_ENABLED', '0') == '1',
+    'SAMPLE_RATE': float(os.getenv('PROFILING_SAMPLE_RATE', '1.0')),
+    'BUFFER_SIZE': int(os.getenv('PROFILING_BUFFER_SIZE', '500')),
+    'PROFILE_SLOWEST': int(os.getenv('PROFILING_PROFILE_SLOWEST', '0')),
+    'PROFILER': os.getenv('PROFILING_PROFILER', 'cprofile'),
+    'MAX_REPORTED_QUERIES': 20,
+    'EXCLUDE_PATHS': ['/api/profiling', '/admin/'],
+}
+
 # JWT Configuration
 from datetime import timedelta
 
@@ -120,8 +216,14 @@ SIMPLE_JWT = {
     'ACCESS_TOKEN_LIFETIME': timedelta(days=7),
     'REFRESH_TOKEN_LIFETIME': timedelta(days=30),
     'ALGORITHM': 'HS256',
+    'TOKEN_OBTAIN_SERIALIZER': 'api.serializers.RoleTokenObtainPairSerializer',
 }
 
+# Seconds a full User row stays in the per-process cache behind
+# StatelessJWTAuthentication (api/authentication.py); also how long another
+# worker process may keep accepting a deactivated or demoted user
+JWT_USER_CACHE_TTL = int(os.getenv('JWT_USER_CACHE_TTL', '60'))
+
 # Gemini API
 GEMINI_API_KEY = os.getenv('GEMINI_API_KEY', '')
 GEMINI_MODEL = os.getenv('GEMINI_MODEL', 'gemini-2.0-flash')